@@ -3,6 +3,7 @@ from time import time
 
 import click
 
+from lin_kernighan.algorithms.structures.distance import distance_provider
 from lin_kernighan.algorithms.structures.matrix import adjacency_matrix
 from lin_kernighan.algorithms.utils.generator import generator
 from lin_kernighan.algorithms.utils.initial_tour import greedy
@@ -14,6 +15,11 @@ from lin_kernighan.utils import opts_type
 search_type = dict(lkh=LKHSearch, tabu=TabuSearch, tabu_p=TabuProcSearch)
 
 
+def weights(tsp, provider):
+    """ Матрица весов или расстояния на лету по координатам, если задана метрика provider """
+    return distance_provider(tsp, provider) if provider else adjacency_matrix(tsp)
+
+
 @click.group()
 def cli():
     pass
@@ -28,7 +34,8 @@ def cli():
 @click.option('--iterations', default=10, help='Iterations of search')
 @click.option('--swap', default=2, help='Swaps for tabu searchers')
 @click.option('--proc', default=4, help='Number of process in tabu_p')
-def searchers(search, size, number, info, opt, iterations, swap, proc):
+@click.option('--provider', default='', help='Distance provider instead of matrix: euclidean, euc_2d, geo, ...')
+def searchers(search, size, number, info, opt, iterations, swap, proc, provider):
     if info:
         logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO)
 
@@ -36,7 +43,7 @@ def searchers(search, size, number, info, opt, iterations, swap, proc):
     ft_start = time()
     for _ in range(number):
         tsp = generator(size)
-        matrix = adjacency_matrix(tsp)
+        matrix = weights(tsp, provider)
 
         t_start = time()
         searcher = search_type[search](matrix=matrix, opt=opt, proc=proc)
@@ -57,7 +64,8 @@ def searchers(search, size, number, info, opt, iterations, swap, proc):
 @click.option('--mul', default=1, help='Excess factor for LKH (factor * excess)')
 @click.option('--sb', default=False, help='Use or not subgradient optimization for LKH')
 @click.option('--ns', default=False, help='Use or not non seq for LKH')
-def opts(opt, size, number, info, neighbours, k, mul, sb, ns):
+@click.option('--provider', default='', help='Distance provider instead of matrix: euclidean, euc_2d, geo, ...')
+def opts(opt, size, number, info, neighbours, k, mul, sb, ns, provider):
     if info:
         logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO)
 
@@ -65,7 +73,7 @@ def opts(opt, size, number, info, neighbours, k, mul, sb, ns):
     ft_start = time()
     for _ in range(number):
         tsp = generator(size)
-        matrix = adjacency_matrix(tsp)
+        matrix = weights(tsp, provider)
         length, tour = greedy(matrix)
 
         t_start = time()
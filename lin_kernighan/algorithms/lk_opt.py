@@ -1,179 +1,176 @@
 import logging
 import warnings
-from typing import Tuple
 
 import numba as nb
 import numpy as np
 from numba.core.errors import NumbaDeprecationWarning, NumbaPendingDeprecationWarning
 
+from lin_kernighan.algorithms.structures.active_queue import ActiveQueue
+from lin_kernighan.algorithms.structures.move_stack import MoveStack
+from lin_kernighan.algorithms.structures.tabu_list import TabuStore
 from lin_kernighan.algorithms.utils.abc_opt import AbcOpt
-from lin_kernighan.algorithms.utils.double_bridge import double_bridge
-from lin_kernighan.algorithms.utils.hash import generate_hash
-from lin_kernighan.algorithms.utils.utils import swap, around, make_pair, between, check_dlb
+from lin_kernighan.algorithms.utils.candidates import neighbour_candidates
+from lin_kernighan.algorithms.utils.double_bridge import double_bridge_move, find_double_bridge
+from lin_kernighan.algorithms.utils.hash import update_bridge_hash
 
 warnings.simplefilter('ignore', category=NumbaDeprecationWarning)
 warnings.simplefilter('ignore', category=NumbaPendingDeprecationWarning)
 
 
-@nb.njit(cache=True)
-def __get_tour(tour: np.ndarray, it1: int, it2: int, it3: int, it4: int) -> tuple:
-    """ Выполняем k-opt для указанных города
-    tour: список городов
-    it1, it2, it3, it4: найденные города
-    return: it1, it4
-    """
-    if it2 < it4 < it3 and (it1 < it2 or it3 < it1):
-        swap(tour, it2, it4)  # ... it1 it2 ... it4 it3 ... && it2 ... it4 it3 ... it1
-        return it1, it2
-    elif it3 < it1 < it2 and (it4 < it3 or it2 < it4):
-        swap(tour, it3, it1)  # ... it4 it3 ... it1 it2 ... && it3 ... it1 it2 ... it4
-        return it3, it4
-    elif it4 < it2 < it1 and (it3 < it4 or it1 < it3):
-        swap(tour, it4, it2)  # ... it3 it4 ... it2 it1 ... && it4 ... it2 it1 ... it3
-        return it1, it2
-    elif it1 < it3 < it3 and (it2 < it1 or it4 < it2):
-        swap(tour, it1, it3)  # ... it2 it1 ... it3 it4 ... && it1 ... it3 it4 ... it2
-        return it3, it4
-    else:
-        assert False, 'bad tour'
-
-
-@nb.njit(cache=True)
-def __validation(size: int, it1: int, it2: int, it3: int, it4: int) -> bool:
-    """ Проверка на корректность тура
-    size: размер маршрута
-    it1, it2, it3, it4: индексы городов: t1, t2i, t2i+1, t2i+2
+@nb.njit
+def __validation(tour, t1: int, t2: int, t3: int, t4: int) -> bool:
+    """ Проверка на корректность тура: после замены ребер получится один цикл
+    tour: тур [ArrayTour, TreeTour]
+    t1, t2, t3, t4: города t1, t2i, t2i+1, t2i+2
     return: корректен или нет
     """
-    return between(size, it1, it3, it4) and between(size, it4, it2, it1)
+    if t3 == t1 or t4 == t2:
+        return False
+    if tour.next(t1) == t2:
+        return tour.prev(t3) == t4
+    return tour.next(t3) == t4
 
 
 @nb.njit
-def _improve(tour: np.ndarray, matrix: np.ndarray, neighbours: np.ndarray, dlb: np.ndarray,
-             it1: int, t1: int, solutions: set, k: int) -> Tuple[float, np.ndarray]:
+def _improve(tour, matrix: np.ndarray, neighbours: np.ndarray, t1: int, solutions: TabuStore,
+             k: int, stack: MoveStack) -> float:
     """ Последовательный 2-opt для эвристики Лина-Кернига
-    tour: список городов
+    tour: тур [ArrayTour, TreeTour], при улучшении меняется на месте
     matrix: матрица весов
     neighbours: набор кандидатов
-    dlb: don't look bits
-    it1, t1: индекс, значение города, с которого начинать
+    t1: город, с которого начинать
     solutions: полученные ранее туры
-    set_x, set_y: наборы удаленных, добавленных ребер
     k: k-opt, k - кол-во сколько можно сделать последовательных улучшений
-    return: выигрыш, новый тур
+    stack: стек хода, удаленные и добавленные ребра
+    return: выигрыш
     """
-    around_t1 = around(tour, it1)
-    for it2, t2 in around_t1:
-        set_x = {make_pair(t1, t2)}
+    around_t1 = (tour.next(t1), tour.prev(t1))
+    for t2 in around_t1:
+        stack.clear()
+        stack.remove(t1, t2)
 
         for t3 in neighbours[t2]:
-            gain = matrix[t1][t2] - matrix[t2][t3]
-            if t3 == around_t1[0][1] or t3 == around_t1[1][1] or not gain > 1.e-10:
+            if t3 == -1:
+                break
+            gain = np.float64(matrix[t1, t2]) - matrix[t2, t3]  # выигрыш копим в float64 при любом типе весов
+            if t3 == around_t1[0] or t3 == around_t1[1] or not gain > 1.e-10:
                 continue
-            set_y = {make_pair(t2, t3)}
-            it3 = np.where(tour == t3)[0][0]
-            _gain, _tour = __choose_t4(tour, matrix, it1, it2, it3, neighbours, gain, set_x, set_y, dlb, solutions, k)
+            stack.added_count = 0
+            stack.add(t2, t3)
+            _gain = __choose_t4(tour, matrix, t1, t2, t3, neighbours, gain, stack, solutions, k)
             if _gain > 1.e-10:
-                return _gain, _tour
+                return _gain
 
-    return 0., tour
+    return 0.
 
 
 @nb.njit
-def __choose_t4(tour: np.ndarray, matrix: np.ndarray, it1: int, it2: int, it3: int, neighbours: np.ndarray,
-                gain: float, set_x: set, set_y: set, dlb: np.ndarray, sol: set, k: int) -> Tuple[float, np.ndarray]:
+def __choose_t4(tour, matrix: np.ndarray, t1: int, t2: int, t3: int, neighbours: np.ndarray,
+                gain: float, stack: MoveStack, sol: TabuStore, k: int) -> float:
     """ Выбираем город t2i - город, который создаст ребро на удаление
-    tour: список городов
+    tour: тур [ArrayTour, TreeTour]
     matrix: матрица весов
-    it1, it2, it3: города t1, t2i, t2i+1, их индексы
+    t1, t2, t3: города t1, t2i, t2i+1
     neighbours: набор кандидатов
     gain: текущий выигрыш
-    set_x, set_y: наборы удаленных, добавленных ребер
-    dlb: don't look bits
+    stack: стек хода, удаленные и добавленные ребра
     sol: существующие решения
     k: k-opt, k - кол-во сколько можно сделать последовательных улучшений
-    return: выигрыш, новый тур
+    return: выигрыш, если он есть - тур остается измененным, иначе ход откатывается
     """
-    t1, t2, t3 = tour[it1], tour[it2], tour[it3]
-    around_t3 = around(tour, it3)
+    succ, pred = tour.next(t3), tour.prev(t3)
+    removed, added = stack.removed_count, stack.added_count
 
-    for it4, t4 in around_t3:
-        if len(set_y) == k - 1:  # выбираем длиннейшее ребро на последней итерации
-            if matrix[t3][around_t3[0][1]] < matrix[t3][around_t3[1][1]] and around_t3[0][1] == t4:
-                break
-            if matrix[t3][around_t3[0][1]] > matrix[t3][around_t3[1][1]] and around_t3[0][1] == t4:
-                break
+    for t4 in (succ, pred):
+        if added == k - 1:  # выбираем длиннейшее ребро на последней итерации
+            if matrix[t3, t4] < matrix[t3, pred if t4 == succ else succ]:
+                continue
 
-        t3t4 = make_pair(t3, t4)
-        if t3t4 in set_x or t3t4 in set_y:
+        if stack.is_removed(t3, t4) or stack.is_added(t3, t4):
             continue
-        if not __validation(len(tour), it1, it2, it3, it4):  # проверяем на корректность
+        if not __validation(tour, t1, t2, t3, t4):  # проверяем на корректность
             continue
 
-        _set_x = set_x.copy()
-        _set_y = set_y.copy()
-        _set_x.add(t3t4)
-        _set_y.add(make_pair(t1, t4))
+        stack.remove(t3, t4)
+        stack.add(t1, t4)
+        stack.apply(tour, t1, t2, t3, t4)  # единственное место, где меняется тур
 
-        _tour = tour.copy()
-        _it1, _it4 = __get_tour(_tour, it1, it2, it3, it4)  # единственное место, где меняется тур
-
-        if generate_hash(_tour) in sol:  # проверяем, был ли такой раньше
+        if sol.contains(stack.hash):  # проверяем, был ли такой раньше
+            stack.rollback(tour)
+            stack.removed_count, stack.added_count = removed, added
             continue
 
-        _gain = gain + (matrix[t3][t4] - matrix[t1][t4])
+        _gain = gain + matrix[t3, t4] - matrix[t1, t4]
         if _gain > 1.e-10:
-            if len(dlb) != 1:
-                dlb[t1] = dlb[t2] = dlb[t3] = dlb[t4] = False
-            return _gain, _tour
-        elif len(_set_x) <= k:
-            _gain, _tour = __choose_t5(_tour, matrix, _it1, _it4, neighbours, _gain, _set_x, _set_y, dlb, sol, k)
+            return _gain
+        elif stack.removed_count <= k:
+            _gain = __choose_t5(tour, matrix, t1, t4, neighbours, _gain, stack, sol, k)
             if _gain > 1.e-10:
-                if len(dlb) != 1:
-                    dlb[t1] = dlb[t2] = dlb[t3] = dlb[t4] = False
-                return _gain, _tour
+                return _gain
+            stack.rollback(tour)
+            stack.removed_count, stack.added_count = removed, added
         else:
+            stack.rollback(tour)
+            stack.removed_count, stack.added_count = removed, added
             break
 
-    return 0., tour
+    return 0.
 
 
 @nb.njit
-def __choose_t5(tour: np.ndarray, matrix: np.ndarray, it1: int, it4: int, neighbours: np.ndarray,
-                gain: float, set_x: set, set_y: set, dlb: np.ndarray, sol: set, k: int) -> Tuple[float, np.ndarray]:
+def __choose_t5(tour, matrix: np.ndarray, t1: int, t4: int, neighbours: np.ndarray,
+                gain: float, stack: MoveStack, sol: TabuStore, k: int) -> float:
     """ Выбираем город t2i+1 - город, который создаст ребро на добавление
-    tour: список городов
+    tour: тур [ArrayTour, TreeTour]
     matrix: матрица весов
-    it1, it4: города t1 и t2i, их индексы
+    t1, t4: города t1 и t2i
     neighbours: набор кандидатов
     gain: текущий выигрыш
-    set_x, set_y: наборы удаленных, добавленных ребер
-    dlb: don't look bits
+    stack: стек хода, удаленные и добавленные ребра
     sol: существующие решения
     k: k-opt, k - кол-во сколько можно сделать последовательных улучшений
-    return: выигрыш, новый тур
+    return: выигрыш
     """
-    t1, t4 = tour[it1], tour[it4]
-    around_t1 = around(tour, t1)
+    around_t1 = (tour.next(t1), tour.prev(t1))
+    added = stack.added_count
     for t5 in neighbours[t4]:
-        if t5 == around_t1[0][1] or t5 == around_t1[1][1]:
+        if t5 == -1:
+            break
+        if t5 == t1 or t5 == around_t1[0] or t5 == around_t1[1]:
             continue
 
-        t4t5 = make_pair(t4, t5)
-
-        _gain = gain + (matrix[t1][t4] - matrix[t4][t5])
-        if not _gain > 1.e-10 or t4t5 in set_x or t4t5 in set_y:
+        _gain = gain + matrix[t1, t4] - matrix[t4, t5]
+        if not _gain > 1.e-10 or stack.is_removed(t4, t5) or stack.is_added(t4, t5):
             continue
 
-        _set_y = set_y.copy()
-        _set_y.add(t4t5)
-
-        it5 = np.where(tour == t5)[0][0]
-        _gain, _tour = __choose_t4(tour, matrix, it1, it4, it5, neighbours, _gain, set_x, _set_y, dlb, sol, k)
+        stack.add(t4, t5)
+        _gain = __choose_t4(tour, matrix, t1, t4, t5, neighbours, _gain, stack, sol, k)
         if _gain > 1.e-10:
-            return _gain, _tour
+            return _gain
+        stack.added_count = added
 
-    return 0., tour
+    return 0.
+
+
+@nb.njit
+def _pass(tour, matrix: np.ndarray, neighbours: np.ndarray, queue: ActiveQueue, solutions: TabuStore, k: int,
+          stack: MoveStack) -> float:
+    """ Проход до пустой очереди активных городов, целиком в compiled коде
+    После хода в очередь возвращаются города всех его 2-opt (журнал stack.flips), город без улучшения выпадает.
+    Хеш тура stack.hash переходит от хода к ходу, stack.clear его не сбрасывает
+    tour: тур [ArrayTour, TreeTour], при улучшении меняется на месте
+    queue: очередь активных городов
+    остальное: см. _improve
+    return: суммарный выигрыш прохода
+    """
+    total = 0.
+    while len(queue) > 0:
+        t1 = queue.pop()
+        gain = _improve(tour, matrix, neighbours, t1, solutions, k, stack)
+        if gain > 1.e-10:
+            queue.fill(stack.flips[:stack.depth].ravel())
+            total += gain
+    return total
 
 
 class LKOpt(AbcOpt):
@@ -184,57 +181,56 @@ class LKOpt(AbcOpt):
     tour: начальный тур
     matrix: матрица весов
 
-    dlb: don't look bits [boolean]
+    dlb: don't look bits as a queue of active cities, otherwise all cities are active [boolean]
+    backend: tour representation [array, tree]
     bridge: make double bridge [tuple] ([not use: 0, all cities: 1, only neighbours: 2], fast scheme)
     neighbours: number of neighbours [int]
     k: number of k for k-opt; how many sequential can make algorithm [int]
+    points: coordinates of cities, candidates by kd-tree instead of matrix [np.ndarray]
+    quadrant: use quadrant neighbours, only with points [boolean]
+    compact: store candidates as int32 [boolean]
+    delaunay: use Delaunay graph instead of nearest neighbours, only with points [boolean]
+    second: add second-order neighbours, only for delaunay [boolean]
     """
 
     def __init__(self, length: float, tour: np.ndarray, matrix: np.ndarray, **kwargs):
         super().__init__(length, tour, matrix, **kwargs)
 
-        dlb = kwargs.get('dlb', False)
+        self.dlb = kwargs.get('dlb', False)
         neighbours = kwargs.get('neighbours', 5)
         self.k = kwargs.get('k', 5)
         self.bridge, self.fast = kwargs.get('bridge', (2, True))
 
-        self.neighbours = self._calc_neighbours(neighbours)
-        self.dlb = np.zeros(self.size if dlb else 1, dtype=bool)
+        self.neighbours = self._calc_neighbours(neighbours, **kwargs)
 
     def improve(self) -> float:
         """ Локальный поиск (поиск изменения + само изменение)
         return: выигрыш от локального поиска
         """
-        for it1, t1 in enumerate(self.tour):
-            if check_dlb(self.dlb, t1):
-                continue
-            gain, tour = _improve(self.tour, self.matrix, self.neighbours, self.dlb, it1, t1, self.solutions, self.k)
-            if gain > 1.e-10:
-                logging.info('iteration k-opt')
-                self.length -= gain
-                self.tour = tour
-                if self.collector is not None:
-                    self.collector.update({'length': self.length, 'gain': gain})
-                return gain
-
-            if len(self.dlb) != 1:
-                self.dlb[t1] = True
+        if not self.dlb:  # без don't look bits активны все города
+            self.queue.fill(self.tour)
+        stack = MoveStack(self.k, self.hash)
+        gain = _pass(self.route, self.matrix, self.neighbours, self.queue, self.solutions, self.k, stack)
+        self.hash = stack.hash
+        if gain > 1.e-10:
+            logging.info('iteration k-opt')
+            self.length -= gain
+            if self.collector is not None:
+                self.collector.update({'length': self.length, 'gain': gain})
+            return gain
 
         if self.bridge != 0:
-            gain, tour = 0, None
-
-            if self.bridge == 1:
-                gain, tour = double_bridge(self.tour, self.matrix, np.zeros([2, 2], dtype=int), self.fast)
-            elif self.bridge == 2:
-                gain, tour = double_bridge(self.tour, self.matrix, self.neighbours, self.fast)
+            candidates = np.zeros([2, 2], dtype=int) if self.bridge == 1 else self.neighbours
+            tour = self.tour  # для tree - обход за O(n), делаем его один раз
+            gain, exchange = find_double_bridge(tour, self.index, self.matrix, candidates, self.fast)
 
             if gain > 1.e-10:
                 logging.info('non-seq 4-opt')
                 self.length -= gain
-                self.tour = tour
-
-                if len(self.dlb) != 1:
-                    self.dlb = np.zeros(self.size, dtype=bool)
+                nodes = double_bridge_move(self.route, tour, exchange)
+                self.hash = update_bridge_hash(self.hash, nodes)
+                self.queue.clear()  # активны только концы моста
+                self.queue.fill(nodes)
 
                 if self.collector is not None:
                     self.collector.update({'length': self.length, 'gain': gain})
@@ -242,19 +238,11 @@ class LKOpt(AbcOpt):
 
         return 0.
 
-    def _calc_neighbours(self, count: int) -> np.ndarray:
+    def _calc_neighbours(self, count: int, **kwargs) -> np.ndarray:
         """ Собираем кандидатов по приоритету соседства
         count: сколько соседей отбираем в кандидаты
+        points, quadrant, delaunay, second: координаты городов и вид соседей, см. neighbour_candidates
         return: матрица кандидатов
         """
         assert 0 < count < self.size, 'bad count'
-        neighbours = np.zeros([self.size, count], dtype=int)
-        for i in self.tour:
-            temp = []
-            for j, dist in enumerate(self.matrix[i]):
-                if dist > 0:
-                    temp.append((dist, j))
-            temp = sorted(temp)[:count]
-            for idx, node in enumerate(temp):
-                neighbours[i][idx] = node[1]
-        return neighbours
+        return neighbour_candidates(self.matrix, count, **kwargs)
@@ -1,37 +1,48 @@
 import logging
 from collections import defaultdict
-from typing import Tuple
 
 import numba as nb
 import numpy as np
-
-from lin_kernighan.algorithms.lk_opt import __get_tour, __validation
-from lin_kernighan.algorithms.structures.matrix import alpha_matrix
-from lin_kernighan.algorithms.structures.one_tree import one_tree_topology
+from numba.typed import Dict
+
+from lin_kernighan.algorithms.lk_opt import __validation
+from lin_kernighan.algorithms.structures.active_queue import ActiveQueue
+from lin_kernighan.algorithms.structures.condensed import condensed_types
+from lin_kernighan.algorithms.structures.distance import DistanceProvider
+from lin_kernighan.algorithms.structures.matrix import alpha_matrix, sparse_alpha_matrix
+from lin_kernighan.algorithms.structures.move_stack import MoveStack
+from lin_kernighan.algorithms.structures.tabu_list import TabuStore
+from lin_kernighan.algorithms.structures.one_tree import one_tree, one_tree_edges
+from lin_kernighan.algorithms.structures.sparse_alpha import SparseAlpha
 from lin_kernighan.algorithms.utils.abc_opt import AbcOpt
-from lin_kernighan.algorithms.utils.double_bridge import double_bridge
-from lin_kernighan.algorithms.utils.hash import generate_hash
+from lin_kernighan.algorithms.utils.cache import InstanceCache, fingerprint
+from lin_kernighan.algorithms.utils.candidates import neighbour_candidates
+from lin_kernighan.algorithms.utils.double_bridge import double_bridge_move, find_double_bridge
+from lin_kernighan.algorithms.utils.hash import update_bridge_hash
+from lin_kernighan.algorithms.utils.k_opt import feasible_move, k_opt_move, reversal_tables
 from lin_kernighan.algorithms.utils.non_sequential_move import non_sequential_move
 from lin_kernighan.algorithms.utils.subgradient_optimization import SubgradientOptimization
-from lin_kernighan.algorithms.utils.utils import around, make_pair, check_dlb
+from lin_kernighan.algorithms.utils.utils import make_pair
+
+_edge_type = nb.types.UniTuple(nb.int64, 2)
 
 
 @nb.njit
-def _improve(tour: np.ndarray, matrix: np.ndarray, candidates: np.ndarray, dlb: np.ndarray,
-             it1: int, t1: int, best: set, solutions: set, k: int) -> Tuple[float, np.ndarray]:
+def _improve(tour, matrix: np.ndarray, candidates: np.ndarray, t1: int, best: Dict,
+             solutions: TabuStore, k: int, stack: MoveStack) -> float:
     """ Последовательный 2-opt для эвристики Лина-Кернига-Хельсгауна
-    tour: список городов
+    tour: тур [ArrayTour, TreeTour], при улучшении меняется на месте
     matrix: матрица весов
     candidates: набор кандидатов
-    dlb: don't look bits
-    it1, t1: индекс, значение города, с которого начинать
+    t1: город, с которого начинать
     solutions: полученные ранее туры
-    best, set_y: наборы лушчих, добавленных ребер
+    best: набор лучших ребер, typed Dict
     k: k-opt, k - кол-во сколько можно сделать последовательных улучшений
-    return: выигрыш, новый тур
+    stack: стек хода, добавленные ребра
+    return: выигрыш
     """
-    around_t1 = around(tour, it1)
-    for it2, t2 in around_t1:
+    around_t1 = (tour.next(t1), tour.prev(t1))
+    for t2 in around_t1:
         t1t2 = make_pair(t1, t2)
         if t1t2 in best:
             continue
@@ -39,106 +50,207 @@ def _improve(tour: np.ndarray, matrix: np.ndarray, candidates: np.ndarray, dlb:
         for t3 in candidates[t2]:
             if t3 == -1:
                 continue
-            gain = matrix[t1][t2] - matrix[t2][t3]
-            if t3 == around_t1[0][1] or t3 == around_t1[1][1] or not gain > 1.e-10:
+            gain = np.float64(matrix[t1, t2]) - matrix[t2, t3]  # выигрыш копим в float64 при любом типе весов
+            if t3 == around_t1[0] or t3 == around_t1[1] or not gain > 1.e-10:
                 continue
 
-            it3 = np.where(tour == t3)[0][0]
-            set_y = {make_pair(t2, t3)}
-            _gain, _tour = __choose_t4(tour, matrix, it1, it2, it3, candidates, gain, set_y, dlb, solutions, k)
+            stack.clear()
+            stack.add(t2, t3)
+            _gain = __choose_t4(tour, matrix, t1, t2, t3, candidates, gain, stack, solutions, k)
             if _gain > 1.e-10:
-                return _gain, _tour
+                return _gain
 
-    return 0., tour
+    return 0.
 
 
 @nb.njit
-def __choose_t4(tour: np.ndarray, matrix: np.ndarray, it1: int, it2: int, it3: int, candidates: np.ndarray,
-                gain: float, set_y: set, dlb: np.ndarray, sol: set, k: int) -> Tuple[float, np.ndarray]:
+def __choose_t4(tour, matrix: np.ndarray, t1: int, t2: int, t3: int, candidates: np.ndarray,
+                gain: float, stack: MoveStack, sol: TabuStore, k: int) -> float:
     """ Выбираем город t2i - город, который создаст ребро на удаление
-    tour: список городов
+    tour: тур [ArrayTour, TreeTour]
     matrix: матрица весов
-    it1, it2, it3: города t1, t2i, t2i+1, их индексы
+    t1, t2, t3: города t1, t2i, t2i+1
     candidates: набор кандидатов
     gain: текущий выигрыш
-    set_y: набор добавленных ребер
-    dlb: don't look bits
+    stack: стек хода, добавленные ребра
     sol: существующие решения
     k: k-opt, k - кол-во сколько можно сделать последовательных улучшений
-    return: выигрыш, новый тур
+    return: выигрыш, если он есть - тур остается измененным, иначе ход откатывается
     """
-    t1, t2, t3 = tour[it1], tour[it2], tour[it3]
-    around_t3 = around(tour, it3)
-
-    for it4, t4 in around_t3:
-        t3t4 = make_pair(t3, t4)
-        if t3t4 in set_y:
+    added = stack.added_count
+    for t4 in (tour.next(t3), tour.prev(t3)):
+        if stack.is_added(t3, t4):
             continue
-        if not __validation(len(tour), it1, it2, it3, it4):  # проверяем на корректность
+        if not __validation(tour, t1, t2, t3, t4):  # проверяем на корректность
             continue
 
-        _tour = tour.copy()
-        _it1, _it4 = __get_tour(_tour, it1, it2, it3, it4)  # единственное место, где меняется тур
+        stack.apply(tour, t1, t2, t3, t4)  # единственное место, где меняется тур
+        stack.add(t1, t4)
 
-        _set_y = set_y.copy()
-        _set_y.add(make_pair(t1, t4))
-
-        if generate_hash(_tour) in sol:  # проверяем, был ли такой раньше
+        if sol.contains(stack.hash):  # проверяем, был ли такой раньше
+            stack.rollback(tour)
+            stack.added_count = added
             continue
 
-        _gain = gain + (matrix[t3][t4] - matrix[t1][t4])
+        _gain = gain + matrix[t3, t4] - matrix[t1, t4]
         if _gain > 1.e-10:
-            if len(dlb) != 1:
-                dlb[t1] = dlb[t2] = dlb[t3] = dlb[t4] = False
-            return _gain, _tour
-        elif len(_set_y) <= k:
-            _gain, _tour = __choose_t5(_tour, matrix, _it1, _it4, candidates, _gain, _set_y, dlb, sol, k)
+            return _gain
+        elif stack.added_count <= k:
+            _gain = __choose_t5(tour, matrix, t1, t4, candidates, _gain, stack, sol, k)
             if _gain > 1.e-10:
-                if len(dlb) != 1:
-                    dlb[t1] = dlb[t2] = dlb[t3] = dlb[t4] = False
-                return _gain, _tour
+                return _gain
+            stack.rollback(tour)
+            stack.added_count = added
         else:
+            stack.rollback(tour)
+            stack.added_count = added
             break
 
-    return 0., tour
+    return 0.
 
 
 @nb.njit
-def __choose_t5(tour: np.ndarray, matrix: np.ndarray, it1: int, it4: int, candidates: np.ndarray,
-                gain: float, set_y: set, dlb: np.ndarray, sol: set, k: int) -> Tuple[float, np.ndarray]:
+def __choose_t5(tour, matrix: np.ndarray, t1: int, t4: int, candidates: np.ndarray,
+                gain: float, stack: MoveStack, sol: TabuStore, k: int) -> float:
     """ Выбираем город t2i+1 - город, который создаст ребро на добавление
-    tour: список городов
+    tour: тур [ArrayTour, TreeTour]
     matrix: матрица весов
-    it1, it4: города t1 и t2i, их индексы
+    t1, t4: города t1 и t2i
     candidates: набор кандидатов
     gain: текущий выигрыш
-    set_y: набор добавленных ребер
-    dlb: don't look bits
+    stack: стек хода, добавленные ребра
     sol: существующие решения
     k: k-opt, k - кол-во сколько можно сделать последовательных улучшений
-    return: выигрыш, новый тур
+    return: выигрыш
     """
-    t1, t4 = tour[it1], tour[it4]
-    around_t1 = around(tour, t1)
+    around_t1 = (tour.next(t1), tour.prev(t1))
+    added = stack.added_count
     for t5 in candidates[t4]:
-        if t5 == -1 or t5 == around_t1[0][1] or t5 == around_t1[1][1]:
+        if t5 == -1 or t5 == t1 or t5 == around_t1[0] or t5 == around_t1[1]:
             continue
 
-        t4t5 = make_pair(t4, t5)
-
-        _gain = gain + (matrix[t1][t4] - matrix[t4][t5])
+        _gain = gain + matrix[t1, t4] - matrix[t4, t5]
         if not _gain > 1.e-10:
             continue
 
-        _set_y = set_y.copy()
-        _set_y.add(t4t5)
-
-        it5 = np.where(tour == t5)[0][0]
-        _gain, _tour = __choose_t4(tour, matrix, it1, it4, it5, candidates, _gain, _set_y, dlb, sol, k)
+        stack.add(t4, t5)
+        _gain = __choose_t4(tour, matrix, t1, t4, t5, candidates, _gain, stack, sol, k)
         if _gain > 1.e-10:
-            return _gain, _tour
+            return _gain
+        stack.added_count = added
 
-    return 0., tour
+    return 0.
+
+
+@nb.njit
+def _k_opt_improve(tour, matrix: np.ndarray, candidates: np.ndarray, t1: int, best: Dict, solutions: TabuStore,
+                   move_type: int, stack: MoveStack, reversals: tuple) -> float:
+    """ Последовательный k-opt как базовый ход LKH (MOVE_TYPE): тур не меняется, пока ход не найден
+    Цепочка t1, t2 ... t2k строится по кандидатам с положительными частичными суммами, на каждом шаге пробуем
+    замкнуть ее ребром (t2k, t1). Корректность проверяется по позициям концов (feasible_move), поэтому
+    доступны и 3-opt / 5-opt перестройки, которые не собрать из последовательных 2-opt
+    tour: тур [ArrayTour, TreeTour], при улучшении меняется на месте
+    matrix: матрица весов
+    candidates: набор кандидатов
+    t1: город, с которого начинать
+    best: набор лучших ребер, typed Dict
+    solutions: полученные ранее туры
+    move_type: наибольшее k базового хода, 2..5
+    stack: стек хода, удаленные и добавленные ребра
+    reversals: таблицы разворотов reversal_tables для k до move_type
+    return: выигрыш
+    """
+    for t2 in (tour.next(t1), tour.prev(t1)):
+        if make_pair(t1, t2) in best:
+            continue
+        stack.clear()
+        stack.remove(t1, t2)
+        gain = __k_opt_step(tour, matrix, candidates, t1, t2, np.float64(matrix[t1, t2]), solutions, move_type,
+                            stack, reversals)
+        if gain > 1.e-10:
+            return gain
+    return 0.
+
+
+@nb.njit
+def __k_opt_step(tour, matrix: np.ndarray, candidates: np.ndarray, t1: int, last: int, gain: float,
+                 sol: TabuStore, move_type: int, stack: MoveStack, reversals: tuple) -> float:
+    """ Добавляем ребро (t2i, t2i+1), удаляем (t2i+1, t2i+2) и пробуем замкнуть ход ребром (t2i+2, t1)
+    last: город t2i
+    gain: сумма удаленных минус сумма добавленных ребер
+    остальное: см. _k_opt_improve
+    return: выигрыш, если он есть - ход выполнен
+    """
+    removed, added = stack.removed_count, stack.added_count
+    for t3 in candidates[last]:
+        if t3 == -1 or t3 == tour.next(last) or t3 == tour.prev(last) or stack.is_added(last, t3):
+            continue
+        g1 = gain - matrix[last, t3]
+        if not g1 > 1.e-10:
+            continue
+
+        for t4 in (tour.next(t3), tour.prev(t3)):
+            if t4 == t1 or stack.is_removed(t3, t4):
+                continue
+            stack.remove(t3, t4)
+            stack.add(last, t3)
+            g2 = g1 + matrix[t3, t4]
+
+            if g2 - matrix[t4, t1] > 1.e-10 and not stack.is_added(t4, t1):
+                stack.add(t4, t1)
+                feasible, ends, order = feasible_move(
+                    tour, stack.removed[:stack.removed_count], stack.added[:stack.added_count])
+                if feasible:
+                    k_opt_move(tour, ends, order, stack, reversals)
+                    if not sol.contains(stack.hash):
+                        return g2 - matrix[t4, t1]
+                    while stack.depth > 0:  # такой тур уже был
+                        stack.rollback(tour)
+                stack.added_count -= 1
+
+            if stack.removed_count < move_type:
+                _gain = __k_opt_step(tour, matrix, candidates, t1, t4, g2, sol, move_type, stack, reversals)
+                if _gain > 1.e-10:
+                    return _gain
+            stack.removed_count, stack.added_count = removed, added
+
+    return 0.
+
+
+@nb.njit
+def _pass(tour, matrix: np.ndarray, candidates: np.ndarray, queue: ActiveQueue, best: Dict, solutions: TabuStore,
+          k: int, move_type: int, stack: MoveStack, reversals: tuple) -> float:
+    """ Проход до пустой очереди активных городов, целиком в compiled коде
+    После хода в очередь возвращаются города всех его 2-opt (журнал stack.flips), город без улучшения выпадает.
+    Хеш тура stack.hash переходит от хода к ходу, stack.clear его не сбрасывает
+    tour: тур [ArrayTour, TreeTour], при улучшении меняется на месте
+    queue: очередь активных городов
+    best: набор лучших ребер, typed Dict
+    move_type: 2 - цепочка 2-opt (_improve), 3..5 - базовый k-opt ход (_k_opt_improve)
+    reversals: таблицы разворотов для _k_opt_improve
+    остальное: см. _improve
+    return: суммарный выигрыш прохода
+    """
+    total = 0.
+    while len(queue) > 0:
+        t1 = queue.pop()
+        if move_type == 2:
+            gain = _improve(tour, matrix, candidates, t1, best, solutions, k, stack)
+        else:
+            gain = _k_opt_improve(tour, matrix, candidates, t1, best, solutions, move_type, stack, reversals)
+        if gain > 1.e-10:
+            queue.fill(stack.flips[:stack.depth].ravel())
+            total += gain
+    return total
+
+
+@nb.njit(cache=True)
+def _edges(edges: set) -> Dict:
+    """ Ребра из set в typed Dict: его не нужно отражать при каждом вызове compiled кода """
+    temp = Dict.empty(key_type=_edge_type, value_type=nb.boolean)
+    for edge in edges:
+        temp[edge] = True
+    return temp
 
 
 class LKHOpt(AbcOpt):
@@ -149,56 +261,156 @@ class LKHOpt(AbcOpt):
     tour: начальный тур
     matrix: матрица весов
 
-    dlb: don't look bits [boolean]
+    dlb: don't look bits as a queue of active cities, otherwise all cities are active [boolean]
+    backend: tour representation [array, tree]
     bridge: make double bridge [boolean]
     non_seq: use non sequential move [boolean]
     excess: parameter for cut bad candidates [float]
     mul: excess factor [float]
     k: number of k for k-opt; how many sequential can make algorithm [int]
+    move_type: basic move: 2 - chain of 2-opt up to k, 3..5 - sequential k-opt with all reconnections [int]
     subgradient: use or not subgradient optimization [boolean]
+    pi: initial penalties for subgradient optimization, e.g. gradient.pi_max of previous run [np.ndarray]
+    gap: stop subgradient optimization when lower bound is within this fraction of tour length [float]
+    candidates: how to choose candidates [alpha, nearest, quadrant, delaunay]
+    neighbours: number of candidates, only for nearest and quadrant [int]
+    points: coordinates of cities, kd-tree for nearest and quadrant, required for delaunay [np.ndarray]
+    second: add second-order neighbours, only for delaunay [boolean]
+    compact: store candidates as int32 [boolean]
+    sparse_alpha: keep only this many best alpha values per city instead of the dense alpha matrix, 0 - dense [int]
+    tree_neighbours: build the one tree over this many nearest neighbours instead of all pairs, 0 - all pairs [int]
+    cache: directory of on-disk cache for pi, candidates and one tree, keyed by instance fingerprint [str]
+    cache_size: max size of cache directory in bytes, least recently used files are removed [int]
     """
 
     def __init__(self, length: float, tour: np.ndarray, matrix: np.ndarray, **kwargs):
         super().__init__(length, tour, matrix, **kwargs)
 
         subgradient = kwargs.get('subgradient', False)
-        if subgradient:
-            self.gradient = SubgradientOptimization.run(self.matrix)
-            SubgradientOptimization.make_move(self.gradient.pi_sum, self.matrix)
-            logging.info('subgradient optimization done')
-            _length, _f, _s, self.best_solution, topology = one_tree_topology(self.matrix)
-            self.alpha = alpha_matrix(self.matrix, _f, _s, topology)
-            logging.info('alpha-matrix done')
-            SubgradientOptimization.get_back(self.gradient.pi_sum, self.matrix)
+        candidates = kwargs.get('candidates', 'alpha')
+        self._alpha, self.sparse_alpha, self.pi = None, kwargs.get('sparse_alpha', 0), None
+        cache = kwargs.get('cache')
+        cache = None if cache is None else InstanceCache(cache, kwargs.get('cache_size', 1 << 30))
+        key = None if cache is None else self.__fingerprint(**kwargs)
+        cached = None if cache is None else cache.load(key)
+
+        if cached is None:
+            tree_neighbours = kwargs.get('tree_neighbours', 0)
+            tree_candidates = None if tree_neighbours == 0 else \
+                neighbour_candidates(self.matrix, tree_neighbours, points=kwargs.get('points'))
+            if subgradient:
+                self.pi = SubgradientOptimization.run(
+                    self.matrix, candidates=tree_candidates, pi=kwargs.get('pi'), upper=self.length,
+                    gap=kwargs.get('gap', 0.)
+                ).pi_max
+                logging.info('subgradient optimization done')
+            _length, *self._one_tree = one_tree(self.matrix, tree_candidates, self.pi)  # alpha - при первом обращении
         else:
-            _length, _f, _s, self.best_solution, topology = one_tree_topology(self.matrix)
-            self.alpha = alpha_matrix(self.matrix, _f, _s, topology)
-            logging.info('alpha-matrix done')
-
-        dlb = kwargs.get('dlb', True)
+            self.pi = cached['pi'] if subgradient else None
+            f_node, s_node = cached['zero']
+            self._one_tree = (cached['parent'], cached['order'], cached['degree'], int(f_node), int(s_node))
+            _length = float(cached['length'][0])
+            logging.info('one tree loaded from cache')
+        parent, _, _, f_node, s_node = self._one_tree
+        self.best_solution = one_tree_edges(parent, f_node, s_node)
+
+        self.dlb = kwargs.get('dlb', True)
         self.k = kwargs.get('k', 5)
+        self.move_type = kwargs.get('move_type', 2)
+        assert 2 <= self.move_type <= 5, 'bad move type'
         self.excess = kwargs.get('mul', 1) * kwargs.get('excess', 1 / self.size * _length)
         self.bridge = kwargs.get('bridge', True)
         self.non_seq = kwargs.get('non_seq', False)
+        self.reversals = reversal_tables(5 if self.non_seq else self.move_type)  # один раз, а не поиск на ход
 
-        self.candidates = self._calc_candidates(self.tour, self.alpha, self.matrix, self.excess)
-        self.dlb = np.zeros(self.size if dlb else 1, dtype=bool)
+        if cached is not None:
+            self.candidates = cached['candidates']
+        elif candidates == 'alpha':
+            self.candidates = self._calc_candidates(self.tour, self.alpha, self.matrix, self.excess)
+        else:
+            assert candidates != 'delaunay' or 'points' in kwargs, 'delaunay needs points'
+            self.candidates = neighbour_candidates(
+                self.matrix, kwargs.get('neighbours', 5), points=kwargs.get('points'),
+                quadrant=candidates == 'quadrant', delaunay=candidates == 'delaunay', second=kwargs.get('second', False)
+            )
+        if kwargs.get('compact', False):
+            self.candidates = self.candidates.astype(np.int32)
+        if cache is not None and cached is None:
+            cache.save(key, pi=self.pi if self.pi is not None else np.zeros(0), candidates=self.candidates,
+                       parent=parent, order=self._one_tree[1], degree=self._one_tree[2],
+                       zero=np.array([f_node, s_node]), length=np.array([_length]))
         logging.info('initialization lkh done')
 
+    @property
+    def alpha(self):
+        """ Альфа-матрица [np.ndarray, SparseAlpha], считается при первом обращении """
+        if self._alpha is None:
+            self._alpha = self.__alpha_matrix(*self._one_tree)
+            logging.info('alpha-matrix done')
+        return self._alpha
+
+    def __fingerprint(self, **kwargs) -> str:
+        """ Ключ кеша: веса, по которым идет предподсчет, координаты (если есть) и параметры предподсчета
+        Веса хешируются всегда: по одним координатам строятся матрицы разных метрик, типов и округлений
+        """
+        params = {key: kwargs.get(key) for key in ('subgradient', 'candidates', 'neighbours', 'second', 'sparse_alpha',
+                                                   'tree_neighbours', 'excess', 'mul', 'pi', 'gap', 'compact',
+                                                   'points')}
+        if kwargs.get('gap'):
+            params['upper'] = self.length  # остановка подъема зависит от длины начального тура
+        data = self.matrix
+        if isinstance(self.matrix, DistanceProvider):
+            data, params['distance'] = self.matrix.points, self.matrix.kind
+        if isinstance(self.matrix, condensed_types):
+            data, params['condensed'] = self.matrix.data, True
+        return fingerprint(data, **params)
+
+    def __alpha_matrix(self, parent: np.ndarray, order: np.ndarray, _: np.ndarray, f_node: int, s_node: int):
+        """ Плотная альфа-матрица или разреженная, если задан sparse_alpha; аргументы - one tree, см. one_tree """
+        pi = np.zeros(self.size) if self.pi is None else self.pi
+        if self.sparse_alpha > 0:
+            return sparse_alpha_matrix(self.matrix, parent, order, f_node, s_node, self.sparse_alpha, pi)
+        return alpha_matrix(self.matrix, parent, order, f_node, s_node, pi)
+
+    @property
+    def best_solution(self) -> Dict:
+        """ Ребра лучшего тура (сначала - one tree) в typed Dict, передается в compiled код без копирования """
+        return self._best_solution
+
+    @best_solution.setter
+    def best_solution(self, edges: set) -> None:
+        self._best_solution = _edges(edges)
+
+    def __getstate__(self) -> dict:
+        """ Разреженная альфа-матрица - jitclass, передаем ее массивами; лучшие ребра - обычным set """
+        state = super().__getstate__()
+        if isinstance(self._alpha, SparseAlpha):
+            state['_alpha'] = (self._alpha.indptr, self._alpha.indices, self._alpha.alpha, self._alpha.cost)
+        state['_best_solution'] = set(self._best_solution)
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        super().__setstate__(state)
+        if isinstance(self._alpha, tuple):
+            self._alpha = SparseAlpha(*self._alpha)
+        self.best_solution = self._best_solution
+
     @staticmethod
     def _calc_candidates(tour: np.ndarray, alpha: np.ndarray, matrix: np.ndarray, excess: float) -> np.ndarray:
         """ Отбираем кандидатов по альфа-мере
         tour: список городов
-        alpha: матрица альфа-мер
+        alpha: матрица альфа-мер [np.ndarray, SparseAlpha]
         matrix: матрица весов
         excess: уровень по которому отбираем кандидатов
         return: матрица кандидатов [size * max(num of candidates for i)], пустое заполнено -1
         """
+        if not isinstance(alpha, np.ndarray):
+            return alpha.candidates(excess)
         max_num, size, candidates = 0, len(matrix), defaultdict(list)
         for i in tour:
-            for j, dist in enumerate(matrix[i]):
+            for j in range(size):
                 if i != j and alpha[i][j] < excess:
-                    candidates[i].append((alpha[i][j], matrix[i][j], j))
+                    candidates[i].append((alpha[i][j], matrix[i, j], j))
             if max_num < len(candidates[i]):
                 max_num = len(candidates[i])
             candidates[i].sort()
@@ -214,39 +426,45 @@ class LKHOpt(AbcOpt):
         """ Локальный поиск (поиск изменения + само изменение)
         return: выигрыш от локального поиска
         """
-        for it1, t1 in enumerate(self.tour):
-            if check_dlb(self.dlb, t1):
-                continue
-            gain, tour = _improve(
-                self.tour, self.matrix, self.candidates, self.dlb, it1, t1, self.best_solution, self.solutions, self.k
-            )
+        if not self.dlb:  # без don't look bits активны все города
+            self.queue.fill(self.tour)
+        stack = MoveStack(max(self.k, self.move_type), self.hash)
+        gain = _pass(self.route, self.matrix, self.candidates, self.queue, self.best_solution, self.solutions, self.k,
+                     self.move_type, stack, self.reversals)
+        self.hash = stack.hash
+        if gain > 1.e-10:
+            logging.info('iteration k-opt')
+            self.length -= gain
+            if self.collector is not None:
+                self.collector.update({'length': self.length, 'gain': gain})
+            return gain
+
+        if self.bridge or self.non_seq:
+            tour, index = self.tour, self.index  # для tree - обход за O(n), делаем его один раз
+        if self.bridge:
+            gain, exchange = find_double_bridge(tour, index, self.matrix, self.candidates, True)
             if gain > 1.e-10:
-                logging.info('iteration k-opt')
-                self.tour = tour
+                logging.info('non-seq 4-opt')
                 self.length -= gain
+                nodes = double_bridge_move(self.route, tour, exchange)
+                self.hash = update_bridge_hash(self.hash, nodes)
+                self.queue.clear()  # активны только концы моста
+                self.queue.fill(nodes)
                 if self.collector is not None:
                     self.collector.update({'length': self.length, 'gain': gain})
                 return gain
-            if len(self.dlb) != 1:
-                self.dlb[t1] = True
-
-        if self.bridge or self.non_seq:
-            gain, tour = 0., None
-            if self.bridge:
-                gain, tour = double_bridge(self.tour, self.matrix, self.candidates, True)
-                if gain > 1.e-10:
-                    logging.info('non-seq 4-opt')
-
-            if self.non_seq and not gain > 1.e-10:
-                gain, tour = non_sequential_move(self.tour, self.matrix, self.candidates)
-                if gain > 1.e-10:
-                    logging.info('non-seq 5-opt')
 
+        if self.non_seq:
+            gain, towns = non_sequential_move(tour, index, self.matrix, self.candidates)
             if gain > 1.e-10:
-                self.tour = tour
+                logging.info('non-seq 5-opt')
+                _, ends, order = feasible_move(self.route, towns.reshape(5, 2), np.roll(towns, -1).reshape(5, 2))
+                stack = MoveStack(5, self.hash)
+                k_opt_move(self.route, ends, order, stack, self.reversals)  # на месте, хеш - по измененным ребрам
+                self.hash = stack.hash
                 self.length -= gain
-                if len(self.dlb) != 1:
-                    self.dlb = np.zeros(self.size, dtype=bool)
+                self.queue.clear()  # активны только концы хода
+                self.queue.fill(stack.flips[:stack.depth].ravel())
                 if self.collector is not None:
                     self.collector.update({'length': self.length, 'gain': gain})
                 return gain
@@ -0,0 +1,155 @@
+from typing import Tuple
+
+import numba as nb
+import numpy as np
+
+from lin_kernighan.algorithms.structures.active_queue import ActiveQueue
+from lin_kernighan.algorithms.structures.array_tour import ArrayTour
+from lin_kernighan.algorithms.structures.move_stack import two_opt_move
+from lin_kernighan.algorithms.utils.abc_opt import AbcOpt
+from lin_kernighan.algorithms.utils.candidates import neighbour_candidates
+from lin_kernighan.algorithms.utils.hash import update_hash
+from lin_kernighan.algorithms.utils.utils import nearest_neighbours
+
+
+@nb.njit
+def __insertion(tour, matrix: np.ndarray, s1: int, s2: int, c: int, g1: float, best: tuple) -> tuple:
+    """ Оцениваем вставку сегмента s1 -> s2 на ребра (c, next(c)) и (prev(c), c) в обеих ориентациях
+    tour: тур [ArrayTour, TreeTour]
+    matrix: матрица весов
+    s1, s2: первый и последний города сегмента по туру
+    c: сосед, рядом с которым вставляем
+    g1: выигрыш от вырезания сегмента
+    best: лучший найденный ход (gain, s1, s2, c, d, reverse)
+    return: лучший ход
+    """
+    p, n = tour.prev(s1), tour.next(s2)
+    for x, y in ((c, tour.next(c)), (tour.prev(c), c)):
+        if x == n or y == p or tour.between(s1, s2, x) or tour.between(s1, s2, y):
+            continue
+        forward = g1 + matrix[x, y] - matrix[x, s1] - matrix[s2, y]
+        backward = g1 + matrix[x, y] - matrix[x, s2] - matrix[s1, y]
+        if forward > best[0]:
+            best = (forward, s1, s2, x, y, False)
+        if backward > best[0]:
+            best = (backward, s1, s2, x, y, True)
+    return best
+
+
+@nb.njit
+def __choose_move(tour, matrix: np.ndarray, neighbours: np.ndarray, t1: int, segment: int, first: bool) -> tuple:
+    """ Поиск переноса сегмента, который начинается или заканчивается в t1
+    tour: тур [ArrayTour, TreeTour]
+    matrix: матрица весов
+    neighbours: ближайшие соседи по возрастанию расстояния
+    t1: город, с которого начинать
+    segment: максимальная длина сегмента
+    first: первое найденное улучшение или лучшее
+    return: (gain, s1, s2, c, d, reverse): вставляем s1 -> s2 между c и d, reverse - перевернутым
+    """
+    best = (1.e-10, -1, -1, -1, -1, False)
+    for length in range(1, min(segment, len(neighbours) - 3) + 1):
+        s2 = t1
+        for _ in range(length - 1):
+            s2 = tour.next(s2)
+        s1 = t1
+        for _ in range(length - 1):
+            s1 = tour.prev(s1)
+
+        for side in range(2 if length > 1 else 1):  # t1 - первый или последний город сегмента
+            x, y = (t1, s2) if side == 0 else (s1, t1)
+            p, n = tour.prev(x), tour.next(y)
+            g1 = np.float64(matrix[p, x]) + matrix[y, n] - matrix[p, n]  # выигрыш копим в float64 при любом типе весов
+            if not g1 > 1.e-10:
+                continue
+            for end in (x, y):
+                for c in neighbours[end]:
+                    if c == -1 or not matrix[end, c] < g1:  # соседи отсортированы, -1 - конец списка
+                        break
+                    best = __insertion(tour, matrix, x, y, nb.int64(c), g1, best)  # кандидаты могут быть int32
+                    if first and best[1] != -1:
+                        return best
+    return best
+
+
+@nb.njit
+def _improve(tour, matrix: np.ndarray, neighbours: np.ndarray, segment: int, first: bool, h: int) \
+        -> Tuple[float, int]:
+    """ Or-opt с очередью don't look bits: до локального минимума
+    Переносим сегменты длины 1..segment к ближайшим соседям их концов
+    tour: тур [ArrayTour, TreeTour], меняется на месте
+    matrix: матрица весов
+    neighbours: ближайшие соседи по возрастанию расстояния
+    segment: максимальная длина сегмента
+    first: первое найденное улучшение или лучшее для вершины
+    h: хеш тура
+    return: выигрыш, хеш нового тура
+    """
+    queue, total = ActiveQueue(len(neighbours)), 0.
+    queue.fill(tour.nodes())
+
+    while len(queue) > 0:
+        t1 = queue.pop()
+        gain, s1, s2, c, d, reverse = __choose_move(tour, matrix, neighbours, t1, segment, first)
+        if s1 == -1:
+            continue
+
+        p, n = tour.prev(s1), tour.next(s2)
+        two_opt_move(tour, p, s1, d, c)  # p s1..s2 n..c d -> p c..n s2..s1 d
+        two_opt_move(tour, p, c, s2, n)  # -> p n..c s2..s1 d
+        h = update_hash(update_hash(h, p, s1, d, c), p, c, s2, n)
+        if not reverse:
+            two_opt_move(tour, c, s2, d, s1)  # -> p n..c s1..s2 d
+            h = update_hash(h, c, s2, d, s1)
+        total += gain
+
+        for node in (p, n, s1, s2, c, d):
+            queue.push(node)
+
+    return total, h
+
+
+class OrOpt(AbcOpt):
+    """ Локальный поиск: Or-opt
+    Переносим сегменты из 1-3 городов, в обеих ориентациях, к ближайшим соседям их концов.
+    Вычислительная сложность прохода: O(n * neighbours)
+    length: начальная длина тура
+    tour: начальный тур
+    matrix: матрица весов
+
+    backend: tour representation [array, tree]
+    neighbours: number of nearest neighbours [int]
+    segment: max length of moved segment [int]
+    first: first improvement instead of best [boolean]
+    points: coordinates of cities, candidates by kd-tree instead of matrix [np.ndarray]
+    quadrant: use quadrant neighbours, only with points [boolean]
+    compact: store candidates as int32 [boolean]
+    """
+
+    def __init__(self, length: float, tour: np.ndarray, matrix: np.ndarray, **kwargs):
+        super().__init__(length, tour, matrix, **kwargs)
+        self.segment = kwargs.get('segment', 3)
+        self.first = kwargs.get('first', False)
+        self.neighbours = neighbour_candidates(self.matrix, kwargs.get('neighbours', 10), **kwargs)
+
+    def improve(self) -> float:
+        """ Локальный поиск (поиск изменения + само изменение), сразу до локального минимума
+        return: выигрыш от локального поиска
+        """
+        gain, self.hash = _improve(self.route, self.matrix, self.neighbours, self.segment, self.first, self.hash)
+        if gain > 1.e-10:
+            self.length -= gain
+            if self.collector is not None:
+                self.collector.update({'length': self.length, 'gain': gain})
+        return gain
+
+    @staticmethod
+    def just_improve(length: float, tour: np.ndarray, matrix: np.ndarray, neighbours=10, segment=3, first=False) \
+            -> Tuple[float, np.ndarray]:
+        """ Локальный поиск без сбора информации
+        return: длина нового тура, новый тур
+        """
+        route = ArrayTour(tour.copy())
+        gain, _ = _improve(route, matrix, nearest_neighbours(matrix, neighbours), segment, first, 0)
+        length -= gain
+        return length, route.nodes()
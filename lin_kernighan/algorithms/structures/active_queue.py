@@ -0,0 +1,49 @@
+import numba as nb
+import numpy as np
+
+
+@nb.experimental.jitclass(spec=[
+    ('queue', nb.int64[:]),
+    ('queued', nb.boolean[:]),
+    ('head', nb.int64),
+    ('count', nb.int64)
+])
+class ActiveQueue:
+    """ FIFO очередь активных городов вместо don't look bits, как в LKH
+    Город, из которого не нашлось улучшения, просто выпадает из очереди; после хода в очередь возвращаются
+    только его концы. Поиск заканчивается, когда очередь пуста, без прохода по всему туру.
+    queue: кольцевой буфер городов, queued: стоит ли город в очереди (каждый город не больше одного раза)
+    """
+
+    def __init__(self, size: int):
+        """
+        size: количество городов
+        """
+        self.queue = np.zeros(size, dtype=np.int64)
+        self.queued = np.zeros(size, dtype=np.bool_)
+        self.head = self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def push(self, node: int) -> None:
+        """ Ставим город в конец очереди, если его там еще нет """
+        if not self.queued[node]:
+            self.queue[(self.head + self.count) % len(self.queue)], self.queued[node] = node, True
+            self.count += 1
+
+    def pop(self) -> int:
+        """ Город из начала очереди, очередь не должна быть пустой """
+        node = self.queue[self.head]
+        self.head, self.count, self.queued[node] = (self.head + 1) % len(self.queue), self.count - 1, False
+        return node
+
+    def fill(self, nodes: np.ndarray) -> None:
+        """ Ставим в очередь города по порядку """
+        for node in nodes:
+            self.push(node)
+
+    def clear(self) -> None:
+        """ Очищаем очередь: O(count) """
+        while self.count > 0:
+            self.pop()
@@ -0,0 +1,60 @@
+import numba as nb
+import numpy as np
+
+from lin_kernighan.algorithms.utils.utils import get_index, swap_index
+
+
+@nb.experimental.jitclass(spec=[
+    ('size', nb.int64),
+    ('tour', nb.int64[:]),
+    ('index', nb.int64[:])
+])
+class ArrayTour:
+    """ Тур в виде массива городов и обратного массива позиций
+    next, prev, between: O(1); reverse: O(n)
+    Интерфейс совпадает с TreeTour
+    """
+
+    def __init__(self, tour: np.ndarray):
+        self.size = len(tour)
+        self.tour = tour
+        self.index = get_index(tour)
+
+    def next(self, node: int) -> int:
+        """ Следующая по туру вершина """
+        return self.tour[(self.index[node] + 1) % self.size]
+
+    def prev(self, node: int) -> int:
+        """ Предыдущая по туру вершина """
+        return self.tour[(self.index[node] - 1) % self.size]
+
+    def between(self, start: int, end: int, search: int) -> bool:
+        """ Находится ли вершина search на пути start -> end (включительно) """
+        x, y, z = self.index[start], self.index[end], self.index[search]
+        if x <= y:
+            return x <= z <= y
+        return z >= x or z <= y
+
+    def key(self, node: int) -> int:
+        """ Порядковый ключ вершины в туре """
+        return self.index[node]
+
+    def reverse(self, start: int, end: int) -> None:
+        """ Переворот пути start -> end (включительно)
+        Если путь длиннее половины тура, переворачивается дополнение - получается тот же цикл
+        """
+        x, y = self.index[start], self.index[end]
+        inside = (y - x) % self.size + 1
+        if inside == self.size:
+            return
+        if 2 * inside > self.size:
+            x, y = (y + 1) % self.size, (x - 1) % self.size
+        swap_index(self.tour, self.index, x, y)
+
+    def nodes(self) -> np.ndarray:
+        """ Список вершин в порядке тура """
+        return self.tour
+
+    def indexes(self) -> np.ndarray:
+        """ Позиции вершин в списке nodes() """
+        return self.index
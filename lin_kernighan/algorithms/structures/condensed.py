@@ -0,0 +1,45 @@
+from typing import Tuple
+
+import numba as nb
+import numpy as np
+
+
+class CondensedMatrix:
+    """ Симметричная матрица весов, хранится только верхний треугольник без диагонали: в 2 раза меньше памяти
+    Вес (i, j), i < j, лежит в data[i * size - i * (i + 1) / 2 + j - i - 1].
+    Поддерживает matrix[i, j], matrix.shape и len(matrix), поэтому передается в локальные поиски вместо матрицы.
+    Для каждого типа весов [float64, float32, int32] свой jitclass, создается через condensed
+    """
+
+    def __init__(self, size: int, data: np.ndarray):
+        self.size, self.shape, self.data = size, (size, size), data
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, idx: tuple) -> float:
+        """ matrix[i, j] """
+        i, j = nb.int64(idx[0]), nb.int64(idx[1])  # индекс из prange - uint64, не смешиваем с int64
+        if i == j:
+            return 0.
+        if i > j:
+            i, j = j, i
+        return self.data[i * self.size - i * (i + 1) // 2 + j - i - 1]
+
+
+_types = {np.dtype(dtype): nb.experimental.jitclass(CondensedMatrix, spec=[
+    ('size', nb.int64),
+    ('shape', nb.types.UniTuple(nb.int64, 2)),
+    ('data', nb.from_dtype(np.dtype(dtype))[:])
+]) for dtype in (np.float64, np.float32, np.int32)}
+
+condensed_types: Tuple[type, ...] = tuple(_types.values())  # для isinstance
+
+
+def condensed(size: int, data: np.ndarray) -> CondensedMatrix:
+    """ Сжатая матрица с типом весов data
+    size: количество городов
+    data: верхний треугольник [float64, float32, int32]
+    """
+    assert data.dtype in _types, f'bad dtype {data.dtype}'
+    return _types[data.dtype](size, data)
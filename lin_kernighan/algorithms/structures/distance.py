@@ -0,0 +1,112 @@
+from math import acos, asin, ceil, cos, floor, pi, sin, sqrt
+
+import numba as nb
+import numpy as np
+
+_kinds = dict(euclidean=0, euc_2d=1, ceil_2d=2, att=3, geo=4, haversine=5, manhattan=6)
+_planar = ('euclidean', 'euc_2d', 'ceil_2d', 'att')  # ближайшие по евклиду совпадают с ближайшими по метрике
+
+
+@nb.experimental.jitclass(spec=[
+    ('points', nb.float64[:, :]),
+    ('kind', nb.int64),
+    ('shape', nb.types.UniTuple(nb.int64, 2)),
+    ('neighbours', nb.int64[:, :]),
+    ('distances', nb.float64[:, :])
+])
+class DistanceProvider:
+    """ Матрица весов, которая считается на лету по координатам: O(n) памяти вместо O(n^2)
+    Поддерживает matrix[i, j], matrix.shape и len(matrix), поэтому передается в локальные поиски вместо матрицы.
+    points: координаты городов, для GEO и haversine - в радианах (см. distance_provider)
+    kind: 0 - euclidean, 1 - EUC_2D, 2 - CEIL_2D, 3 - ATT, 4 - GEO (TSPLIB), 5 - haversine в км по (lat, lon),
+    6 - manhattan
+    neighbours, distances: необязательная таблица расстояний до кандидатов, только для дорогих метрик GEO и haversine:
+    для остальных поиск по строке кандидатов дольше, чем само расстояние
+    """
+
+    def __init__(self, points: np.ndarray, kind: int):
+        size = len(points)
+        self.points, self.kind, self.shape = points, kind, (size, size)
+        self.neighbours = np.full((size, 0), -1, dtype=np.int64)
+        self.distances = np.zeros((size, 0), dtype=np.float64)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, idx: tuple) -> float:
+        """ matrix[i, j] """
+        i, j = idx
+        for k in range(self.neighbours.shape[1]):  # пустая, если метрика дешевая
+            if self.neighbours[i, k] == j:
+                return self.distances[i, k]
+            if self.neighbours[j, k] == i:
+                return self.distances[j, k]
+        return self.distance(i, j)
+
+    def distance(self, i: int, j: int) -> float:
+        """ Расстояние между городами i и j по координатам """
+        if i == j:
+            return 0.
+        if self.kind == 4 or self.kind == 5:
+            lat1, lon1, lat2, lon2 = self.points[i, 0], self.points[i, 1], self.points[j, 0], self.points[j, 1]
+            if self.kind == 4:
+                q1, q2, q3 = cos(lon1 - lon2), cos(lat1 - lat2), cos(lat1 + lat2)
+                return float(int(6378.388 * acos(0.5 * ((1. + q1) * q2 - (1. - q1) * q3)) + 1.))
+            h = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+            return 2. * 6371. * asin(min(1., sqrt(h)))
+
+        dx, dy = self.points[i, 0] - self.points[j, 0], self.points[i, 1] - self.points[j, 1]
+        if self.kind == 6:
+            return abs(dx) + abs(dy)
+        if self.kind == 3:
+            r = sqrt((dx * dx + dy * dy) / 10.)
+            t = floor(r + 0.5)
+            return t + 1. if t < r else t
+        d = sqrt(dx * dx + dy * dy)
+        if self.kind == 1:
+            return floor(d + 0.5)
+        if self.kind == 2:
+            return ceil(d)
+        return d
+
+    def cache(self, neighbours: np.ndarray) -> None:
+        """ Запоминаем расстояния до кандидатов, только для GEO и haversine
+        neighbours: кандидаты [size * count], пустое заполнено -1
+        """
+        if self.kind != 4 and self.kind != 5:
+            return
+        self.neighbours = neighbours.copy()
+        self.distances = np.zeros(neighbours.shape, dtype=np.float64)
+        for i in range(neighbours.shape[0]):
+            for k in range(neighbours.shape[1]):
+                if neighbours[i, k] != -1:
+                    self.distances[i, k] = self.distance(i, neighbours[i, k])
+
+    def row(self, i: int) -> np.ndarray:
+        """ Строка матрицы весов, O(n) """
+        temp = np.zeros(self.shape[0])
+        for j in range(self.shape[0]):
+            temp[j] = self.distance(i, j)
+        return temp
+
+
+def distance_provider(points: np.ndarray, kind='euclidean') -> DistanceProvider:
+    """ Матрица весов на лету по координатам
+    Для дорогих метрик расстояния до кандидатов можно запомнить: provider.cache(neighbour_candidates(provider, k))
+    points: координаты городов [size * 2]
+    kind: метрика [euclidean, euc_2d, ceil_2d, att, geo, haversine, manhattan]
+    return: DistanceProvider
+    """
+    assert kind in _kinds, 'unknown distance'
+    points = np.ascontiguousarray(points, dtype=np.float64)
+    if kind == 'geo':  # координаты DDD.MM в радианы, как в TSPLIB
+        degrees = np.trunc(points)
+        points = 3.141592 * (degrees + 5. * (points - degrees) / 3.) / 180.
+    if kind == 'haversine':
+        points = points * (pi / 180.)
+    return DistanceProvider(np.ascontiguousarray(points), _kinds[kind])
+
+
+def is_planar(matrix) -> bool:
+    """ Можно ли искать ближайших соседей по координатам provider'а через KD-дерево """
+    return isinstance(matrix, DistanceProvider) and matrix.kind in [_kinds[kind] for kind in _planar]
@@ -0,0 +1,102 @@
+import numba as nb
+import numpy as np
+
+
+@nb.experimental.jitclass(spec=[
+    ('size', nb.int64),
+    ('points', nb.float64[:, :]),
+    ('order', nb.int64[:]),
+    ('axis', nb.int64[:]),
+    ('lo', nb.int64[:]),
+    ('hi', nb.int64[:]),
+    ('bound', nb.float64[:])
+])
+class KDTree:
+    """ KD-дерево на плоскости
+    Неявное сбалансированное дерево над перестановкой order: узел - отрезок order[lo:hi],
+    разделяющая точка order[mid], mid = (lo + hi) // 2, ось разреза axis[mid] - по наибольшему разбросу.
+    Построение: O(n log^2 n), поиск k ближайших: O(log n + k) в среднем
+    """
+
+    def __init__(self, points: np.ndarray):
+        self.size = len(points)
+        self.points = points
+        self.order = np.arange(self.size)
+        self.axis = np.zeros(self.size, dtype=np.int64)
+
+        depth = 2 * int(np.log2(self.size + 1)) + 4  # стек обхода
+        self.lo = np.zeros(depth, dtype=np.int64)
+        self.hi = np.zeros(depth, dtype=np.int64)
+        self.bound = np.zeros(depth, dtype=np.float64)
+        self.__build()
+
+    def __build(self) -> None:
+        """ Сортируем отрезки order по оси с наибольшим разбросом, медиана - разделяющая точка """
+        top = 0
+        self.lo[0], self.hi[0] = 0, self.size
+        while top >= 0:
+            lo, hi = self.lo[top], self.hi[top]
+            top -= 1
+            if hi - lo <= 1:
+                continue
+            part = self.order[lo:hi]
+            spread_x = self.points[part, 0].max() - self.points[part, 0].min()
+            spread_y = self.points[part, 1].max() - self.points[part, 1].min()
+            axis = 0 if spread_x >= spread_y else 1
+            self.order[lo:hi] = part[np.argsort(self.points[part, axis])]
+            mid = (lo + hi) // 2
+            self.axis[mid] = axis
+            top += 1
+            self.lo[top], self.hi[top] = lo, mid
+            top += 1
+            self.lo[top], self.hi[top] = mid + 1, hi
+
+    def nearest(self, node: int, count: int, quadrant: int) -> np.ndarray:
+        """ Ближайшие к node точки по возрастанию расстояния
+        node: номер точки
+        count: сколько ищем
+        quadrant: -1 - любые, иначе четверть относительно node: бит 0 - x >= x0, бит 1 - y >= y0
+        return: найденные точки, их может быть меньше count
+        """
+        x0, y0 = self.points[node, 0], self.points[node, 1]
+        best_d, best_i, found = np.full(count, np.inf), np.full(count, -1, dtype=np.int64), 0
+
+        top = 0
+        self.lo[0], self.hi[0], self.bound[0] = 0, self.size, 0.
+        while top >= 0:
+            lo, hi, bound = self.lo[top], self.hi[top], self.bound[top]
+            top -= 1
+            if lo >= hi or (found == count and bound >= best_d[count - 1]):
+                continue
+
+            mid = (lo + hi) // 2
+            point, axis = self.order[mid], self.axis[mid]
+            dx, dy = self.points[point, 0] - x0, self.points[point, 1] - y0
+            if point != node and (quadrant == -1 or quadrant == (dx >= 0) + 2 * (dy >= 0)):
+                dist = dx * dx + dy * dy
+                if found < count or dist < best_d[count - 1]:  # вставка в отсортированный список
+                    idx = found if found < count else count - 1
+                    while idx > 0 and best_d[idx - 1] > dist:
+                        best_d[idx], best_i[idx] = best_d[idx - 1], best_i[idx - 1]
+                        idx -= 1
+                    best_d[idx], best_i[idx] = dist, point
+                    found = min(found + 1, count)
+
+            diff = dx if axis == 0 else dy  # split - точка разреза относительно node
+            left, right = True, True  # левое поддерево: координата <= split, правое: >= split
+            if quadrant != -1:
+                positive = (quadrant >> axis) & 1  # нужна координата >= node
+                if positive and diff < 0:
+                    left = False
+                if not positive and diff >= 0:
+                    right = False
+
+            near_left = diff >= 0
+            for side in range(2):  # дальнее поддерево кладем первым, чтобы ближнее обошлось раньше
+                is_left = near_left if side == 1 else not near_left
+                if (is_left and not left) or (not is_left and not right):
+                    continue
+                top += 1
+                self.lo[top], self.hi[top] = (lo, mid) if is_left else (mid + 1, hi)
+                self.bound[top] = 0. if side == 1 else diff * diff
+        return best_i[:found]
@@ -1,73 +1,164 @@
-from collections import deque, defaultdict
-from math import sqrt
-from typing import Dict
+from math import floor, sqrt
 
 import numpy as np
-from numba import njit
+from numba import njit, prange
 
+from lin_kernighan.algorithms.structures.condensed import CondensedMatrix, condensed
+from lin_kernighan.algorithms.structures.sparse_alpha import SparseAlpha
 
-def _sort_topologically(first: int, topology: Dict[int, int]):
-    """ node -> dad; in fact this is Depth-first search """
-    ancestors = defaultdict(list)
-    for key, pred in topology.items():
-        ancestors[pred] += [key]
 
-    res = []
-    deq = deque()
-    deq.append(first)
+def sparse_alpha_matrix(adjacency: np.ndarray, parent: np.ndarray, order: np.ndarray, f_node: int, s_node: int,
+                        count: int, pi: np.ndarray) -> SparseAlpha:
+    """ Разреженная альфа матрица: строки считаются по одной, храним только count лучших на город
+    adjacency: матрица весов
+    parent, order, f_node, s_node: one tree, см. one_tree
+    count: сколько соседей храним для каждого города
+    pi: штрафы вершин, веса c(i, j) + pi[i] + pi[j]
+    """
+    return SparseAlpha(*_sparse_alpha_matrix(adjacency, parent, order, f_node, s_node, count, pi))
 
-    while deq:
-        node = deq.popleft()
-        res += [node]
-        deq.extend(ancestors[node])
 
-    return res
+@njit(cache=True)
+def _beta(adjacency: np.ndarray, pi: np.ndarray, parent: np.ndarray, order: np.ndarray, i: int, f_node: int,
+          s_node: int, beta: np.ndarray, mark: np.ndarray) -> None:
+    """ Строка i матрицы beta: beta[j] - самое длинное ребро на пути i -> j в MST, O(n)
+    Сначала поднимаемся от i к корню, затем остальные вершины в топологическом порядке
+    beta[j] = max(beta[dad[j]], c(j, dad[j])). Для нулевой вершины - ее два минимальных ребра
+    adjacency: матрица весов
+    pi: штрафы вершин, веса c(i, j) + pi[i] + pi[j]
+    parent: dad для каждой вершины MST, -1 для корня и нулевой вершины
+    order: вершины MST, каждая после своего dad
+    i: номер строки
+    f_node, s_node: концы минимального и пред минимального ребер от 0 вершины
+    beta, mark: рабочие массивы размера n, beta заполняется результатом
+    """
+    beta[:], mark[:] = 0., False
+    if i == 0:
+        for j in (f_node, s_node):
+            if j > 0:
+                beta[j] = adjacency[0, j] + pi[0] + pi[j]
+        return
+
+    beta[0] = adjacency[0, i] + pi[0] + pi[i] if i == f_node or i == s_node else 0.
+    mark[i], dad = True, parent[i]
+    if dad != -1:
+        beta[dad], mark[dad] = max(beta[i], adjacency[i, dad] + pi[i] + pi[dad]), True
+        while parent[dad] != -1:
+            up = parent[dad]
+            beta[up], mark[up] = max(beta[dad], adjacency[dad, up] + pi[dad] + pi[up]), True
+            dad = up
+    for node in order:
+        if not mark[node]:
+            dad = parent[node]
+            beta[node] = max(beta[dad], adjacency[node, dad] + pi[node] + pi[dad])
 
 
-def alpha_matrix(adjacency: np.ndarray, f: tuple, s: tuple, topology: Dict[int, int]) -> np.ndarray:
-    """ Альфа матрица - изменение длины one tree, если пред добавить другое ребро
+@njit(parallel=True, cache=True)
+def alpha_matrix(adjacency: np.ndarray, parent: np.ndarray, order: np.ndarray, f_node: int, s_node: int,
+                 pi: np.ndarray) -> np.ndarray:
+    """ Альфа матрица - изменение длины one tree, если пред добавить другое ребро; строки считаются параллельно
     adjacency: матрица весов
-    f: минимальное ребро от 0 вершины (length, num)
-    s: пред минимальное ребро от 0 вершины (length, num)
-    topology: словарь son -> dad для вершин в MST графе
+    pi: штрафы вершин, веса c(i, j) + pi[i] + pi[j] считаются на лету
+    parent: dad для каждой вершины MST, -1 для корня и нулевой вершины
+    order: вершины MST, каждая после своего dad
+    f_node, s_node: концы минимального и пред минимального ребер от 0 вершины
+    return: альфа матрица
     """
     size = adjacency.shape[0]
     matrix = np.zeros(shape=adjacency.shape)
+    for i in prange(size):
+        beta, mark = np.zeros(size), np.zeros(size, dtype=np.bool_)
+        _beta(adjacency, pi, parent, order, i, f_node, s_node, beta, mark)
+        for j in range(size):
+            matrix[i, j] = adjacency[i, j] + pi[i] + pi[j] - beta[j]
+    return matrix
 
-    ordered_nodes = _sort_topologically(1, topology)
 
-    for i in range(1, size):
-        if i == f[0]:
-            matrix[0][i] = matrix[i][0] = f[1]
-        if i == s[0]:
-            matrix[0][i] = matrix[i][0] = s[1]
+@njit(parallel=True, cache=True)
+def _sparse_alpha_matrix(adjacency: np.ndarray, parent: np.ndarray, order: np.ndarray, f_node: int, s_node: int,
+                         count: int, pi: np.ndarray) -> tuple:
+    """ Лучшие count соседей каждого города по (alpha, cost, j), строки считаются параллельно
+    adjacency: матрица весов
+    parent: dad для каждой вершины MST, -1 для корня и нулевой вершины
+    order: вершины MST, каждая после своего dad
+    f_node, s_node: концы минимального и пред минимального ребер от 0 вершины
+    count: сколько соседей храним для каждого города
+    pi: штрафы вершин, alpha считается по весам c(i, j) + pi[i] + pi[j], cost - по исходным
+    return: indptr, indices, alpha, cost в формате CSR
+    """
+    size = adjacency.shape[0]
+    count = min(count, size - 1)
+    indptr = np.arange(0, size * count + 1, count) if count > 0 else np.zeros(size + 1, dtype=np.int64)
+    indices = np.zeros(size * count, dtype=np.int64)
+    alpha, cost = np.zeros(size * count), np.zeros(size * count)
+
+    for i in prange(size):
+        beta, mark = np.zeros(size), np.zeros(size, dtype=np.bool_)
+        _beta(adjacency, pi, parent, order, i, f_node, s_node, beta, mark)
+        start, found = i * count, 0
+        for j in range(size):
+            if i == j:
+                continue
+            a, c = adjacency[i, j] + pi[i] + pi[j] - beta[j], adjacency[i, j]
+            last = start + count - 1
+            if found == count and (a > alpha[last] or (a == alpha[last] and c >= cost[last])):
+                continue
+            idx = start + (found if found < count else count - 1)  # вставка в отсортированный список
+            while idx > start and (alpha[idx - 1] > a or (alpha[idx - 1] == a and cost[idx - 1] > c)):
+                alpha[idx], cost[idx], indices[idx] = alpha[idx - 1], cost[idx - 1], indices[idx - 1]
+                idx -= 1
+            alpha[idx], cost[idx], indices[idx] = a, c, j
+            found = min(found + 1, count)
+
+    return indptr.astype(np.int64), indices, alpha, cost
+
+
+def adjacency_matrix(points: np.ndarray, dtype=np.float64) -> np.ndarray:
+    """ Матрица смежности
+    points: координаты городов
+    dtype: тип весов [float64, float32, int32]; для целых расстояния округляются, как EUC_2D в TSPLIB
+    """
+    matrix = np.zeros(shape=(points.shape[0], points.shape[0]), dtype=dtype)
+    _adjacency_matrix(points, matrix, np.dtype(dtype).kind in 'iu')
+    return matrix
+
 
-    for i in range(1, size - 1):
-        for j in range(i + 1, size):
-            idx = ordered_nodes[i - 1]
-            idy = ordered_nodes[j - 1]
+@njit(parallel=True, cache=True)
+def _adjacency_matrix(points: np.ndarray, matrix: np.ndarray, rounded: bool) -> None:
+    size = points.shape[0]
+    for idx in prange(size):
+        for idy in range(idx + 1, size):
+            distance = sqrt((points[idy][0] - points[idx][0]) ** 2 + (points[idy][1] - points[idx][1]) ** 2)
+            matrix[idx][idy] = matrix[idy][idx] = floor(distance + 0.5) if rounded else distance
 
-            matrix[idx][idy] = matrix[idy][idx] = max(matrix[idx][topology[idy]], adjacency[idy][topology[idy]])
 
-    return adjacency - matrix
+def condensed_matrix(points: np.ndarray, rounded=False, dtype=None) -> CondensedMatrix:
+    """ Симметричная матрица смежности, хранится только верхний треугольник: n(n - 1) / 2 весов
+    points: координаты городов
+    rounded: округлять расстояния до целых, как EUC_2D в TSPLIB; по умолчанию тогда веса int32
+    dtype: тип весов [float64, float32, int32], по умолчанию float64; для целых расстояния округляются
+    """
+    size = points.shape[0]
+    dtype = np.dtype(dtype or (np.int32 if rounded else np.float64))
+    data = np.zeros(size * (size - 1) // 2, dtype=dtype)
+    _condensed_matrix(points, data, rounded or dtype.kind in 'iu')
+    return condensed(size, data)
 
 
 @njit(parallel=True, cache=True)
-def adjacency_matrix(points: np.ndarray) -> np.ndarray:
-    """ Матрица смежности """
+def _condensed_matrix(points: np.ndarray, data: np.ndarray, rounded: bool) -> None:
     size = points.shape[0]
-    matrix = np.zeros(shape=(size, size))
-    for idx in range(0, size):
+    for idx in prange(size):
+        start = idx * size - idx * (idx + 1) // 2 - idx - 1
         for idy in range(idx + 1, size):
             distance = sqrt((points[idy][0] - points[idx][0]) ** 2 + (points[idy][1] - points[idx][1]) ** 2)
-            matrix[idx][idy] = matrix[idy][idx] = distance
-    return matrix
+            data[start + idy] = floor(distance + 0.5) if rounded else distance
 
 
 @njit(parallel=True, cache=True)
 def savings_matrix(adjacency: np.ndarray, point: int) -> np.ndarray:
-    """ Матрица savings для Clarke-Wright """
-    matrix = np.zeros(shape=adjacency.shape)
+    """ Матрица savings для Clarke-Wright, тип весов как у adjacency """
+    matrix = np.zeros(shape=adjacency.shape, dtype=adjacency.dtype)
     for idx in range(0, matrix.shape[0]):
         for idy in range(idx + 1, matrix.shape[0]):
             savings = adjacency[point][idx] + matrix[point][idy] - matrix[idx][idy]
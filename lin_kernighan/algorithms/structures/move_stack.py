@@ -0,0 +1,101 @@
+import numba as nb
+import numpy as np
+
+from lin_kernighan.algorithms.utils.hash import update_hash
+
+
+@nb.njit
+def two_opt_move(tour, t1: int, t2: int, t3: int, t4: int) -> None:
+    """ Выполняем 2-opt на месте: удаляем ребра (t1, t2), (t3, t4), добавляем (t2, t3), (t4, t1)
+    Откат этого же хода: two_opt_move(tour, t1, t4, t3, t2)
+    tour: тур [ArrayTour, TreeTour]
+    t1, t2, t3, t4: города, после замены ребер получается один цикл
+    """
+    if tour.next(t1) == t2:
+        tour.reverse(t2, t4)  # ... t1 t2 ... t4 t3 ... -> ... t1 t4 ... t2 t3 ...
+    else:
+        tour.reverse(t4, t2)  # ... t3 t4 ... t2 t1 ... -> ... t3 t2 ... t4 t1 ...
+
+
+@nb.experimental.jitclass(spec=[
+    ('flips', nb.int64[:, :]),
+    ('depth', nb.int64),
+    ('removed', nb.int64[:, :]),
+    ('removed_count', nb.int64),
+    ('added', nb.int64[:, :]),
+    ('added_count', nb.int64),
+    ('hash', nb.int64)
+])
+class MoveStack:
+    """ Стек последовательного k-opt хода без аллокаций
+    flips: журнал выполненных 2-opt (t1, t2i, t2i+1, t2i+2), по нему делается откат
+    removed, added: удаленные и добавленные ребра, хранятся как (min, max)
+    hash: хеш текущего тура, пересчитывается за O(1) на каждый 2-opt и откат
+    Размеры фиксированы при создании, откат до сохраненного состояния - простое присваивание счетчиков
+    """
+
+    def __init__(self, k: int, h: int):
+        """
+        k: k-opt, максимальная глубина хода
+        h: хеш начального тура
+        """
+        capacity = 2 * k + 4
+        self.flips = np.zeros((capacity, 4), dtype=np.int64)
+        self.removed = np.zeros((capacity, 2), dtype=np.int64)
+        self.added = np.zeros((capacity, 2), dtype=np.int64)
+        self.depth = self.removed_count = self.added_count = 0
+        self.hash = h
+
+    def clear(self) -> None:
+        """ Сброс стека, тур при этом не трогается """
+        self.depth = self.removed_count = self.added_count = 0
+
+    def is_removed(self, x: int, y: int) -> bool:
+        """ Есть ли ребро (x, y) среди удаленных """
+        x, y = min(x, y), max(x, y)
+        for idx in range(self.removed_count):
+            if self.removed[idx, 0] == x and self.removed[idx, 1] == y:
+                return True
+        return False
+
+    def is_added(self, x: int, y: int) -> bool:
+        """ Есть ли ребро (x, y) среди добавленных """
+        x, y = min(x, y), max(x, y)
+        for idx in range(self.added_count):
+            if self.added[idx, 0] == x and self.added[idx, 1] == y:
+                return True
+        return False
+
+    def remove(self, x: int, y: int) -> None:
+        """ Запоминаем удаленное ребро (x, y), повторы не добавляются """
+        if not self.is_removed(x, y):
+            self.removed[self.removed_count, 0], self.removed[self.removed_count, 1] = min(x, y), max(x, y)
+            self.removed_count += 1
+
+    def add(self, x: int, y: int) -> None:
+        """ Запоминаем добавленное ребро (x, y), повторы не добавляются """
+        if not self.is_added(x, y):
+            self.added[self.added_count, 0], self.added[self.added_count, 1] = min(x, y), max(x, y)
+            self.added_count += 1
+
+    def apply(self, tour, t1: int, t2: int, t3: int, t4: int) -> None:
+        """ Выполняем 2-opt на месте: удаляем ребра (t1, t2), (t3, t4), добавляем (t2, t3), (t4, t1)
+        Ход записывается в журнал для rollback
+        tour: тур [ArrayTour, TreeTour]
+        t1, t2, t3, t4: города, прошедшие проверку на корректность
+        """
+        two_opt_move(tour, t1, t2, t3, t4)
+        self.flips[self.depth, 0], self.flips[self.depth, 1] = t1, t2
+        self.flips[self.depth, 2], self.flips[self.depth, 3] = t3, t4
+        self.depth += 1
+        self.hash = update_hash(self.hash, t1, t2, t3, t4)
+
+    def rollback(self, tour) -> None:
+        """ Откат последнего выполненного 2-opt
+        tour: тур [ArrayTour, TreeTour]
+        """
+        self.depth -= 1
+        t1, t2 = self.flips[self.depth, 0], self.flips[self.depth, 1]
+        t3, t4 = self.flips[self.depth, 2], self.flips[self.depth, 3]
+        two_opt_move(tour, t1, t4, t3, t2)
+        self.hash = update_hash(self.hash, t1, t4, t3, t2)
@@ -1,31 +1,119 @@
-from typing import Tuple, Dict
+from heapq import heappush, heappop
+from typing import Tuple, Set
 
 import numba as nb
 import numpy as np
-from scipy.sparse import coo_matrix
-from scipy.sparse.csgraph import minimum_spanning_tree
 
-from lin_kernighan.algorithms.structures.heap import Heap
 from lin_kernighan.algorithms.utils.utils import make_pair
 
+Edge = Tuple[int, int]
 
-def one_tree(adjacency_matrix: np.ndarray) -> Tuple[float, np.ndarray, np.ndarray]:
-    """ MST( все точки кроме нулевой ) + два ребра от нулевой вершины
-    return: длина графа, два массива в формате начало (lin_kernighan array) - конец (dst array)
+
+def one_tree(adjacency_matrix: np.ndarray, candidates: np.ndarray = None, pi: np.ndarray = None) \
+        -> Tuple[float, np.ndarray, np.ndarray, np.ndarray, int, int]:
+    """ MST( все точки кроме нулевой ) + два минимальных ребра от нулевой вершины
+    adjacency_matrix: матрица весов
+    candidates: списки соседей, пустое заполнено -1; если заданы, MST строится только по этим ребрам
+    pi: штрафы вершин, вес ребра c(i, j) + pi[i] + pi[j] считается на лету, матрица не меняется
+    return: длина one tree; parent - dad каждой вершины MST (-1 у корня 1 и у нулевой вершины);
+    order - вершины MST, каждая после своего dad; degree - степени вершин в one tree;
+    f_node, s_node - концы минимального и пред минимального ребер от нулевой вершины
+    """
+    pi = np.zeros(adjacency_matrix.shape[0]) if pi is None else pi
+    if candidates is None:
+        length, parent, order = _dense_prim(adjacency_matrix, pi)
+    else:
+        length, parent, order = _sparse_prim(adjacency_matrix, candidates, pi)
+    f_node, s_node, f_min, s_min = __search(adjacency_matrix, pi)
+    return length + f_min + s_min, parent, order, __degrees(parent, f_node, s_node), f_node, s_node
+
+
+@nb.njit(cache=True)
+def _dense_prim(adjacency_matrix: np.ndarray, pi: np.ndarray) -> Tuple[float, np.ndarray, np.ndarray]:
+    """ Алгоритм Прима на полном графе без нулевой вершины, с корнем в 1: O(n^2)
+    return: длина MST, parent, order
     """
-    # noinspection PyTypeChecker
-    coo: coo_matrix = minimum_spanning_tree(adjacency_matrix[1:, 1:]).tocoo()
-    src, dst, temp = coo.col + 1, coo.row + 1, coo.data.sum()
-    f_node, s_node, f_min, s_min = __search(adjacency_matrix)
-    return temp + f_min + s_min, np.append(src, [0, 0]), np.append(dst, [f_node, s_node])
+    size, length = adjacency_matrix.shape[0], 0.
+    parent, order = np.full(size, -1, dtype=np.int64), np.zeros(max(size - 1, 0), dtype=np.int64)
+    key, visited = np.full(size, np.inf), np.zeros(size, dtype=np.bool_)
+    if size < 2:
+        return length, parent, order
+    key[1], visited[0] = 0., True
+
+    for k in range(size - 1):
+        node, best = -1, np.inf
+        for idx in range(1, size):
+            if not visited[idx] and (node == -1 or key[idx] < best):
+                node, best = idx, key[idx]
+        visited[node], order[k] = True, node
+        if parent[node] != -1:
+            length += key[node]
+        for idx in range(1, size):
+            price = adjacency_matrix[node, idx] + pi[node] + pi[idx]
+            if not visited[idx] and price < key[idx]:
+                key[idx], parent[idx] = price, node
+    return length, parent, order
 
 
 @nb.njit(cache=True)
-def __search(adjacency_matrix: np.ndarray) -> tuple:
+def _sparse_prim(adjacency_matrix: np.ndarray, candidates: np.ndarray, pi: np.ndarray) \
+        -> Tuple[float, np.ndarray, np.ndarray]:
+    """ Алгоритм Прима по графу кандидатов без нулевой вершины, с корнем в 1: O(m log m)
+    Ребра кандидатов считаются неориентированными; если граф несвязный, очередная компонента
+    подвешивается к корню
+    return: длина MST, parent, order
+    """
+    size, length = adjacency_matrix.shape[0], 0.
+    parent, order = np.full(size, -1, dtype=np.int64), np.zeros(max(size - 1, 0), dtype=np.int64)
+    key, visited = np.full(size, np.inf), np.zeros(size, dtype=np.bool_)
+    if size < 2:
+        return length, parent, order
+
+    indptr = np.zeros(size + 1, dtype=np.int64)  # симметричный граф кандидатов в формате CSR
+    for i in range(size):
+        for j in candidates[i]:
+            if j != -1 and j != i:
+                indptr[i + 1] += 1
+                indptr[j + 1] += 1
+    indptr = np.cumsum(indptr)
+    indices, fill = np.zeros(indptr[-1], dtype=np.int64), indptr[:-1].copy()
+    for i in range(size):
+        for j in candidates[i]:
+            if j != -1 and j != i:
+                indices[fill[i]], indices[fill[j]] = j, i
+                fill[i] += 1
+                fill[j] += 1
+
+    heap, visited[0], k, start = [(0., 1)], True, 0, 1
+    while k < size - 1:
+        if len(heap) == 0:  # несвязный граф кандидатов
+            while visited[start]:
+                start += 1
+            parent[start], key[start] = 1, adjacency_matrix[start, 1] + pi[start] + pi[1]
+            heappush(heap, (key[start], start))
+        value, node = heappop(heap)
+        if visited[node]:
+            continue
+        visited[node], order[k] = True, node
+        k += 1
+        if parent[node] != -1:
+            length += key[node]
+        for idx in indices[indptr[node]:indptr[node + 1]]:
+            price = adjacency_matrix[node, idx] + pi[node] + pi[idx]
+            if not visited[idx] and price < key[idx]:
+                key[idx], parent[idx] = price, node
+                heappush(heap, (price, idx))
+    return length, parent, order
+
+
+@nb.njit(cache=True)
+def __search(adjacency_matrix: np.ndarray, pi: np.ndarray) -> tuple:
     f_node, s_node, f_min, s_min = -1, -1, np.inf, np.inf
-    for index, price in enumerate(adjacency_matrix[0]):
-        if 0 == index or not price > 0:
+    for index in range(1, adjacency_matrix.shape[0]):
+        value = adjacency_matrix[0, index]
+        if not value > 0:
             continue
+        price = value + pi[0] + pi[index]
         if price < f_min:
             s_node, s_min = f_node, f_min
             f_node, f_min = index, price
@@ -34,36 +122,32 @@ def __search(adjacency_matrix: np.ndarray) -> tuple:
     return f_node, s_node, f_min, s_min
 
 
-def one_tree_topology(adjacency_matrix: np.ndarray) -> Tuple[float, tuple, tuple, set, Dict[int, int]]:
-    """ build One tree
-    return: длина one tree; минимальное ребро; пред минмальное ребро; set ребер; словарь son -> dad для MST
-    """
-    size, k, length = adjacency_matrix.shape[0], 0, 0.0
-    topology: Dict[int, int] = {}
-    visited = np.zeros(size, dtype=bool)
-    heap, edges = Heap(), set()
-
-    def add(idx: int):
-        visited[idx] = True
-        for idy, value in enumerate(adjacency_matrix[idx]):
-            if not value > 0 or visited[idy] or idy == 0:
-                continue
-            heap.push((value, idx, idy))
-
-    add(1)
-    while k < size - 2:
-        was, price, src, dst = True, 0.0, 0, 0
-        while was:
-            price, src, dst = heap.pop()
-            was = visited[dst]
-        topology[dst] = src
-        edges.add(make_pair(dst, src))
-        add(dst)
-        length += adjacency_matrix[src][dst]
-        k += 1
+@nb.njit(cache=True)
+def __degrees(parent: np.ndarray, f_node: int, s_node: int) -> np.ndarray:
+    """ Степени вершин one tree """
+    degree = np.zeros(len(parent), dtype=np.int64)
+    for node in range(len(parent)):
+        if parent[node] != -1:
+            degree[node] += 1
+            degree[parent[node]] += 1
+    for node in (f_node, s_node):
+        if node != -1:
+            degree[0] += 1
+            degree[node] += 1
+    return degree
 
-    f_node, s_node, f_min, s_min = __search(adjacency_matrix)
 
-    edges.add(make_pair(0, f_node))
-    edges.add(make_pair(0, s_node))
-    return length + f_min + s_min, (f_node, f_min), (s_node, s_min), edges, topology
+@nb.njit(cache=True)
+def one_tree_edges(parent: np.ndarray, f_node: int, s_node: int) -> Set[Edge]:
+    """ Ребра one tree
+    return: set ребер (min, max)
+    """
+    edges = {(0, 0)}
+    edges.clear()
+    for node in range(len(parent)):
+        if parent[node] != -1:
+            edges.add(make_pair(node, parent[node]))
+    for node in (f_node, s_node):
+        if node != -1:
+            edges.add(make_pair(0, node))
+    return edges
@@ -0,0 +1,55 @@
+import numba as nb
+import numpy as np
+
+
+@nb.experimental.jitclass(spec=[
+    ('size', nb.int64),
+    ('indptr', nb.int64[:]),
+    ('indices', nb.int64[:]),
+    ('alpha', nb.float64[:]),
+    ('cost', nb.float64[:])
+])
+class SparseAlpha:
+    """ Разреженная альфа-матрица в формате CSR: для каждого города только лучшие по (alpha, cost, j) соседи
+    Строка i: indices[indptr[i]:indptr[i + 1]], в том же диапазоне alpha и cost, по возрастанию alpha.
+    Память O(n * k) вместо O(n^2); alpha[i] возвращает плотную строку, где неизвестное заполнено inf,
+    поэтому там, где строки альфа-матрицы только читаются, ее можно передавать вместо плотной
+    """
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, alpha: np.ndarray, cost: np.ndarray):
+        self.size = len(indptr) - 1
+        self.indptr, self.indices, self.alpha, self.cost = indptr, indices, alpha, cost
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        """ Плотная строка альфа-мер города i, O(n) """
+        row = np.full(self.size, np.inf)
+        for idx in range(self.indptr[i], self.indptr[i + 1]):
+            row[self.indices[idx]] = self.alpha[idx]
+        return row
+
+    def get(self, i: int, j: int) -> float:
+        """ Альфа-мера ребра (i, j), inf если ее нет среди лучших для i """
+        for idx in range(self.indptr[i], self.indptr[i + 1]):
+            if self.indices[idx] == j:
+                return self.alpha[idx]
+        return np.inf
+
+    def candidates(self, excess: float) -> np.ndarray:
+        """ Кандидаты с альфа-мерой меньше excess
+        return: матрица кандидатов [size * max(num of candidates for i)], пустое заполнено -1
+        """
+        width = 0
+        for i in range(self.size):
+            count = 0
+            for idx in range(self.indptr[i], self.indptr[i + 1]):
+                if self.alpha[idx] < excess:
+                    count += 1
+            width = max(width, count)
+        temp = np.full((self.size, width), -1, dtype=np.int64)
+        for i in range(self.size):
+            count = 0
+            for idx in range(self.indptr[i], self.indptr[i + 1]):
+                if self.alpha[idx] < excess:
+                    temp[i][count] = self.indices[idx]
+                    count += 1
+        return temp
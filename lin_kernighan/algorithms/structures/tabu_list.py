@@ -1,3 +1,4 @@
+from math import ceil, log
 from sys import maxsize
 from typing import Tuple
 
@@ -6,29 +7,210 @@ import numpy as np
 
 from lin_kernighan.algorithms.utils.hash import generate_hash
 
+_policies = dict(fifo=0, lru=1, bloom=2)
+
+
+@nb.njit(cache=True)
+def _mix(h: int) -> int:
+    """ Перемешивание хеша для второй функции Блума и выбора ячейки таблицы """
+    z = nb.uint64(h) * nb.uint64(0x9E3779B97F4A7C15)
+    return nb.int64(z ^ (z >> nb.uint64(29)))
+
+
+@nb.experimental.jitclass(spec=[
+    ('capacity', nb.int64),
+    ('policy', nb.int64),
+    ('mask', nb.int64),
+    ('keys', nb.int64[:]),
+    ('refs', nb.boolean[:]),
+    ('queue', nb.int64[:]),
+    ('log', nb.int64[:]),
+    ('head', nb.int64),
+    ('count', nb.int64),
+    ('bits', nb.uint64[:]),
+    ('functions', nb.int64),
+    ('hits', nb.int64),
+    ('inserts', nb.int64),
+    ('evicts', nb.int64)
+])
+class TabuStore:
+    """ Множество хешей туров ограниченного размера
+    fifo, lru: открытая адресация в плоском массиве, при переполнении вытесняется самый старый хеш
+    (lru - приближение часами: хеш, к которому обращались, получает второй шанс)
+    bloom: фильтр Блума, ложноположительные срабатывания возможны, при переполнении фильтр очищается
+    log: журнал последних capacity вставок в порядке добавления, при любой политике - для since
+    hits, inserts, evicts: счетчики попаданий, вставок и вытеснений
+    """
+
+    def __init__(self, capacity: int, policy: int, bits: int, functions: int):
+        """
+        capacity: сколько хешей храним
+        policy: 0 - fifo, 1 - lru, 2 - bloom
+        bits: размер фильтра Блума в битах (только для bloom)
+        functions: количество хеш-функций фильтра Блума (только для bloom)
+        """
+        self.capacity, self.policy, self.functions = capacity, policy, functions
+        size = 1
+        while size < 2 * capacity:
+            size <<= 1
+        if policy == 2:
+            size = 1
+        self.mask = size - 1
+        self.keys = np.zeros(size, dtype=np.int64)
+        self.refs = np.zeros(size, dtype=np.bool_)
+        self.queue = np.zeros(capacity if policy != 2 else 1, dtype=np.int64)
+        self.log = np.zeros(capacity, dtype=np.int64)
+        self.bits = np.zeros((bits + 63) // 64 if policy == 2 else 1, dtype=np.uint64)
+        self.head = self.count = 0
+        self.hits = self.inserts = self.evicts = 0
+
+    def __slot(self, h: int) -> int:
+        """ Ячейка таблицы с хешем h, или пустая ячейка, куда его можно положить """
+        idx = _mix(h) & self.mask
+        while self.keys[idx] != 0 and self.keys[idx] != h:
+            idx = (idx + 1) & self.mask
+        return idx
+
+    def __bloom(self, h: int, add: bool) -> bool:
+        """ Проверка (и добавление) хеша в фильтре Блума: двойное хеширование h + i * h2 """
+        size, h2, found = nb.uint64(len(self.bits) * 64), nb.uint64(_mix(h) | 1), True
+        for i in range(self.functions):
+            bit = (nb.uint64(h) + nb.uint64(i) * h2) % size
+            word, offset = bit >> nb.uint64(6), nb.uint64(1) << (bit & nb.uint64(63))
+            if not self.bits[word] & offset:
+                found = False
+                if add:
+                    self.bits[word] |= offset
+        return found
+
+    def contains(self, h: int) -> bool:
+        """ Есть ли хеш h """
+        h = h if h != 0 else 1  # ноль - пустая ячейка
+        if self.policy == 2:
+            found = self.__bloom(h, False)
+        else:
+            idx = self.__slot(h)
+            found = self.keys[idx] != 0
+            if found:
+                self.refs[idx] = True
+        if found:
+            self.hits += 1
+        return found
+
+    def add(self, h: int) -> bool:
+        """ Добавляем хеш h, при переполнении вытесняем старый
+        return: был ли хеш новым
+        """
+        h = h if h != 0 else 1
+        if self.policy == 2:
+            if self.__bloom(h, False):
+                return False
+            if self.count == self.capacity:
+                self.bits[:] = 0
+                self.evicts += self.count
+                self.count = 0
+            self.__bloom(h, True)
+        else:
+            if self.keys[self.__slot(h)] != 0:
+                return False
+            if self.count == self.capacity:
+                self.__evict()
+            self.keys[self.__slot(h)] = h
+            self.queue[(self.head + self.count) % self.capacity] = h
+        self.log[self.inserts % self.capacity] = h
+        self.count += 1
+        self.inserts += 1
+        return True
+
+    def __evict(self) -> None:
+        """ Вытесняем самый старый хеш из очереди, для lru пропускаем хеши со вторым шансом """
+        while True:
+            h = self.queue[self.head]
+            idx = self.__slot(h)
+            self.head = (self.head + 1) % self.capacity
+            if self.policy == 1 and self.refs[idx]:
+                self.refs[idx] = False
+                self.queue[(self.head + self.count - 1) % self.capacity] = h
+                continue
+            break
+        self.count -= 1
+        self.evicts += 1
+
+        self.keys[idx], self.refs[idx] = 0, False  # удаление со сдвигом назад, без надгробий
+        current = (idx + 1) & self.mask
+        while self.keys[current] != 0:
+            ideal = _mix(self.keys[current]) & self.mask
+            if (current - ideal) & self.mask >= (current - idx) & self.mask:
+                self.keys[idx], self.refs[idx] = self.keys[current], self.refs[current]
+                self.keys[current], self.refs[current] = 0, False
+                idx = current
+            current = (current + 1) & self.mask
+
+    def items(self) -> np.ndarray:
+        """ Хранимые хеши от старых к новым; для bloom хеши не хранятся - пустой список """
+        if self.policy == 2:
+            return np.zeros(0, dtype=np.int64)
+        temp = np.zeros(self.count, dtype=np.int64)
+        for idx in range(self.count):
+            temp[idx] = self.queue[(self.head + idx) % self.capacity]
+        return temp
+
+    def since(self, inserts: int) -> np.ndarray:
+        """ Хеши, добавленные после того, как счетчик вставок был равен inserts, по журналу log
+        Не зависит от вытеснения (lru переставляет очередь) и работает для bloom; не больше capacity последних
+        """
+        count = min(self.inserts - inserts, self.capacity)
+        temp = np.zeros(count, dtype=np.int64)
+        for idx in range(count):
+            temp[idx] = self.log[(self.inserts - count + idx) % self.capacity]
+        return temp
+
+    def update(self, items: np.ndarray) -> np.ndarray:
+        """ Добавляем список хешей
+        return: хеши, которых еще не было
+        """
+        fresh = np.zeros(len(items), dtype=np.int64)
+        count = 0
+        for h in items:
+            if self.add(h):
+                fresh[count] = h
+                count += 1
+        return fresh[:count]
+
+
+def tabu_store(**kwargs) -> TabuStore:
+    """ Создание хранилища хешей по параметрам
+    tabu_capacity: сколько хешей храним [int]
+    tabu_policy: что делать при переполнении [fifo, lru, bloom]
+    tabu_fp: допустимая доля ложноположительных срабатываний для bloom [float]
+    return: хранилище
+    """
+    capacity = kwargs.get('tabu_capacity', 100000)
+    policy = kwargs.get('tabu_policy', 'fifo')
+    fp = kwargs.get('tabu_fp', 1.e-6)
+    assert capacity > 0 and policy in _policies, 'bad tabu store'
+    bits = ceil(-capacity * log(fp) / log(2) ** 2)
+    functions = max(1, round(bits / capacity * log(2)))
+    return TabuStore(capacity, _policies[policy], bits, functions)
+
 
 @nb.experimental.jitclass(spec=[
-    ('data', nb.types.Set(nb.i8)),
+    ('data', TabuStore.class_type.instance_type),
     ('best_length', nb.float64),
     ('best_route', nb.int64[:])
 ])
 class TabuSet:
 
-    def __init__(self):
-        self.data = {1, 0}
-        self.data.clear()
+    def __init__(self, data: TabuStore):
+        self.data = data
         self.best_length = maxsize
         self.best_route = np.array([1] * 1, dtype=np.int64)
 
     def is_contains(self, item: np.ndarray) -> bool:
-        x = generate_hash(item)
-        if x in self.data:
-            return True
-        return False
+        return self.data.contains(generate_hash(item))
 
     def __add(self, item: np.ndarray) -> None:
-        x = generate_hash(item)
-        self.data.add(x)
+        self.data.add(generate_hash(item))
 
     def append(self, length: float, tour: np.ndarray) -> bool:
         if self.is_contains(tour):
@@ -38,5 +220,14 @@ class TabuSet:
             self.best_route, self.best_length = tour.copy(), length
         return True
 
+    def append_route(self, length: float, h: int, route) -> bool:
+        """ То же, что append, для уже посчитанного хеша h: тур [ArrayTour, TreeTour] копируется, только если он лучший
+        """
+        if not self.data.add(h):
+            return False
+        if length < self.best_length:
+            self.best_route, self.best_length = route.nodes().copy(), length
+        return True
+
     def best_tour(self) -> Tuple[float, np.ndarray]:
         return self.best_length, self.best_route.copy()
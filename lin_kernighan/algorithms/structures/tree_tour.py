@@ -1,182 +1,309 @@
-from __future__ import annotations
-
-import math
-from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from typing import List, Optional
-from typing import Tuple
-
-Point = Tuple[float, float]
-Edge = Tuple[int, int]
-
-
-class AbcTour(ABC):
-
-    def __len__(self) -> int:
-        """ Кол-во вершин """
-
-    def __getitem__(self, index: int):
-        """ Вершина по номеру в туре """
-
-    def __contains__(self, edge) -> bool:
-        """ Наличие ребра в туре """
-
-    @abstractmethod
-    def index(self, node) -> int:
-        """ Номер вершины в туре """
-
-    @abstractmethod
-    def around(self, node) -> tuple:
-        """ Предыдущая вершина и следующая текущей веришны """
-
-    @abstractmethod
-    def between(self, start, end, search) -> bool:
-        """ Находится ли вершина search между вершиной start и вершиной end """
-
-    @abstractmethod
-    def successor(self, index: int):
-        """ Следующий """
-
-    @abstractmethod
-    def predecessor(self, index: int):
-        """ Предыдущий """
-
-    @abstractmethod
-    def generate(self, broken: set, joined: set) -> Tuple[bool, list]:
-        """ Создаем новый тур, а потом проверяем его на целостность и наличие циклов
-        broken: удаляемые ребра
-        joined: добавляемые ребра
+from math import sqrt
+
+import numba as nb
+import numpy as np
+
+
+@nb.experimental.jitclass(spec=[
+    ('size', nb.int64),
+    ('count', nb.int64),
+    ('limit', nb.int64),
+    ('succ', nb.int64[:]),
+    ('pred', nb.int64[:]),
+    ('rank', nb.int64[:]),
+    ('parent', nb.int64[:]),
+    ('first', nb.int64[:]),
+    ('last', nb.int64[:]),
+    ('reversed', nb.boolean[:]),
+    ('seg_next', nb.int64[:]),
+    ('seg_prev', nb.int64[:]),
+    ('seg_rank', nb.int64[:]),
+    ('seg_size', nb.int64[:]),
+    ('buffer', nb.int64[:]),
+    ('seg_buffer', nb.int64[:]),
+    ('dirty', nb.boolean)
+])
+class TreeTour:
+    """ Тур в виде двухуровневого двусвязного списка
+    Тур разбит на ~sqrt(n) сегментов, у каждого сегмента есть бит переворота.
+    next, prev, between: O(1); reverse: O(sqrt(n))
+
+    Внутри сегмента вершины связаны succ/pred в порядке возрастания rank (от first к last),
+    если reversed сегмента выставлен, то по туру сегмент проходится от last к first.
+    Сами сегменты связаны seg_next/seg_prev в порядке тура, seg_rank - номер сегмента в туре.
+    """
+
+    def __init__(self, tour: np.ndarray):
+        self.size = len(tour)
+        self.limit = max(int(sqrt(self.size)), 1)  # желаемый размер сегмента
+        self.count = (self.size + self.limit - 1) // self.limit
+
+        self.succ = np.zeros(self.size, dtype=np.int64)
+        self.pred = np.zeros(self.size, dtype=np.int64)
+        self.rank = np.zeros(self.size, dtype=np.int64)
+        self.parent = np.zeros(self.size, dtype=np.int64)
+        self.buffer = np.zeros(self.size, dtype=np.int64)
+
+        self.first = np.zeros(self.count, dtype=np.int64)
+        self.last = np.zeros(self.count, dtype=np.int64)
+        self.reversed = np.zeros(self.count, dtype=np.bool_)
+        self.seg_next = np.zeros(self.count, dtype=np.int64)
+        self.seg_prev = np.zeros(self.count, dtype=np.int64)
+        self.seg_rank = np.zeros(self.count, dtype=np.int64)
+        self.seg_size = np.zeros(self.count, dtype=np.int64)
+        self.seg_buffer = np.zeros(self.count, dtype=np.int64)
+
+        self.dirty = False
+        self.__build(tour)
+
+    def __build(self, tour: np.ndarray) -> None:
+        """ Раскладываем тур по сегментам одинакового размера """
+        for idx in range(self.size):
+            node, segment = tour[idx], idx // self.limit
+            self.parent[node], self.rank[node] = segment, idx
+            self.succ[node], self.pred[node] = tour[(idx + 1) % self.size], tour[idx - 1]
+            if idx % self.limit == 0:
+                self.first[segment] = node
+            self.last[segment] = node
+
+        for segment in range(self.count):
+            self.reversed[segment] = False
+            self.seg_next[segment], self.seg_prev[segment] = (segment + 1) % self.count, (segment - 1) % self.count
+            self.seg_rank[segment] = segment
+            self.seg_size[segment] = min(self.limit, self.size - segment * self.limit)
+        self.dirty = False
+
+    def head(self, segment: int) -> int:
+        """ Первая по туру вершина сегмента """
+        return self.last[segment] if self.reversed[segment] else self.first[segment]
+
+    def tail(self, segment: int) -> int:
+        """ Последняя по туру вершина сегмента """
+        return self.first[segment] if self.reversed[segment] else self.last[segment]
+
+    def next(self, node: int) -> int:
+        """ Следующая по туру вершина """
+        segment = self.parent[node]
+        if node == self.tail(segment):
+            return self.head(self.seg_next[segment])
+        return self.pred[node] if self.reversed[segment] else self.succ[node]
+
+    def prev(self, node: int) -> int:
+        """ Предыдущая по туру вершина """
+        segment = self.parent[node]
+        if node == self.head(segment):
+            return self.tail(self.seg_prev[segment])
+        return self.succ[node] if self.reversed[segment] else self.pred[node]
+
+    def local(self, node: int) -> int:
+        """ Номер вершины внутри своего сегмента по порядку тура """
+        segment = self.parent[node]
+        if self.reversed[segment]:
+            return self.rank[self.last[segment]] - self.rank[node]
+        return self.rank[node] - self.rank[self.first[segment]]
+
+    def key(self, node: int) -> int:
+        """ Порядковый ключ вершины в туре, отсчитывается от сегмента с seg_rank = 0 """
+        return self.seg_rank[self.parent[node]] * self.size + self.local(node)
+
+    def between(self, start: int, end: int, search: int) -> bool:
+        """ Находится ли вершина search на пути start -> end (включительно) """
+        x, y, z = self.key(start), self.key(end), self.key(search)
+        if x <= y:
+            return x <= z <= y
+        return z >= x or z <= y
+
+    def reverse(self, start: int, end: int) -> None:
+        """ Переворот пути start -> end (включительно)
+        Если путь длиннее половины тура, переворачивается дополнение - получается тот же цикл
         """
-
-    @abstractmethod
-    def reverse(self, start, end) -> None:
-        """ Переворот куска тура """
-
-
-# TODO: перевороты
-
-
-@dataclass
-class Node:
-    predecessor: Optional[Node]
-    successor: Optional[Node]
-    value: int
-    reversed: bool = False
-
-
-@dataclass
-class Block:
-    start: int
-    end: int
-    start_node: Optional[Node]  # end node?
-    reversed: bool = False
-
-
-@dataclass
-class TreeTour(AbcTour):
-
-    def __init__(self, points: List[Point], order: List[int]):
-        self.size = len(points)
-        self.data = [Node(None, None, index) for index in range(self.size)]  # change value
-        self.block_size = int(math.sqrt(self.size))  # sizeof Block
-        self.blocks_length = self.block_size if self.block_size ** 2 == self.size else self.block_size + 1
-        self.blocks = [Block(0, 0, None)] * self.blocks_length
-
-        previous_node = self.data[order[-1]]
-        for node in order:
-            previous_node.successor = self.data[node]
-            self.data[node].predecessor = previous_node
-            previous_node = self.data[node]
-
-        counter = 0
-        for index in range(self.blocks_length):
-            self.blocks[index] = Block(
-                start=counter,
-                start_node=self.data[counter],  # фигово, что counter тут рассчитываю
-                end=self.size if (counter := counter + self.block_size) > self.size else counter,
-                reversed=False)
-
-    def __len__(self):
-        """ Кол-во вершин """
-        return self.size
-
-    def __getitem__(self, index: int) -> Node:
-        """ По индексу в туре """
-        index %= self.size
-        block_number = index // self.block_size
-        node_number = index % self.block_size
-        block = self.blocks[block_number]
-
-        counter = 0
-        node = block.start_node
-        while counter != node_number:
-            node = node.successor
-            counter += 1
-        return node
-
-    def __contains__(self, edge: Edge) -> bool:
-        """ Наличие ребра в туре """
-        pass
-
-    def index(self, node: Node) -> int:
-        """ Номер вершины в туре """
-        return self.data.index(node)
-
-    def around(self, node) -> Tuple[Node, Node]:
-        """ Предыдущая вершина и следующая текущей веришны """
-        return node.predecessor, node.predecessor
-
-    def predecessor(self, node: Node) -> Node:
-        """ Предыдущий """
-        return node.predecessor
-
-    def successor(self, node: Node) -> Node:
-        """ Следующий """
-        return node.successor
-
-    def between(self, start: Node, end: Node, search: Node) -> bool:
-        """  Находится ли вершина search между вершиной start и вершиной end """
-        found = False  # TODO: проверка на тур норм и его не надо reverse
-        while start.successor != end:  # TODO: проверка на зацикливание?
-            if start == search:
-                found = True
-            start = start.successor
-        return found
-
-    def head(self) -> Node:
-        return self.data[0]
-
-    def edges(self) -> List[Edge]:
-        """ Возвращает как список ребер """
-        head = self.head()
-        runner = head.successor
-        temp = []
-        while runner.value != head.value:
-            temp.append((runner.predecessor.value, runner.value))
-            runner = runner.successor
-        temp.append((runner.predecessor.value, runner.value))
-        return temp
-
-    def nodes(self) -> List[int]:
-        """ Список вершин в правильном порядке """
-        temp = [0] * self.size
-        i = 0
-        head = runner = self.head()
-        while runner.successor is not head:
-            temp[i] = runner.value
-            runner = runner.successor
-            i += 1
-        return temp
-
-    def generate(self, broken: set, joined: set) -> Tuple[bool, list]:
-        """ Создаем новый тур, а потом проверяем его на целостность и наличие циклов
-        broken: удаляемые ребра
-        joined: добавляемые ребра
+        if start == end or self.next(end) == start:
+            return
+
+        first, second = self.parent[start], self.parent[end]
+        distance = (self.seg_rank[second] - self.seg_rank[first]) % self.count
+        if distance == 0 and self.local(start) > self.local(end):
+            distance = self.count
+        if 2 * distance > self.count:
+            start, end = self.next(end), self.prev(start)
+
+        self.__reverse(start, end)
+        if self.dirty:
+            self.__build(self.nodes())
+
+    def __reverse(self, start: int, end: int) -> None:
+        """ Переворот пути: разрезаем крайние сегменты и переворачиваем цепочку сегментов """
+        first, second = self.parent[start], self.parent[end]
+        if first == second and self.local(start) <= self.local(end):
+            self.__reverse_inside(start, end)
+            return
+
+        if start != self.head(first):  # start должен стать первым в своем сегменте
+            before = self.local(start)
+            if before <= self.seg_size[first] - before and self.seg_prev[first] != second:
+                self.__move_back(self.head(first), self.prev(start), self.seg_prev[first])
+            else:
+                self.__move_front(start, self.tail(first), self.seg_next[first])
+                first = self.seg_next[first]
+                if first == second:
+                    self.__reverse_inside(start, end)
+                    return
+
+        if end != self.tail(second):  # end должен стать последним в своем сегменте
+            inside = self.local(end) + 1
+            if self.seg_size[second] - inside <= inside and self.seg_next[second] != first:
+                self.__move_front(self.next(end), self.tail(second), self.seg_next[second])
+            else:
+                self.__move_back(self.head(second), end, self.seg_prev[second])
+                second = self.seg_prev[second]
+
+        self.__reverse_segments(first, second)
+
+    def __reverse_inside(self, start: int, end: int) -> None:
+        """ Переворот пути внутри одного сегмента: O(размер сегмента) """
+        segment = self.parent[start]
+        u, v = (end, start) if self.reversed[segment] else (start, end)
+
+        count, node = 0, u
+        while True:
+            self.buffer[count] = node
+            count += 1
+            if node == v:
+                break
+            node = self.succ[node]
+
+        before = -1 if u == self.first[segment] else self.pred[u]
+        after = -1 if v == self.last[segment] else self.succ[v]
+        base = self.rank[u]
+
+        previous = before
+        for idx in range(count):
+            node = self.buffer[count - 1 - idx]
+            self.rank[node] = base + idx
+            self.pred[node] = previous
+            if previous != -1:
+                self.succ[previous] = node
+            previous = node
+        self.succ[previous] = after
+        if after != -1:
+            self.pred[after] = previous
+
+        if before == -1:
+            self.first[segment] = self.buffer[count - 1]
+        if after == -1:
+            self.last[segment] = self.buffer[0]
+
+    def __collect(self, start: int, end: int) -> int:
+        """ Собираем в buffer вершины пути start -> end
+        return: количество вершин
         """
-        # TODO: this shit
-        pass
-
-    def reverse(self, start, end) -> None:
-        """ Переворот куска тура """
-        # TODO: this shit
-        pass
+        count, node = 0, start
+        while True:
+            self.buffer[count] = node
+            count += 1
+            if node == end:
+                break
+            node = self.next(node)
+        return count
+
+    def __move_back(self, start: int, end: int, target: int) -> None:
+        """ Перенос начала сегмента start -> end в конец предыдущего сегмента target """
+        segment = self.parent[start]
+        new_head = self.next(end)
+        count = self.__collect(start, end)
+
+        if self.reversed[segment]:
+            self.last[segment] = new_head
+        else:
+            self.first[segment] = new_head
+        self.seg_size[segment] -= count
+
+        if self.reversed[target]:  # по туру конец сегмента это first
+            current = self.first[target]
+            for idx in range(count):
+                node = self.buffer[idx]
+                self.succ[node], self.pred[current] = current, node
+                self.rank[node], self.parent[node] = self.rank[current] - 1, target
+                current = node
+            self.first[target] = current
+        else:
+            current = self.last[target]
+            for idx in range(count):
+                node = self.buffer[idx]
+                self.pred[node], self.succ[current] = current, node
+                self.rank[node], self.parent[node] = self.rank[current] + 1, target
+                current = node
+            self.last[target] = current
+
+        self.seg_size[target] += count
+        if self.seg_size[target] > 4 * self.limit:
+            self.dirty = True
+
+    def __move_front(self, start: int, end: int, target: int) -> None:
+        """ Перенос конца сегмента start -> end в начало следующего сегмента target """
+        segment = self.parent[start]
+        new_tail = self.prev(start)
+        count = self.__collect(start, end)
+
+        if self.reversed[segment]:
+            self.first[segment] = new_tail
+        else:
+            self.last[segment] = new_tail
+        self.seg_size[segment] -= count
+
+        if self.reversed[target]:  # по туру начало сегмента это last
+            current = self.last[target]
+            for idx in range(count - 1, -1, -1):
+                node = self.buffer[idx]
+                self.pred[node], self.succ[current] = current, node
+                self.rank[node], self.parent[node] = self.rank[current] + 1, target
+                current = node
+            self.last[target] = current
+        else:
+            current = self.first[target]
+            for idx in range(count - 1, -1, -1):
+                node = self.buffer[idx]
+                self.succ[node], self.pred[current] = current, node
+                self.rank[node], self.parent[node] = self.rank[current] - 1, target
+                current = node
+            self.first[target] = current
+
+        self.seg_size[target] += count
+        if self.seg_size[target] > 4 * self.limit:
+            self.dirty = True
+
+    def __reverse_segments(self, first: int, second: int) -> None:
+        """ Переворот цепочки целых сегментов first -> second: O(количество сегментов) """
+        count, segment = 0, first
+        while True:
+            self.seg_buffer[count] = segment
+            count += 1
+            if segment == second:
+                break
+            segment = self.seg_next[segment]
+
+        before, after, base = self.seg_prev[first], self.seg_next[second], self.seg_rank[first]
+        previous = before
+        for idx in range(count):
+            segment = self.seg_buffer[count - 1 - idx]
+            self.seg_rank[segment] = (base + idx) % self.count
+            self.reversed[segment] = not self.reversed[segment]
+            self.seg_prev[segment], self.seg_next[previous] = previous, segment
+            previous = segment
+        self.seg_next[previous], self.seg_prev[after] = after, previous
+
+    def nodes(self) -> np.ndarray:
+        """ Список вершин в порядке тура """
+        tour = np.zeros(self.size, dtype=np.int64)
+        node = self.head(0)
+        for idx in range(self.size):
+            tour[idx] = node
+            node = self.next(node)
+        return tour
+
+    def indexes(self) -> np.ndarray:
+        """ Позиции вершин в списке nodes() """
+        tour, index = self.nodes(), np.zeros(self.size, dtype=np.int64)
+        for idx in range(self.size):
+            index[tour[idx]] = idx
+        return index
@@ -3,8 +3,13 @@ from typing import Tuple
 import numba as nb
 import numpy as np
 
+from lin_kernighan.algorithms.structures.active_queue import ActiveQueue
+from lin_kernighan.algorithms.structures.array_tour import ArrayTour
+from lin_kernighan.algorithms.structures.move_stack import two_opt_move
 from lin_kernighan.algorithms.utils.abc_opt import AbcOpt
-from lin_kernighan.algorithms.utils.utils import swap
+from lin_kernighan.algorithms.utils.candidates import neighbour_candidates
+from lin_kernighan.algorithms.utils.hash import update_hash
+from lin_kernighan.algorithms.utils.utils import swap, nearest_neighbours
 
 
 @nb.njit(cache=True)
@@ -16,24 +21,27 @@ def _search(matrix: np.ndarray, tour: np.ndarray, x: int, y: int, z: int) -> Tup
     return: Тип переворота, выигрыш
     """
     s = len(tour)
-    a, b, c, d, e, f = tour[x % s], tour[(x + 1) % s], tour[y % s], tour[(y + 1) % s], tour[z % s], tour[(z + 1) % s]
-    base = current_min = matrix[a][b] + matrix[c][d] + matrix[e][f]
-    gain, exchange = 0, -1
-
-    if current_min > (current := matrix[a][e] + matrix[c][d] + matrix[b][f]):  # 2-opt (a, e) (d, c) (b, f)
-        gain, exchange, current_min = base - current, 0, current
-    if current_min > (current := matrix[a][b] + matrix[c][e] + matrix[d][f]):  # 2-opt (a, b) (c, e) (d, f)
-        gain, exchange, current_min = base - current, 1, current
-    if current_min > (current := matrix[a][c] + matrix[b][d] + matrix[e][f]):  # 2-opt (a, c) (b, d) (e, f)
-        gain, exchange, current_min = base - current, 2, current
-    if current_min > (current := matrix[a][d] + matrix[e][c] + matrix[b][f]):  # 3-opt (a, d) (e, c) (b, f)
-        gain, exchange, current_min = base - current, 3, current
-    if current_min > (current := matrix[a][d] + matrix[e][b] + matrix[c][f]):  # 3-opt (a, d) (e, b) (c, f)
-        gain, exchange, current_min = base - current, 4, current
-    if current_min > (current := matrix[a][e] + matrix[d][b] + matrix[c][f]):  # 3-opt (a, e) (d, b) (c, f)
-        gain, exchange, current_min = base - current, 5, current
-    if current_min > (current := matrix[a][c] + matrix[b][e] + matrix[d][f]):  # 3-opt (a, c) (b, e) (d, f)
-        gain, exchange, current_min = base - current, 6, current
+    return __search(matrix, tour[x % s], tour[(x + 1) % s], tour[y % s], tour[(y + 1) % s], tour[z % s],
+                    tour[(z + 1) % s])
+
+
+@nb.njit(cache=True)
+def __search(matrix: np.ndarray, a: int, b: int, c: int, d: int, e: int, f: int) -> Tuple[int, float]:
+    """ Лучшая из семи замен для удаленных ребер (a, b), (c, d), (e, f), идущих по туру в этом порядке
+    return: Тип переворота, выигрыш
+    """
+    base = np.float64(matrix[a, b]) + matrix[c, d] + matrix[e, f]
+    moves = (np.float64(matrix[a, e]) + matrix[c, d] + matrix[b, f],  # 2-opt (a, e) (d, c) (b, f)
+             np.float64(matrix[a, b]) + matrix[c, e] + matrix[d, f],  # 2-opt (a, b) (c, e) (d, f)
+             np.float64(matrix[a, c]) + matrix[b, d] + matrix[e, f],  # 2-opt (a, c) (b, d) (e, f)
+             np.float64(matrix[a, d]) + matrix[e, c] + matrix[b, f],  # 3-opt (a, d) (e, c) (b, f)
+             np.float64(matrix[a, d]) + matrix[e, b] + matrix[c, f],  # 3-opt (a, d) (e, b) (c, f)
+             np.float64(matrix[a, e]) + matrix[d, b] + matrix[c, f],  # 3-opt (a, e) (d, b) (c, f)
+             np.float64(matrix[a, c]) + matrix[b, e] + matrix[d, f])  # 3-opt (a, c) (b, e) (d, f)
+    gain, exchange = 0., -1
+    for idx in range(7):
+        if base - moves[idx] > gain:
+            gain, exchange = base - moves[idx], idx
 
     return exchange, gain
 
@@ -66,6 +74,114 @@ def _exchange(tour: np.ndarray, best_exchange: int, nodes: tuple) -> np.ndarray:
     return tour
 
 
+@nb.njit
+def __choose_move(tour, matrix: np.ndarray, neighbours: np.ndarray, t1: int, first: bool) -> Tuple[int, float, tuple]:
+    """ Поиск замены 3-opt от города t1 по спискам соседей
+    Удаляем ребро (t1, t2), добавляем (t2, t3) при g1 > 0, удаляем ребро у t3 - (t3, t4),
+    добавляем (t4, t5) при g1 + g2 > 0, третье удаляемое ребро берется у t5.
+    Для тройки ребер лучшая из семи замен выбирается __search
+    tour: тур [ArrayTour, TreeTour]
+    matrix: матрица весов
+    neighbours: ближайшие соседи по возрастанию расстояния
+    t1: город, с которого начинать
+    first: первое найденное улучшение или лучшее
+    return: тип замены (-1, если нет), выигрыш, начала удаленных ребер (u, next(u)) в порядке тура
+    """
+    best_exchange, best_gain, best_nodes = -1, 1.e-10, (0, 0, 0)
+
+    for t2 in (tour.next(t1), tour.prev(t1)):  # оба ребра t1
+        u = t1 if t2 == tour.next(t1) else t2
+        for t3 in neighbours[t2]:
+            if t3 == -1:  # -1 - конец списка, вес до него не читаем
+                break
+            g1 = np.float64(matrix[t1, t2]) - matrix[t2, t3]  # выигрыш копим в float64 при любом типе весов
+            if not g1 > 1.e-10:  # соседи отсортированы
+                break
+            for t4 in (tour.next(t3), tour.prev(t3)):
+                v = t3 if t4 == tour.next(t3) else t4
+                for t5 in neighbours[t4]:
+                    if t5 == -1:
+                        break
+                    g2 = g1 + matrix[t3, t4] - matrix[t4, t5]
+                    if not g2 > 1.e-10:
+                        break
+                    for w in (t5, tour.prev(t5)):
+                        if u == v or v == w or u == w:
+                            continue
+                        nodes = (u, w, v) if tour.between(u, v, w) else (u, v, w)
+                        a, c, e = nodes
+                        exchange, gain = __search(matrix, a, tour.next(a), c, tour.next(c), e, tour.next(e))
+                        if gain > best_gain:
+                            best_exchange, best_gain, best_nodes = exchange, gain, nodes
+                            if first:
+                                return best_exchange, best_gain, best_nodes
+
+    return best_exchange, best_gain, best_nodes
+
+
+@nb.njit
+def __move(tour, exchange: int, a: int, b: int, c: int, d: int, e: int, f: int, h: int) -> int:
+    """ Замена exchange из __search на месте: одна, две или три 2-opt
+    tour: тур [ArrayTour, TreeTour], меняется на месте
+    a..f: концы удаленных ребер (a, b), (c, d), (e, f) до хода
+    h: хеш тура
+    return: хеш нового тура
+    """
+    if exchange == 0 or exchange == 3 or exchange == 4 or exchange == 5:
+        h = __flip(tour, a, b, f, e, h)  # a e..d c..b f
+        if exchange == 3 or exchange == 4:
+            h = __flip(tour, a, e, c, d, h)  # a d..e c..b f
+        if exchange == 4:
+            h = __flip(tour, e, c, f, b, h)  # a d..e b..c f
+        if exchange == 5:
+            h = __flip(tour, d, c, f, b, h)  # a e..d b..c f
+    elif exchange == 1 or exchange == 6:
+        h = __flip(tour, c, d, f, e, h)  # a b..c e..d f
+        if exchange == 6:
+            h = __flip(tour, a, b, e, c, h)  # a c..b e..d f
+    elif exchange == 2:
+        h = __flip(tour, a, b, d, c, h)  # a c..b d..e f
+    return h
+
+
+@nb.njit
+def __flip(tour, t1: int, t2: int, t3: int, t4: int, h: int) -> int:
+    """ 2-opt на месте вместе с хешем: удаляем (t1, t2), (t3, t4), добавляем (t2, t3), (t4, t1) """
+    two_opt_move(tour, t1, t2, t3, t4)
+    return update_hash(h, t1, t2, t3, t4)
+
+
+@nb.njit
+def _neighbours_improve(tour, matrix: np.ndarray, neighbours: np.ndarray, first: bool, h: int) -> Tuple[float, int]:
+    """ 3-opt по спискам ближайших соседей с очередью don't look bits: до локального минимума
+    В очереди лежат вершины, для которых стоит искать улучшение; после хода в нее возвращаются его концы.
+    Ход выполняется на месте 2-opt, позиции городов тур ведет сам
+    tour: тур [ArrayTour, TreeTour], меняется на месте
+    matrix: матрица весов
+    neighbours: ближайшие соседи по возрастанию расстояния
+    first: первое найденное улучшение или лучшее для вершины
+    h: хеш тура
+    return: выигрыш, хеш нового тура
+    """
+    queue, total = ActiveQueue(len(neighbours)), 0.
+    queue.fill(tour.nodes())
+
+    while len(queue) > 0:
+        t1 = queue.pop()
+        exchange, gain, nodes = __choose_move(tour, matrix, neighbours, t1, first)
+        if exchange == -1:
+            continue
+
+        a, c, e = nodes
+        touched = (a, tour.next(a), c, tour.next(c), e, tour.next(e))
+        h = __move(tour, exchange, touched[0], touched[1], touched[2], touched[3], touched[4], touched[5], h)
+        total += gain
+        for node in touched:
+            queue.push(node)
+
+    return total, h
+
+
 class ThreeOpt(AbcOpt):
     """ Локальный поиск: 3-opt
     Ищем три ребра, которые можно перецепить, чтобы уменьшить длину тура.
@@ -74,15 +190,33 @@ class ThreeOpt(AbcOpt):
     length: начальная длина тура
     tour: начальный тур
     matrix: матрица весов
+
+    backend: tour representation [array, tree], used with neighbours
+    neighbours: number of nearest neighbours, 0 - check all triples [int]
+    first: first improvement instead of best, only with neighbours [boolean]
+    points: coordinates of cities, candidates by kd-tree instead of matrix [np.ndarray]
+    quadrant: use quadrant neighbours, only with points [boolean]
+    compact: store candidates as int32 [boolean]
     """
 
     def __init__(self, length: float, tour: np.ndarray, matrix: np.ndarray, **kwargs):
         super().__init__(length, tour, matrix, **kwargs)
+        neighbours = kwargs.get('neighbours', 0)
+        self.first = kwargs.get('first', False)
+        self.neighbours = neighbour_candidates(self.matrix, neighbours, **kwargs) if neighbours > 0 else None
 
     def improve(self, **kwargs) -> float:
         """ Локальный поиск (поиск изменения + само изменение)
         return: выигрыш от локального поиска
         """
+        if self.neighbours is not None:  # сразу до локального минимума
+            gain, self.hash = _neighbours_improve(self.route, self.matrix, self.neighbours, self.first, self.hash)
+            if gain > 1.e-10:
+                self.length -= gain
+                if self.collector is not None:
+                    self.collector.update({'length': self.length, 'gain': gain})
+            return gain
+
         best_exchange, best_gain, best_nodes = self._improve(self.matrix, self.tour)
         if best_gain > 1.e-10:
             self.tour = _exchange(self.tour, best_exchange, best_nodes)
@@ -93,9 +227,23 @@ class ThreeOpt(AbcOpt):
         return 0.0
 
     @staticmethod
-    @nb.njit(cache=True)
-    def just_improve(length: float, tour: np.ndarray, matrix: np.ndarray) -> Tuple[float, np.ndarray]:
+    def just_improve(length: float, tour: np.ndarray, matrix: np.ndarray, neighbours=0, first=False) \
+            -> Tuple[float, np.ndarray]:
         """ Локальный поиск без сбора информации
+        neighbours: количество ближайших соседей, 0 - перебор всех троек
+        first: первое найденное улучшение или лучшее, только для neighbours
+        return: длина нового тура, новый тур
+        """
+        if neighbours > 0:
+            route = ArrayTour(tour.copy())
+            gain, _ = _neighbours_improve(route, matrix, nearest_neighbours(matrix, neighbours), first, 0)
+            return length - gain, route.nodes()
+        return ThreeOpt._just_improve(length, tour, matrix)
+
+    @staticmethod
+    @nb.njit(cache=True)
+    def _just_improve(length: float, tour: np.ndarray, matrix: np.ndarray) -> Tuple[float, np.ndarray]:
+        """ Полный перебор троек ребер: O(n^3) на каждое улучшение
         return: длина нового тура, новый тур
         """
         best_gain, size = 1., len(tour)
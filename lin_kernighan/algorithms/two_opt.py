@@ -3,8 +3,61 @@ from typing import Tuple
 import numba as nb
 import numpy as np
 
+from lin_kernighan.algorithms.structures.active_queue import ActiveQueue
+from lin_kernighan.algorithms.structures.array_tour import ArrayTour
 from lin_kernighan.algorithms.utils.abc_opt import AbcOpt
-from lin_kernighan.algorithms.utils.utils import swap
+from lin_kernighan.algorithms.utils.candidates import neighbour_candidates
+from lin_kernighan.algorithms.utils.hash import update_hash
+from lin_kernighan.algorithms.utils.utils import swap, nearest_neighbours
+
+
+@nb.njit
+def _neighbours_improve(tour, matrix: np.ndarray, neighbours: np.ndarray, first: bool, h: int) -> Tuple[float, int]:
+    """ 2-opt по спискам ближайших соседей с очередью don't look bits: до локального минимума
+    В очереди лежат вершины, для которых стоит искать улучшение; после хода в нее возвращаются его концы
+    tour: тур [ArrayTour, TreeTour], меняется на месте
+    matrix: матрица весов
+    neighbours: ближайшие соседи по возрастанию расстояния
+    first: первое найденное улучшение или лучшее для вершины
+    h: хеш тура
+    return: выигрыш, хеш нового тура
+    """
+    queue, total = ActiveQueue(len(neighbours)), 0.
+    queue.fill(tour.nodes())
+
+    while len(queue) > 0:
+        t1 = queue.pop()
+        best, start, end, touched = 1.e-10, -1, -1, (t1, t1, t1, t1)
+
+        for direction in range(2):  # t2 - следующая за t1 или предыдущая
+            t2 = tour.next(t1) if direction == 0 else tour.prev(t1)
+            for t3 in neighbours[t1]:
+                if t3 == -1:  # -1 - конец списка, вес до него не читаем
+                    break
+                g1 = np.float64(matrix[t1, t2]) - matrix[t1, t3]  # выигрыш копим в float64 при любом типе весов
+                if not g1 > 1.e-10:  # соседи отсортированы
+                    break
+                t4 = tour.next(t3) if direction == 0 else tour.prev(t3)
+                if t3 == t2 or t4 == t1:
+                    continue
+                gain = g1 + matrix[t3, t4] - matrix[t2, t4]
+                if gain > best:
+                    best, touched = gain, (t1, t2, t3, t4)
+                    start, end = (t2, t3) if direction == 0 else (t1, t4)
+                    if first:
+                        break
+            if first and start != -1:
+                break
+
+        if start == -1:
+            continue
+        tour.reverse(start, end)  # удаляем (t1, t2), (t3, t4), добавляем (t1, t3), (t2, t4)
+        h = update_hash(h, touched[0], touched[1], touched[3], touched[2])
+        total += best
+        for node in touched:
+            queue.push(node)
+
+    return total, h
 
 
 class TwoOpt(AbcOpt):
@@ -15,19 +68,39 @@ class TwoOpt(AbcOpt):
     length: начальная длина тура
     tour: начальный тур
     matrix: матрица весов
+
+    backend: tour representation [array, tree]
+    neighbours: number of nearest neighbours, 0 - check all pairs [int]
+    first: first improvement instead of best, only with neighbours [boolean]
+    points: coordinates of cities, candidates by kd-tree instead of matrix [np.ndarray]
+    quadrant: use quadrant neighbours, only with points [boolean]
+    compact: store candidates as int32 [boolean]
     """
 
     def __init__(self, length: float, tour: np.ndarray, matrix: np.ndarray, **kwargs):
         super().__init__(length, tour, matrix, **kwargs)
+        neighbours = kwargs.get('neighbours', 0)
+        self.first = kwargs.get('first', False)
+        self.neighbours = neighbour_candidates(self.matrix, neighbours, **kwargs) if neighbours > 0 else None
 
     def improve(self) -> float:
         """ Локальный поиск (поиск изменения + само изменение)
         return: выигрыш от локального поиска
         """
-        saved, best_change = self._improve(self.matrix, self.tour)
+        if self.neighbours is not None:  # сразу до локального минимума
+            gain, self.hash = _neighbours_improve(self.route, self.matrix, self.neighbours, self.first, self.hash)
+            if gain > 1.e-10:
+                self.length -= gain
+                if self.collector is not None:
+                    self.collector.update({'length': self.length, 'gain': gain})
+            return gain
+
+        tour = self.tour
+        saved, best_change = self._improve(self.matrix, tour)
         if best_change < 0:
             i, j = saved
-            self.tour = swap(self.tour, i + 1, j)
+            self.route.reverse(tour[i + 1], tour[j])
+            self.hash = update_hash(self.hash, tour[i], tour[i + 1], tour[(j + 1) % self.size], tour[j])
             self.length += best_change
             if self.collector is not None:
                 self.collector.update({'length': self.length, 'gain': -best_change})
@@ -35,9 +108,24 @@ class TwoOpt(AbcOpt):
         return 0.0
 
     @staticmethod
-    @nb.njit(cache=True)
-    def just_improve(length: float, tour: np.ndarray, matrix: np.ndarray) -> Tuple[float, np.ndarray]:
+    def just_improve(length: float, tour: np.ndarray, matrix: np.ndarray, neighbours=0, first=False) \
+            -> Tuple[float, np.ndarray]:
         """ Локальный поиск без сбора информации
+        neighbours: количество ближайших соседей, 0 - перебор всех пар
+        first: первое найденное улучшение или лучшее, только для neighbours
+        return: длина нового тура, новый тур
+        """
+        if neighbours > 0:
+            route = ArrayTour(tour.copy())
+            gain, _ = _neighbours_improve(route, matrix, nearest_neighbours(matrix, neighbours), first, 0)
+            length -= gain
+            return length, route.nodes()
+        return TwoOpt._just_improve(length, tour, matrix)
+
+    @staticmethod
+    @nb.njit(cache=True)
+    def _just_improve(length: float, tour: np.ndarray, matrix: np.ndarray) -> Tuple[float, np.ndarray]:
+        """ Полный перебор пар ребер: O(n^2) на каждое улучшение
         return: длина нового тура, новый тур
         """
         best_change, size = 1., len(tour)
@@ -49,7 +137,7 @@ class TwoOpt(AbcOpt):
                 for it3 in range(it1 + 1, size):
                     t1, t2 = tour[it1 % size], tour[(it1 + 1) % size]
                     t3, t4 = tour[it3 % size], tour[(it3 + 1) % size]
-                    change = (matrix[t1][t2] + matrix[t3][t4]) - (matrix[t1][t3] + matrix[t2][t4])
+                    change = np.float64(matrix[t1, t2]) + matrix[t3, t4] - matrix[t1, t3] - matrix[t2, t4]
                     if best_change < change:
                         best_change = change
                         x, y = it1, it3
@@ -75,8 +163,8 @@ class TwoOpt(AbcOpt):
             for m in range(n + 1, size):
                 i, j = tour[n % size], tour[m % size]
                 x, y = tour[(n + 1) % size], tour[(m + 1) % size]
-                change = matrix[i][j] + matrix[x][y]
-                change -= matrix[i][x] + matrix[j][y]
+                change = np.float64(matrix[i, j]) + matrix[x, y]
+                change -= np.float64(matrix[i, x]) + matrix[j, y]
                 if change < best_change:
                     best_change = change
                     saved = (n, m)
@@ -1,14 +1,23 @@
 import logging
 from abc import ABC, abstractmethod
-from typing import Set, Tuple, Optional
+from copy import copy
+from typing import Tuple, Optional
 
 import numpy as np
 
+from lin_kernighan.algorithms.structures.active_queue import ActiveQueue
+from lin_kernighan.algorithms.structures.array_tour import ArrayTour
 from lin_kernighan.algorithms.structures.collector import Collector
-from lin_kernighan.algorithms.structures.tabu_list import TabuSet
+from lin_kernighan.algorithms.structures.condensed import condensed, condensed_types
+from lin_kernighan.algorithms.structures.distance import DistanceProvider
+from lin_kernighan.algorithms.structures.tabu_list import TabuSet, tabu_store
+from lin_kernighan.algorithms.structures.tree_tour import TreeTour
 from lin_kernighan.algorithms.utils.hash import generate_hash
+from lin_kernighan.algorithms.utils.shared import SharedMemoryPool
 from lin_kernighan.algorithms.utils.utils import get_length
 
+_backends = dict(array=ArrayTour, tree=TreeTour)
+
 
 class AbcOpt(ABC):
     """ Абстрактный класс, описывающий методы локального поиска
@@ -18,11 +27,16 @@ class AbcOpt(ABC):
         """
         length: Текущая длина тура
         tour: Список городов
-        adjacency: Матрица весов
+        adjacency: Матрица весов [np.ndarray, CondensedMatrix, DistanceProvider]
+        backend: представление тура [array, tree]
+        tabu_capacity, tabu_policy, tabu_fp: размер и вид хранилища пройденных туров, см. tabu_store
         """
         logging.info('initialization')
-        self.length, self.tour, self.matrix = length, tour, adjacency
-        self.solutions: Set[int] = {generate_hash(self.tour)}
+        self.backend = kwargs.get('backend', 'array')
+        self.length, self.tour, self.matrix = length, tour, adjacency  # тур хранится в self.route
+        self.tabu = {key: kwargs[key] for key in ('tabu_capacity', 'tabu_policy', 'tabu_fp') if key in kwargs}
+        self.solutions = tabu_store(**self.tabu)
+        self.solutions.add(self.hash)
         self.size = len(tour)
         collect = kwargs.get('collect', False)
 
@@ -31,6 +45,63 @@ class AbcOpt(ABC):
         if collect:
             self.collector.update({'length': self.length, 'gain': 0})
 
+    @property
+    def tour(self) -> np.ndarray:
+        """ Список городов """
+        return self.route.nodes()
+
+    @tour.setter
+    def tour(self, tour: np.ndarray) -> None:
+        """ Новый тур: представление route [ArrayTour, TreeTour] и хеш hash считаются заново за O(n),
+        все города снова в очереди активных queue. дальше хеш пересчитывается по измененным ребрам хода.
+        Тур копируется: ходы меняют route на месте и не должны менять переданный массив
+        """
+        self.route = _backends[self.backend](tour.copy())
+        self.hash = generate_hash(tour)
+        self.queue = ActiveQueue(len(tour))
+        self.queue.fill(tour)
+
+    @property
+    def index(self) -> np.ndarray:
+        """ Позиции городов в туре: index[город] """
+        return self.route.indexes()
+
+    def __getstate__(self) -> dict:
+        """ jitclass не сериализуется, поэтому передаем тур и хеши массивами """
+        state = self.__dict__.copy()
+        state['route'], state['solutions'] = self.tour, self.solutions.items()
+        del state['queue']  # восстанавливается вместе с туром
+        if isinstance(self.matrix, DistanceProvider):
+            state['matrix'] = ('distance', self.matrix.points, self.matrix.kind, self.matrix.neighbours,
+                               self.matrix.distances)
+        if isinstance(self.matrix, condensed_types):
+            state['matrix'] = ('condensed', self.matrix.size, self.matrix.data)
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.tour = state['route']
+        self.solutions = tabu_store(**self.tabu)
+        self.solutions.update(state['solutions'])
+        if isinstance(self.matrix, tuple) and self.matrix[0] == 'distance':
+            _, points, kind, neighbours, distances = self.matrix
+            self.matrix = DistanceProvider(points, kind)
+            self.matrix.neighbours, self.matrix.distances = neighbours, distances
+        if isinstance(self.matrix, tuple) and self.matrix[0] == 'condensed':
+            self.matrix = condensed(*self.matrix[1:])
+
+    def shared(self, pool: SharedMemoryPool) -> 'AbcOpt':
+        """ Копия для передачи в процессы: матрица весов, кандидаты и альфа-матрица лежат в разделяемой памяти
+        и при сериализации передаются по имени блока, а не копируются
+        pool: владелец блоков, копию нельзя использовать после pool.close()
+        """
+        opt = copy(self)
+        for key in ('matrix', 'neighbours', 'candidates', '_alpha'):
+            value = getattr(opt, key, None)
+            if isinstance(value, np.ndarray):
+                setattr(opt, key, pool.share(value))
+        return opt
+
     @abstractmethod
     def improve(self) -> float:
         """ Локальный поиск (поиск изменения + само изменение)
@@ -39,6 +110,7 @@ class AbcOpt(ABC):
 
     def optimize(self) -> Tuple[float, np.ndarray]:
         """ Запуск локального поиска
+        Длина и хеш тура ведутся по ходам, тур целиком проверяется только в конце
         return: длина, список городов
         """
         gain, iteration = 1, 0
@@ -50,16 +122,13 @@ class AbcOpt(ABC):
                 logging.info(f'{iteration} : {self.length}')
                 iteration += 1
 
-            h = generate_hash(self.tour)
-            if h in self.solutions:
+            if not self.solutions.add(self.hash):
                 break
-            else:
-                self.solutions.add(h)
-
-            assert round(get_length(self.tour, self.matrix), 2) == round(self.length, 2), \
-                f'{get_length(self.tour, self.matrix)} != {self.length}'
 
-        return self.length, self.tour
+        tour = self.tour
+        assert round(get_length(tour, self.matrix), 2) == round(self.length, 2), \
+            f'{get_length(tour, self.matrix)} != {self.length}'
+        return self.length, tour
 
     def meta_heuristic_optimize(self, tabu_list: TabuSet, collector: Optional[Collector]) -> Tuple[float, np.ndarray]:
         """ Запуск локального поиска под управление некоторой метаэвристики
@@ -74,11 +143,11 @@ class AbcOpt(ABC):
             gain = self.improve()
 
             if gain > 1.e-10:
-                if not self.tabu_list.append(self.length, self.tour):
+                if not self.tabu_list.append_route(self.length, self.hash, self.route):
                     break
                 logging.info(self.length)
 
-            assert round(get_length(self.tour, self.matrix), 2) == round(self.length, 2), \
-                f'{get_length(self.tour, self.matrix)} != {self.length}'
-
-        return self.length, self.tour
+        tour = self.tour
+        assert round(get_length(tour, self.matrix), 2) == round(self.length, 2), \
+            f'{get_length(tour, self.matrix)} != {self.length}'
+        return self.length, tour
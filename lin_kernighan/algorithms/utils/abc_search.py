@@ -4,7 +4,7 @@ from typing import Tuple
 import numpy as np
 
 from lin_kernighan.algorithms.structures.collector import Collector
-from lin_kernighan.algorithms.structures.tabu_list import TabuSet
+from lin_kernighan.algorithms.structures.tabu_list import TabuSet, tabu_store
 from lin_kernighan.algorithms.utils.initial_tour import greedy
 
 
@@ -18,7 +18,7 @@ class AbcSearch(ABC):
         collect = kwargs.get('collect', False)
         self.collector = None if not collect else Collector(['length', 'gain'], {'lkh_search': len(self.tour)})
 
-        self.data = TabuSet()
+        self.data = TabuSet(tabu_store(**kwargs))
         self.data.append(self.length, self.tour)
 
     @abstractmethod
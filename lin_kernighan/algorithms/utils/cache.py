@@ -0,0 +1,78 @@
+import os
+from hashlib import blake2b
+from typing import Dict, Optional
+
+import numpy as np
+
+
+def fingerprint(data: np.ndarray, **params) -> str:
+    """ Отпечаток задачи: хеш координат или матрицы весов и параметров предподсчета
+    data: координаты городов или матрица весов
+    params: параметры, от которых зависит результат; массивы хешируются по содержимому
+    return: hex-строка
+    """
+    digest = blake2b(digest_size=20)
+    data = np.ascontiguousarray(data)
+    digest.update(f'{data.dtype}{data.shape}'.encode())
+    digest.update(data.tobytes())
+    for key in sorted(params):
+        value = params[key]
+        if isinstance(value, np.ndarray):
+            value = blake2b(np.ascontiguousarray(value).tobytes(), digest_size=20).hexdigest()
+        digest.update(f'{key}={value};'.encode())
+    return digest.hexdigest()
+
+
+class InstanceCache:
+    """ Кеш предподсчитанных массивов на диске: один .npz на отпечаток задачи
+    При превышении размера удаляются давно не использованные файлы (LRU по времени последнего доступа)
+    """
+
+    def __init__(self, directory: str, capacity: int = 1 << 30):
+        """
+        directory: папка кеша, создается при необходимости
+        capacity: максимальный суммарный размер файлов в байтах
+        """
+        self.directory, self.capacity = directory, capacity
+        os.makedirs(directory, exist_ok=True)
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.npz')
+
+    def load(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        """ Массивы по отпечатку или None, если их нет или файл поврежден """
+        path = self.__path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError, EOFError):
+            return None
+        os.utime(path)  # отмечаем использование для LRU
+        return arrays
+
+    def save(self, key: str, **arrays: np.ndarray) -> None:
+        """ Сохраняем массивы по отпечатку: пишем во временный файл и атомарно переименовываем """
+        path = self.__path(key)
+        temp = f'{path}.{os.getpid()}.tmp'
+        with open(temp, 'wb') as file:
+            np.savez(file, **arrays)
+        os.replace(temp, path)
+        self.evict()
+
+    def evict(self) -> None:
+        """ Удаляем самые старые по доступу файлы, пока кеш больше capacity """
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                stat = os.stat(os.path.join(self.directory, name))
+                files.append((stat.st_mtime, stat.st_size, name))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for _, size, name in files:
+            if total <= self.capacity:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:  # удален другим процессом
+                pass
+            total -= size
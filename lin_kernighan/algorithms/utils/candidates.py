@@ -0,0 +1,160 @@
+import numba as nb
+import numpy as np
+from scipy.spatial import Delaunay
+
+from lin_kernighan.algorithms.structures.distance import is_planar
+from lin_kernighan.algorithms.structures.kd_tree import KDTree
+from lin_kernighan.algorithms.utils.utils import nearest_neighbours
+
+
+@nb.njit
+def nearest_candidates(points: np.ndarray, count: int) -> np.ndarray:
+    """ Ближайшие соседи каждой вершины по координатам: O(n log n) через KD-дерево
+    points: координаты городов
+    count: сколько соседей отбираем
+    return: матрица соседей [size * count], по возрастанию расстояния
+    """
+    size = len(points)
+    count = min(count, size - 1)
+    tree, neighbours = KDTree(points), np.zeros((size, count), dtype=np.int64)
+    for node in range(size):
+        neighbours[node] = tree.nearest(node, count, -1)
+    return neighbours
+
+
+@nb.njit
+def quadrant_candidates(points: np.ndarray, count: int) -> np.ndarray:
+    """ Квадрантные соседи, как в LKH: по count // 4 ближайших из каждой четверти вокруг вершины,
+    оставшиеся места добираются просто ближайшими
+    points: координаты городов
+    count: сколько соседей отбираем
+    return: матрица соседей [size * count], по возрастанию расстояния
+    """
+    size = len(points)
+    count = min(count, size - 1)
+    tree, neighbours = KDTree(points), np.zeros((size, count), dtype=np.int64)
+    chosen = np.zeros(size, dtype=np.bool_)
+    dist = np.zeros(count, dtype=np.float64)
+
+    for node in range(size):
+        found = 0
+        for quadrant in range(4):
+            for other in tree.nearest(node, max(count // 4, 1), quadrant):
+                if found < count and not chosen[other]:
+                    neighbours[node][found], chosen[other] = other, True
+                    found += 1
+        if found < count:
+            for other in tree.nearest(node, count, -1):
+                if found < count and not chosen[other]:
+                    neighbours[node][found], chosen[other] = other, True
+                    found += 1
+
+        for idx in range(count):
+            other = neighbours[node][idx]
+            chosen[other] = False
+            dx, dy = points[other, 0] - points[node, 0], points[other, 1] - points[node, 1]
+            dist[idx] = dx * dx + dy * dy
+        neighbours[node] = neighbours[node][np.argsort(dist)]
+    return neighbours
+
+
+@nb.njit(cache=True)
+def __delaunay_rows(points: np.ndarray, indptr: np.ndarray, indices: np.ndarray, second: bool) -> np.ndarray:
+    """ Матрица кандидатов по графу Делоне в формате vertex_neighbor_vertices
+    Ширина строк - наибольшее число кандидатов у вершины: первый проход считает их, второй заполняет строки
+    points: координаты городов
+    indptr, indices: соседи вершины i - indices[indptr[i]:indptr[i + 1]]
+    second: добавлять соседей соседей
+    return: матрица кандидатов [size * max степень], по возрастанию расстояния, пустое заполнено -1
+    """
+    size = len(points)
+    mark, buffer, width = np.full(size, -1, dtype=np.int64), np.zeros(size, dtype=np.int64), 1
+    for node in range(size):
+        width = max(width, __neighbourhood(indptr, indices, node, second, mark, buffer))
+
+    rows, dist = np.full((size, width), -1, dtype=np.int64), np.zeros(width, dtype=np.float64)
+    mark[:] = -1
+    for node in range(size):
+        found = __neighbourhood(indptr, indices, node, second, mark, buffer)
+        for idx in range(found):
+            dx, dy = points[buffer[idx], 0] - points[node, 0], points[buffer[idx], 1] - points[node, 1]
+            dist[idx] = dx * dx + dy * dy
+        rows[node][:found] = buffer[:found][np.argsort(dist[:found])]
+    return rows
+
+
+@nb.njit(cache=True)
+def __neighbourhood(indptr: np.ndarray, indices: np.ndarray, node: int, second: bool, mark: np.ndarray,
+                    buffer: np.ndarray) -> int:
+    """ Соседи вершины node по графу Делоне без повторов, со вторым порядком - и соседи соседей
+    mark: mark[other] == node - other уже взят
+    buffer: куда записываем соседей, размер - количество вершин
+    return: сколько соседей записано
+    """
+    found, mark[node] = 0, node
+    for idx in range(indptr[node], indptr[node + 1]):
+        other = indices[idx]
+        if mark[other] != node:
+            buffer[found], mark[other] = other, node
+            found += 1
+    if second:
+        for first in range(found):
+            neighbour = buffer[first]
+            for idx in range(indptr[neighbour], indptr[neighbour + 1]):
+                other = indices[idx]
+                if mark[other] != node:
+                    buffer[found], mark[other] = other, node
+                    found += 1
+    return found
+
+
+def delaunay_candidates(points: np.ndarray, second=False) -> np.ndarray:
+    """ Кандидаты по триангуляции Делоне: в среднем 6 соседей на вершину, O(n log n)
+    Граф Делоне содержит минимальное остовное дерево и большую часть ребер оптимального тура
+    points: координаты городов
+    second: добавлять соседей соседей
+    return: матрица кандидатов [size * max степень], по возрастанию расстояния, пустое заполнено -1
+    """
+    points = np.ascontiguousarray(points, dtype=np.float64)
+    try:
+        triangulation = Delaunay(points)
+    except RuntimeError:  # меньше трех точек или все на одной прямой
+        return nearest_candidates(points, 6)
+    indptr, indices = triangulation.vertex_neighbor_vertices
+    indptr, indices = indptr.astype(np.int64), indices.astype(np.int64)
+
+    if len(triangulation.coplanar) > 0:  # совпадающие точки не попадают в триангуляцию, связываем их с вершиной
+        extra = [[] for _ in range(len(points))]
+        for node, _, vertex in triangulation.coplanar:
+            extra[node] += [vertex] + list(indices[indptr[vertex]:indptr[vertex + 1]])
+            extra[vertex] += [node]
+        lists = [list(indices[indptr[i]:indptr[i + 1]]) + extra[i] for i in range(len(points))]
+        indptr = np.cumsum([0] + [len(row) for row in lists]).astype(np.int64)
+        indices = np.array([j for row in lists for j in row], dtype=np.int64)
+
+    return __delaunay_rows(points, indptr, indices, second)
+
+
+def neighbour_candidates(matrix: np.ndarray, count: int, **kwargs) -> np.ndarray:
+    """ Кандидаты для локального поиска: по координатам, если они есть, иначе по матрице весов
+    matrix: матрица весов [np.ndarray, DistanceProvider]
+    count: сколько соседей отбираем
+    points: координаты городов, для плоского DistanceProvider берутся из него [np.ndarray]
+    quadrant: квадрантные соседи вместо ближайших, только с points [boolean]
+    delaunay: соседи по графу Делоне вместо ближайших, count не используется, только с points [boolean]
+    second: добавлять соседей соседей по графу Делоне [boolean]
+    compact: int32 вместо int64 [boolean]
+    return: матрица соседей [size * count], по возрастанию расстояния, пустое заполнено -1
+    """
+    points = kwargs.get('points', None)
+    if points is None and is_planar(matrix):
+        points = matrix.points
+    if points is None:
+        candidates = nearest_neighbours(matrix, count)
+    elif kwargs.get('delaunay', False):
+        candidates = delaunay_candidates(np.ascontiguousarray(points, dtype=np.float64), kwargs.get('second', False))
+    elif kwargs.get('quadrant', False):
+        candidates = quadrant_candidates(np.ascontiguousarray(points, dtype=np.float64), count)
+    else:
+        candidates = nearest_candidates(np.ascontiguousarray(points, dtype=np.float64), count)
+    return candidates.astype(np.int32) if kwargs.get('compact', False) else candidates
@@ -3,138 +3,152 @@ from typing import Tuple
 import numba as nb
 import numpy as np
 
+from lin_kernighan.algorithms.structures.move_stack import two_opt_move
+
 
 @nb.njit(cache=True)
-def double_bridge(tour: np.ndarray, matrix: np.ndarray, candidates: np.ndarray, fast: bool) -> Tuple[float, np.ndarray]:
-    """ Двойной мост - непоследовательный 4-opt, вариант с передачей кандидатов значительно быстрее
+def find_double_bridge(tour: np.ndarray, index: np.ndarray, matrix: np.ndarray, candidates: np.ndarray,
+                       fast: bool) -> Tuple[float, tuple]:
+    """ Поиск двойного моста без построения нового тура
+    Мост x < y < z < w состоит из двух пар разрезов (x, z) и (y, w): каждая пара по отдельности рвет тур на два
+    цикла, а выигрыш моста - сумма выигрышей пар. Поэтому сначала собираем пары, затем ищем две
+    перекрещивающиеся с наибольшей суммой, перебирая их по убыванию выигрыша.
     tour: список городов
+    index: позиции городов в туре
     matrix: матрица весов
     candidates: матрица кандидатов, если не будет использоваться candidates = матрица [2, 2] (для numba)
     fast: возвращать первое же возможное решение
-    return: выигрыш, новый тур
+    return: выигрыш, позиции (x, y, z, w) в tour
     """
     if len(candidates) == 2:
-        best_gain, exchange = __find_full(tour, matrix, fast)
+        lo, hi, gains = __full_pairs(tour, matrix)
     else:
-        best_gain, exchange = __find_neighbours(tour, matrix, candidates, fast)
-
-    if best_gain > 1.e-10:
-        x, y, z, w = exchange
-        idx = 0
-        temp = np.zeros(len(tour), dtype=nb.int64)
-        idx = __copy_slice(temp, tour, x + 1, y, idx)
-        idx = __copy_slice(temp, tour, w + 1, x, idx)
-        idx = __copy_slice(temp, tour, z + 1, w, idx)
-        __copy_slice(temp, tour, y + 1, z, idx)
-        return best_gain, temp
-
-    return 0., tour
+        lo, hi, gains = __candidate_pairs(tour, index, matrix, candidates)
+    return __best_bridge(lo, hi, gains, fast)
 
 
 @nb.njit(cache=True)
-def __find_full(tour: np.ndarray, matrix: np.ndarray, fast: bool) -> Tuple[float, tuple]:
-    """ 4-opt по всем возможны вершинам, эффективно, но медленно
+def __pair_gain(size: int, tour: np.ndarray, matrix: np.ndarray, a: int, c: int) -> float:
+    """ Выигрыш пары разрезов a < c: удаляем (a, a + 1), (c, c + 1), добавляем (a, c + 1), (a + 1, c)
     tour: список городов
-    matrix: матрица смежности
-    fast: возвращать первое же возможное решение
-    return: выигрыш, города, на которых выполнять 4-opt
+    size: длина маршрута
+    matrix: матрица весов
+    a, c: индексы! городов
+    return: выигрыш
     """
-    best_gain, exchange, size = 0.0, (0, 0, 0, 0), len(tour)
-    for x in range(size):
-        for y in range(x + 1, size):
-            for z in range(y + 1, size):
-                for w in range(z + 1, size):
-                    gain = __get_gain(size, tour, matrix, x, y, z, w)
-                    if fast and gain > 1.e-10:
-                        return gain, (x, y, z, w)
-                    elif best_gain < gain:
-                        best_gain, exchange = gain, (x, y, z, w)
-    return best_gain, exchange
+    t1, t2, t3, t4 = tour[a], tour[(a + 1) % size], tour[c], tour[(c + 1) % size]
+    return np.float64(matrix[t1, t2]) + matrix[t3, t4] - matrix[t1, t4] - matrix[t2, t3]
 
 
 @nb.njit(cache=True)
-def __find_neighbours(tour: np.ndarray, matrix: np.ndarray, candidates: np.ndarray, fast: bool) -> Tuple[float, tuple]:
-    """ 4-opt только по указанным кандидатам
-    tour: список городов
-    matrix: матрица смежности
-    fast: возвращать первое же возможное решение
-    return: выигрыш, города, на которых выполнять 4-opt
+def __full_pairs(tour: np.ndarray, matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Все пары разрезов, которые могут войти в улучшающий мост: O(n^2)
+    Второй проход оставляет только пары с выигрышем больше -max, остальные не окупятся ни с какой парой
+    return: начала пар, концы пар, выигрыши
     """
-    best_gain, exchange, size = 0.0, (0, 0, 0, 0), len(tour)
-    for ix in range(size):
-        x = tour[ix]
-        for y in candidates[x]:
-            if y == -1:
-                continue
-            for z in candidates[y]:
-                if z == x or z == -1:
-                    continue
-                for w in candidates[z]:
-                    if w == y or w == x or w == -1:
-                        continue
-                    iy, iz, iw = __get_indexes(tour, y, z, w)
-                    if not ix < iy < iz < iw:
-                        continue
-                    gain = __get_gain(size, tour, matrix, ix, iy, iz, iw)
-                    if fast and gain > 1.e-10:
-                        return gain, (ix, iy, iz, iw)
-                    elif best_gain < gain:
-                        best_gain, exchange = gain, (ix, iy, iz, iw)
-    return best_gain, exchange
+    size, best = len(tour), -np.inf
+    for a in range(size):
+        for c in range(a + 2, size - 1 if a == 0 else size):  # (0, size - 1) - соседние ребра
+            best = max(best, __pair_gain(size, tour, matrix, a, c))
+
+    lo, hi, gains = [0], [0], [0.]
+    lo.clear()
+    hi.clear()
+    gains.clear()
+    if not best > 1.e-10:
+        return np.array(lo), np.array(hi), np.array(gains)
+    for a in range(size):
+        for c in range(a + 2, size - 1 if a == 0 else size):
+            gain = __pair_gain(size, tour, matrix, a, c)
+            if gain > -best:
+                lo.append(a)
+                hi.append(c)
+                gains.append(gain)
+    return np.array(lo), np.array(hi), np.array(gains)
 
 
 @nb.njit(cache=True)
-def __get_indexes(tour: np.ndarray, y: int, z: int, w: int) -> Tuple[int, int, int]:
-    """ Получаем индексы для указанных вершин
-    tour: список городов
-    y, z, w: значения городов
-    return: их индексы
+def __candidate_pairs(tour: np.ndarray, index: np.ndarray, matrix: np.ndarray, candidates: np.ndarray) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Пары разрезов, одно из добавленных ребер которых - ребро кандидатов: O(n * k)
+    Для ребра (t1, t2) тура и кандидата v одного из его концов позиция второго разреза находится через index.
+    Берем только пары с положительной частичной суммой: удаленное (t1, t2) длиннее добавленного ребра к v
+    return: начала пар, концы пар, выигрыши
     """
-    iy, iz, iw, i = -1, -1, -1, 0
-    for idx, val in enumerate(tour):
-        if y == val:
-            iy = idx
-            i += 1
-        elif z == val:
-            iz = idx
-            i += 1
-        elif w == val:
-            iw = idx
-            i += 1
-        if i == 3:
-            break
-    return iy, iz, iw
+    size = len(tour)
+    count = 0
+    lo = np.zeros(2 * size * candidates.shape[1], dtype=np.int64)
+    hi, gains = np.zeros_like(lo), np.zeros(len(lo))
+
+    for a in range(size):
+        t1, t2 = tour[a], tour[(a + 1) % size]
+        removed = np.float64(matrix[t1, t2])
+        for side in range(2):
+            u = t1 if side == 0 else t2
+            for v in candidates[u]:
+                if v == -1:
+                    continue
+                if not removed - matrix[u, v] > 1.e-10:
+                    continue
+                c = index[v] - 1 if side == 0 else index[v]  # u = t1 -> v = tour[c + 1]; u = t2 -> v = tour[c]
+                c %= size
+                if (c - a) % size < 2 or (a - c) % size < 2:  # разрезы на соседних ребрах
+                    continue
+                lo[count], hi[count] = min(a, c), max(a, c)
+                gains[count] = __pair_gain(size, tour, matrix, lo[count], hi[count])
+                count += 1
+
+    best = gains[:count].max() if count > 0 else 0.
+    if not best > 1.e-10:
+        count = 0
+    mask = gains[:count] > -best
+    return lo[:count][mask], hi[:count][mask], gains[:count][mask]
 
 
 @nb.njit(cache=True)
-def __get_gain(size: int, tour: np.ndarray, matrix: np.ndarray, x: int, y: int, z: int, w: int) -> float:
-    """ Расчеты выигрыша при замене ребер
-    tour: список городов
-    size: длина маршрута
-    matrix: матрица весов
-    x, y, z, w: индексы! городов
-    return: выигрыш
+def __best_bridge(lo: np.ndarray, hi: np.ndarray, gains: np.ndarray, fast: bool) -> Tuple[float, tuple]:
+    """ Две перекрещивающиеся пары lo1 < lo2 < hi1 < hi2 с наибольшей суммой выигрышей
+    Пары перебираются по убыванию выигрыша, перебор обрывается, как только сумма не может стать лучше
+    fast: возвращать первое же возможное решение
+    return: выигрыш, позиции (x, y, z, w)
     """
-    it11, it12 = tour[x % size], tour[(x + 1) % size]
-    it21, it22 = tour[y % size], tour[(y + 1) % size]
-    it31, it32 = tour[z % size], tour[(z + 1) % size]
-    it41, it42 = tour[w % size], tour[(w + 1) % size]
-    old = matrix[it11][it12] + matrix[it21][it22] + matrix[it31][it32] + matrix[it41][it42]
-    new = matrix[it11][it32] + matrix[it12][it31] + matrix[it21][it42] + matrix[it22][it41]
-    return old - new
+    order = np.argsort(-gains)
+    best_gain, exchange = 0., (0, 0, 0, 0)
+    for i in range(len(order) - 1):
+        first = order[i]
+        if not gains[first] + gains[order[i + 1]] > max(best_gain, 1.e-10):
+            break
+        for j in range(i + 1, len(order)):
+            second = order[j]
+            gain = gains[first] + gains[second]
+            if not gain > max(best_gain, 1.e-10):
+                break
+            if lo[first] < lo[second] < hi[first] < hi[second]:
+                best_gain, exchange = gain, (lo[first], lo[second], hi[first], hi[second])
+            elif lo[second] < lo[first] < hi[second] < hi[first]:
+                best_gain, exchange = gain, (lo[second], lo[first], hi[second], hi[first])
+            else:
+                continue
+            if fast:
+                return best_gain, exchange
+    return best_gain, exchange
 
 
-@nb.njit(cache=True)
-def __copy_slice(temp: np.ndarray, tour: np.ndarray, x: int, y: int, idx: int) -> int:
-    """ Перекопирование тура в правильном порудке для двойного моста
-    temp: куда копируем
-    tour: текущий тур
-    x, y, idx: откуда, докуда, куда
+@nb.njit
+def double_bridge_move(route, tour: np.ndarray, exchange: tuple) -> np.ndarray:
+    """ Двойной мост на месте четырьмя 2-opt, без сборки нового тура
+    s1 s2 s3 s4 -> s1 s4 s3 s2: разворачиваем s2 s3 s4, затем каждый сегмент обратно
+    route: тур [ArrayTour, TreeTour], меняется на месте
+    tour: список городов route до хода, позиции exchange - в нем
+    exchange: позиции (x, y, z, w) из find_double_bridge
+    return: восемь концов удаленных ребер
     """
     size = len(tour)
-    i, j = x % size, (y + 1) % size
-    while i != j:
-        temp[idx] = tour[i]
-        i = (i + 1) % size
-        idx += 1
-    return idx
+    x, y, z, w = exchange
+    s1e, s2b, s2e, s3b = tour[x], tour[(x + 1) % size], tour[y], tour[(y + 1) % size]
+    s3e, s4b, s4e, s1b = tour[z], tour[(z + 1) % size], tour[w], tour[(w + 1) % size]
+    two_opt_move(route, s1e, s2b, s1b, s4e)  # s1 s4' s3' s2'
+    two_opt_move(route, s1e, s4e, s3e, s4b)  # s1 s4 s3' s2'
+    two_opt_move(route, s4e, s3e, s2e, s3b)  # s1 s4 s3 s2'
+    two_opt_move(route, s3e, s2e, s1b, s2b)  # s1 s4 s3 s2
+    return np.array([s1e, s2b, s2e, s3b, s3e, s4b, s4e, s1b])
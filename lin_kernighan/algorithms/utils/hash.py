@@ -1,45 +1,52 @@
-from functools import lru_cache
-
-import numpy as np
 import numba as nb
-
-from lin_kernighan.algorithms.utils.utils import rotate_zero
+import numpy as np
 
 
-@lru_cache
-def generate_degrees(number: int, module: int, size: int) -> np.ndarray:
-    """ Вычисление степеней 0 - size числа number по модулю module
-    number: чьи степени ищем
-    module: по какому модулю
-    size: сколько степеней
-    return: [1, number, number^2 % module ... number^(size -1)]
+@nb.njit(cache=True)
+def edge_hash(x: int, y: int) -> int:
+    """ Случайный ключ ребра (x, y): splitmix64 от пары (min, max)
+    Ключ детерминирован, поэтому хеши совпадают в разных процессах
+    x, y: вершины ребра
+    return: ключ ребра
     """
-    nums = np.zeros(size, dtype=np.int64)
-    nums[0], nums[1] = 1, number
-    for i in range(1, size):
-        number = (number * number) % module
-        nums[i] = number
-    return nums
-
-
-def generate_hash_from(tour: np.ndarray, number: int, module: int) -> int:
-    """ Вычисление хеша для тура по туру и списку степенй
-    tour: список городов
-    number: чьи степени ищем
+    z = (nb.uint64(min(x, y)) << nb.uint64(32)) | nb.uint64(max(x, y))
+    z += nb.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> nb.uint64(30))) * nb.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> nb.uint64(27))) * nb.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> nb.uint64(31))
+    return nb.int64(z)
+
+
+@nb.njit(cache=True)
+def generate_hash(tour: np.ndarray) -> int:
+    """ Хеш тура: xor ключей всех его ребер
+    Не зависит ни от начальной вершины, ни от направления обхода
+    tour: список вершин
     return: хеш
     """
-    degrees = generate_degrees(number, module, len(tour))
-    return (tour * degrees % module).sum() % module
+    h = 0
+    for idx in range(len(tour)):
+        h ^= edge_hash(tour[idx - 1], tour[idx])
+    return h
+
+
+@nb.njit(cache=True)
+def update_hash(h: int, t1: int, t2: int, t3: int, t4: int) -> int:
+    """ Пересчет хеша после 2-opt: удаляем ребра (t1, t2), (t3, t4), добавляем (t2, t3), (t4, t1)
+    Ход симметричен, тем же вызовом с (t1, t4, t3, t2) хеш возвращается обратно
+    h: текущий хеш
+    t1, t2, t3, t4: города хода
+    return: новый хеш
+    """
+    return h ^ edge_hash(t1, t2) ^ edge_hash(t3, t4) ^ edge_hash(t2, t3) ^ edge_hash(t4, t1)
 
 
-@nb.njit
-def generate_hash(tour: np.ndarray, number=333667, module=909090909090909091) -> int:
-    """ Вычисления  хеша по туру
-    tour: список вершин
-    number: чьи степени будем искать
-    module: по какому модулю
-    return: хеш
+@nb.njit(cache=True)
+def update_bridge_hash(h: int, nodes: np.ndarray) -> int:
+    """ Пересчет хеша после двойного моста s1 s2 s3 s4 -> s1 s4 s3 s2: восемь ребер двумя update_hash
+    h: текущий хеш
+    nodes: концы удаленных ребер из double_bridge_move
+    return: новый хеш
     """
-    with nb.objmode(h='int64'):
-        h = generate_hash_from(rotate_zero(tour), number, module)
-    return h
+    s1e, s2b, s2e, s3b, s3e, s4b, s4e, s1b = nodes
+    return update_hash(update_hash(h, s1e, s2b, s3e, s4b), s2e, s3b, s4e, s1b)
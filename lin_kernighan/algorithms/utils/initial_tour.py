@@ -5,6 +5,7 @@ from typing import Tuple, Set
 import numba as nb
 import numpy as np
 
+from lin_kernighan.algorithms.or_opt import OrOpt
 from lin_kernighan.algorithms.two_opt import TwoOpt
 
 Edge = Tuple[int, int]
@@ -26,7 +27,16 @@ def two_opt(matrix: np.ndarray) -> Tuple[float, np.ndarray]:
     return: длина, список городов
     """
     length, tour = greedy(matrix)
-    return TwoOpt.just_improve(length, tour, matrix)
+    return TwoOpt.just_improve(length, tour, matrix, neighbours=10)
+
+
+def or_opt(matrix: np.ndarray) -> Tuple[float, np.ndarray]:
+    """ Генерация начального тура жадным методом + Or-opt
+    matrix: матрица весов
+    return: длина, список городов
+    """
+    length, tour = greedy(matrix)
+    return OrOpt.just_improve(length, tour, matrix)
 
 
 @nb.njit(cache=True)
@@ -45,16 +55,16 @@ def greedy(matrix: np.ndarray) -> Tuple[float, np.ndarray]:
 
     while k < length - 1:
         minimum, search = maxsize, -1
-        for idx, price in enumerate(matrix[previous]):
-            if idx != previous and minimum > price and visited[idx] == 0:
-                minimum, search = price, idx
+        for idx in range(length):
+            if idx != previous and visited[idx] == 0 and minimum > matrix[previous, idx]:
+                minimum, search = matrix[previous, idx], idx
         visited[search] = 1
         path += minimum
         order[k] = previous
         previous = search
         k += 1
 
-    path += matrix[search][start]
+    path += matrix[search, start]
     order[-1] = search
     return path, order
 
@@ -62,29 +72,29 @@ def greedy(matrix: np.ndarray) -> Tuple[float, np.ndarray]:
 def fast_helsgaun(alpha_matrix: np.ndarray, adjacency_matrix: np.ndarray, best_solution: Set[Edge],
                   candidates: np.ndarray, excess: float) -> Tuple[float, np.ndarray]:
     """ Генерируем новый тур по рецепту Хельгауна, c постоптимизацей 2-opt
-    alpha_matrix: альфа-матрица
+    alpha_matrix: альфа-матрица [np.ndarray, SparseAlpha]
     adjacency_matrix: матрица весов
-    best_solution: лучший тур в виде ребер
+    best_solution: лучший тур в виде ребер [set, typed Dict]
     candidates: сгенерированные кандидаты для LKH
     excess: уровень по которому отсекаются кандидаты
     return: длина, список городов
     """
     length, tour = helsgaun(alpha_matrix, adjacency_matrix, best_solution, candidates, excess)
-    return TwoOpt.just_improve(length, tour, adjacency_matrix)
+    return TwoOpt.just_improve(length, tour, adjacency_matrix, neighbours=10)
 
 
 @nb.njit(cache=True)
 def helsgaun(alpha_matrix: np.ndarray, adjacency_matrix: np.ndarray, best_solution: Set[Edge],
              candidates: np.ndarray, excess: float) -> Tuple[float, np.ndarray]:
     """ Генерируем новый тур по рецепту Хельгауна
-    alpha_matrix: альфа-матрица
+    alpha_matrix: альфа-матрица [np.ndarray, SparseAlpha]
     adjacency_matrix: матрица весов
-    best_solution: лучший тур в виде ребер
+    best_solution: лучший тур в виде ребер [set, typed Dict]
     candidates: сгенерированные кандидаты для LKH
     excess: уровень по которому отсекаются кандидаты
     return: длина, список городов
     """
-    size, k, length = alpha_matrix.shape[0], 0, 0.0
+    size, k, length = adjacency_matrix.shape[0], 0, 0.0
     previous = search = randrange(0, size)  # я ищу ребро из previous в search
     visited = np.zeros(size, dtype=nb.boolean)
     order = np.zeros(size, dtype=nb.int64)
@@ -93,13 +103,13 @@ def helsgaun(alpha_matrix: np.ndarray, adjacency_matrix: np.ndarray, best_soluti
     while k < size - 1:
         prices = alpha_matrix[previous]
         if (search := __zero_alpha(previous, prices, visited)) != -1:
-            length += adjacency_matrix[previous][search]
+            length += adjacency_matrix[previous, search]
         elif (search := __best_tour(previous, prices, excess, best_solution, visited)) != -1:
-            length += adjacency_matrix[previous][search]
+            length += adjacency_matrix[previous, search]
         elif (search := __get_candidate_set(previous, candidates, visited)) != -1:
-            length += adjacency_matrix[previous][search]
+            length += adjacency_matrix[previous, search]
         elif (search := __just_random(previous, prices, visited)) != -1:
-            length += adjacency_matrix[previous][search]
+            length += adjacency_matrix[previous, search]
         else:
             raise RuntimeError('Edge not found')
 
@@ -109,7 +119,7 @@ def helsgaun(alpha_matrix: np.ndarray, adjacency_matrix: np.ndarray, best_soluti
         k += 1
 
     order[-1] = search
-    length += adjacency_matrix[order[0]][order[-1]]
+    length += adjacency_matrix[order[0], order[-1]]
     return length, order
 
 
@@ -0,0 +1,202 @@
+from typing import Tuple
+
+import numba as nb
+import numpy as np
+
+from lin_kernighan.algorithms.structures.move_stack import MoveStack
+
+
+@nb.njit(cache=True)
+def feasible_k_opt(index: np.ndarray, removed: np.ndarray, added: np.ndarray) -> Tuple[bool, np.ndarray, np.ndarray]:
+    """ Проверка k-opt хода на корректность за O(k log k) без построения тура, как FeasibleKOptMove в LKH
+    Удаленные ребра режут тур на k сегментов, разрезы сортируются по позициям. Концы сегментов соединяются
+    добавленными ребрами, и мы идем по сегментам: ход корректен, если обход вернулся в начало, пройдя все k.
+    index: позиции городов в туре
+    removed: удаленные ребра тура [k * 2]
+    added: добавленные ребра [k * 2], каждый конец удаленного ребра - ровно в одном добавленном
+    return: получится ли один цикл; cuts - отсортированные позиции разрезов (ребро cuts[j], cuts[j] + 1);
+    order - концы сегментов в порядке нового тура: 2 * j - сегмент j входит началом, 2 * j + 1 - концом
+    """
+    k, size = len(removed), len(index)
+    cuts, order = np.zeros(k, dtype=np.int64), np.zeros(k, dtype=np.int64)
+    for i in range(k):
+        x, y = index[removed[i, 0]], index[removed[i, 1]]
+        if (x + 1) % size == y:
+            cuts[i] = x
+        elif (y + 1) % size == x:
+            cuts[i] = y
+        else:  # не ребро тура
+            return False, cuts, order
+    cuts.sort()
+    for i in range(k - 1):
+        if cuts[i] == cuts[i + 1]:  # одно ребро удалено дважды
+            return False, cuts, order
+
+    ends = np.zeros(2 * k, dtype=np.int64)  # сегмент j: позиции cuts[j] + 1 .. cuts[j + 1]
+    for j in range(k):
+        ends[2 * j], ends[2 * j + 1] = (cuts[j] + 1) % size, cuts[(j + 1) % k]
+    added_ends = np.zeros((k, 2), dtype=np.int64)
+    for i in range(k):
+        added_ends[i, 0], added_ends[i, 1] = index[added[i, 0]], index[added[i, 1]]
+    return __walk(ends, added_ends, cuts, order)
+
+
+@nb.njit
+def feasible_move(tour, removed: np.ndarray, added: np.ndarray) -> Tuple[bool, np.ndarray, np.ndarray]:
+    """ То же для тура [ArrayTour, TreeTour]: разрезы сортируются по tour.key, концы сегментов - города
+    tour: тур [ArrayTour, TreeTour]
+    removed, added: удаленные и добавленные ребра [k * 2]
+    return: получится ли один цикл; ends - начало 2 * j и конец 2 * j + 1 сегмента j; order - см. feasible_k_opt
+    """
+    k = len(removed)
+    cuts, keys = np.zeros(k, dtype=np.int64), np.zeros(k, dtype=np.int64)
+    ends, order = np.zeros(2 * k, dtype=np.int64), np.zeros(k, dtype=np.int64)
+    for i in range(k):
+        x, y = removed[i, 0], removed[i, 1]
+        if tour.next(x) == y:
+            cuts[i] = x
+        elif tour.next(y) == x:
+            cuts[i] = y
+        else:  # не ребро тура
+            return False, ends, order
+        keys[i] = tour.key(cuts[i])
+    cuts = cuts[np.argsort(keys)]
+    for i in range(k - 1):
+        if cuts[i] == cuts[i + 1]:  # одно ребро удалено дважды
+            return False, ends, order
+
+    for j in range(k):
+        ends[2 * j], ends[2 * j + 1] = tour.next(cuts[j]), cuts[(j + 1) % k]
+    return __walk(ends, added, ends, order)
+
+
+@nb.njit(cache=True)
+def __walk(ends: np.ndarray, added: np.ndarray, result: np.ndarray, order: np.ndarray) \
+        -> Tuple[bool, np.ndarray, np.ndarray]:
+    """ Обход сегментов по добавленным ребрам
+    ends: начало 2 * j и конец 2 * j + 1 сегмента j, у сегмента из одного города они совпадают
+    added: добавленные ребра в тех же обозначениях, что и ends
+    result: что вернуть вместе с order
+    return: прошли ли все сегменты одним циклом, result, order
+    """
+    k = len(order)
+    partner = np.full(2 * k, -1, dtype=np.int64)
+    for i in range(k):
+        x, y = __free_end(ends, partner, added[i, 0], -1), -1
+        if x != -1:
+            y = __free_end(ends, partner, added[i, 1], x)
+        if y == -1:  # конец добавленного ребра - не конец удаленного
+            return False, result, order
+        partner[x], partner[y] = y, x
+
+    end, count = 1, 0
+    order[0] = 0
+    while True:
+        count += 1
+        enter = partner[end]
+        if enter == 0:
+            return count == k, result, order
+        if count == k:  # цикл длиннее k сегментов невозможен
+            return False, result, order
+        order[count] = enter
+        end = enter ^ 1
+
+
+@nb.njit(cache=True)
+def __free_end(ends: np.ndarray, partner: np.ndarray, node: int, busy: int) -> int:
+    """ Свободный конец сегмента node, кроме busy; у сегмента из одного города концов два
+    return: номер конца или -1
+    """
+    for end in range(len(ends)):
+        if ends[end] == node and partner[end] == -1 and end != busy:
+            return end
+    return -1
+
+
+@nb.njit(cache=True)
+def reversal_tables(k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """ Таблицы разворотов для k-opt ходов до k включительно, как таблицы MakeKOptMove в LKH
+    Для каждого k - один поиск в ширину из начального порядка сегментов сразу во все состояния, поэтому
+    кратчайшая последовательность разворотов для любого order восстанавливается по parent без нового поиска
+    k: наибольшее k
+    return: parent[k, state] - предыдущее состояние, move[k, state] - разворот i * k + j блока мест i..j
+    """
+    width = (2 * k) ** (k - 1)
+    parent, move = np.full((k + 1, width), -1, dtype=np.int64), np.zeros((k + 1, width), dtype=np.int64)
+    for size in range(2, k + 1):
+        __search(size, parent[size], move[size])
+    return parent, move
+
+
+@nb.njit(cache=True)
+def __search(k: int, parent: np.ndarray, move: np.ndarray) -> None:
+    """ Поиск в ширину по порядкам сегментов k-opt: сегмент 0 стоит на месте, состояний не больше (2k)^(k - 1),
+    для 5-opt - 10^4. Состояние - места 1..k-1 в системе счисления по основанию 2k
+    parent, move: строки таблиц для этого k, заполняются на месте
+    """
+    base, count = 2 * k, (2 * k) ** (k - 1)
+    start = __code(np.arange(0, 2 * k, 2), base)
+    queue, head, tail = np.zeros(count, dtype=np.int64), 0, 1
+    queue[0], parent[start] = start, start
+    arrangement = np.zeros(k, dtype=np.int64)
+
+    while head < tail:
+        state = queue[head]
+        head += 1
+        for p in range(1, k):
+            arrangement[p] = state // base ** (p - 1) % base
+        for i in range(1, k):
+            for j in range(i, k):
+                code = 0
+                for p in range(k - 1, 0, -1):
+                    value = arrangement[i + j - p] ^ 1 if i <= p <= j else arrangement[p]
+                    code = code * base + value
+                if parent[code] == -1:
+                    parent[code], move[code] = state, i * k + j
+                    queue[tail] = code
+                    tail += 1
+
+
+@nb.njit(cache=True)
+def __code(arrangement: np.ndarray, base: int) -> int:
+    """ Номер состояния по концам, которыми сегменты 1..k-1 входят в тур """
+    code = 0
+    for p in range(len(arrangement) - 1, 0, -1):
+        code = code * base + arrangement[p]
+    return code
+
+
+@nb.njit
+def k_opt_move(tour, ends: np.ndarray, order: np.ndarray, stack: MoveStack, tables: tuple) -> None:
+    """ Выполняем принятый k-opt ход на месте разворотами блоков сегментов, как MakeKOptMove в LKH
+    Каждый разворот - 2-opt через stack.apply, поэтому ход пересчитывает хеш и откатывается stack.rollback
+    tour: тур [ArrayTour, TreeTour]
+    ends, order: результат feasible_move
+    stack: стек хода
+    tables: (parent, move) из reversal_tables, посчитанные для k не меньше len(order)
+    """
+    k = len(order)
+    parent, move = tables
+    arrangement = np.arange(0, 2 * k, 2)  # конец, которым сегмент на этом месте входит в тур
+    for idx in __reversals(order, parent[k], move[k]):
+        i, j = idx // k, idx % k
+        t1, t2 = ends[arrangement[i - 1] ^ 1], ends[arrangement[i]]
+        t4, t3 = ends[arrangement[j] ^ 1], ends[arrangement[(j + 1) % k]]
+        stack.apply(tour, t1, t2, t3, t4)
+        arrangement[i:j + 1] = arrangement[i:j + 1][::-1] ^ 1
+
+
+@nb.njit(cache=True)
+def __reversals(order: np.ndarray, parent: np.ndarray, move: np.ndarray) -> np.ndarray:
+    """ Кратчайшая последовательность разворотов блоков сегментов, переводящая тур в order: O(k) по таблицам
+    parent, move: строки reversal_tables для k = len(order)
+    return: развороты i * k + j - блок мест i..j
+    """
+    base = 2 * len(order)
+    start, state = __code(np.arange(0, base, 2), base), __code(order, base)
+    steps = [0]
+    steps.clear()
+    while state != start:
+        steps.append(move[state])
+        state = parent[state]
+    return np.array(steps[::-1], dtype=np.int64)
@@ -0,0 +1,95 @@
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+_attached: Dict[str, SharedMemory] = {}  # блоки, открытые в этом процессе, живут до его завершения
+
+
+def attach(name: str, shape: Tuple[int, ...], dtype: str) -> np.ndarray:
+    """ Массив поверх блока разделяемой памяти, без копирования
+    name: имя блока
+    shape, dtype: форма и тип массива
+    """
+    if name not in _attached:
+        _attached[name] = SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=dtype, buffer=_attached[name].buf).view(SharedArray)
+    array.handle = (name, shape, dtype)
+    return array
+
+
+class SharedArray(np.ndarray):
+    """ ndarray в разделяемой памяти: при сериализации передается имя блока, а не данные
+    Срезы и копии сериализуются как обычные массивы
+    """
+
+    handle = None
+
+    def __reduce__(self):
+        if self.handle is None:
+            return np.asarray(self).__reduce__()
+        return attach, self.handle
+
+
+class SharedMemoryPool:
+    """ Владелец блоков разделяемой памяти: массивы только для чтения, общие для процессов
+    Блоки удаляются при close (или при выходе из with), массивы на них после этого использовать нельзя
+    """
+
+    def __init__(self):
+        self.blocks: List[SharedMemory] = []
+
+    def share(self, array: np.ndarray) -> SharedArray:
+        """ Копируем массив в новый блок разделяемой памяти
+        return: массив поверх блока
+        """
+        block = SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.blocks.append(block)
+        shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf).view(SharedArray)
+        shared[...] = array
+        shared.handle = (block.name, array.shape, array.dtype.str)
+        return shared
+
+    def close(self) -> None:
+        for block in self.blocks:
+            _attached.pop(block.name, None)
+            block.unlink()
+            block.close()
+        self.blocks.clear()
+
+    def __enter__(self) -> 'SharedMemoryPool':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+class HashRing:
+    """ Кольцевой буфер хешей туров в разделяемой памяти: один писатель, много читателей
+    data[0] - сколько хешей записано всего, data[1:] - последние capacity хешей.
+    Читатель помнит, сколько уже прочитал, и забирает только новые; отставшие больше чем на capacity
+    теряют самые старые хеши
+    """
+
+    def __init__(self, pool: SharedMemoryPool, capacity: int = 1 << 16):
+        self.capacity = capacity
+        self.data = pool.share(np.zeros(capacity + 1, dtype=np.int64))
+
+    def append(self, hashes: np.ndarray) -> None:
+        """ Дописываем хеши, счетчик меняется после данных """
+        written = self.data[0]
+        for idx, h in enumerate(hashes[-self.capacity:]):
+            self.data[1 + (written + idx) % self.capacity] = h
+        self.data[0] = written + min(len(hashes), self.capacity)
+
+    def read(self, cursor: int) -> Tuple[np.ndarray, int]:
+        """ Хеши, записанные после cursor
+        return: хеши, новый cursor
+        """
+        written = int(self.data[0])
+        start = max(cursor, written - self.capacity)
+        index = 1 + np.arange(start, written) % self.capacity
+        hashes = np.asarray(self.data[index])
+        if self.data[0] - self.capacity > start:  # писатель успел перезаписать начало
+            hashes = hashes[self.data[0] - self.capacity - start:]
+        return hashes, written
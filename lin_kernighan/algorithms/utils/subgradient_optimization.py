@@ -4,7 +4,6 @@ from sys import maxsize
 from typing import Tuple
 
 import numpy as np
-import numba as nb
 
 from lin_kernighan.algorithms.structures.one_tree import one_tree
 
@@ -13,20 +12,29 @@ Edge = Tuple[int, int]
 
 class SubgradientOptimization:
     pi_max: np.ndarray
-    pi_sum: np.ndarray
     w_max: float
 
     @staticmethod
-    def run(adjacency_matrix: np.ndarray, max_iterations=100) -> SubgradientOptimization:
+    def run(adjacency_matrix: np.ndarray, max_iterations=100, candidates: np.ndarray = None, pi: np.ndarray = None,
+            upper: float = None, gap=0.) -> SubgradientOptimization:
+        """ Подъем Хелда-Карпа: ищем штрафы pi, максимизирующие нижнюю оценку w(pi) = L(1-tree(pi)) - 2 * sum(pi)
+        Штрафованные веса c(i, j) + pi[i] + pi[j] считаются на лету внутри one tree, матрица не меняется
+        adjacency_matrix: матрица весов
+        max_iterations: максимальное число итераций
+        candidates: one tree строится только по ребрам кандидатов (пустое заполнено -1), иначе по всем
+        pi: начальные штрафы, для продолжения с прошлого запуска
+        upper: длина известного тура, для остановки по разрыву оценок
+        gap: остановка, когда (upper - w_max) <= gap * upper
+        return: pi_max - лучшие штрафы, w_max - лучшая нижняя оценка
+        """
         opt = SubgradientOptimization()
         length = adjacency_matrix.shape[0]
 
-        pi = np.zeros(length)  # итерацию
-        pi_sum = np.zeros(length)
+        pi = np.zeros(length) if pi is None else np.asarray(pi, dtype=np.float64).copy()
         v = np.zeros(length)
 
         opt.w_max, w = -maxsize, -maxsize  # инициализируем текущий максимум и штрафы
-        opt.pi_max = pi[:]
+        opt.pi_max = pi.copy()
 
         t = 0.0001
         period = next_period = length // 2
@@ -35,21 +43,20 @@ class SubgradientOptimization:
         last_improve = 0
 
         for k in range(1, max_iterations):
-            SubgradientOptimization.make_move(pi, adjacency_matrix)
-            ll, src, dst = one_tree(adjacency_matrix)  # получаем длину нового деревого
+            ll, _, _, degree, _, _ = one_tree(adjacency_matrix, candidates, pi)  # получаем длину нового деревого
             w_prev, w = w, ll - 2 * pi.sum()  # считаем полученную длину
 
             if w > opt.w_max + 1e-6:  # максимальная пока что длина
-                opt.w_max, opt.pi_max, opt.pi_sum = w, pi.copy(), pi_sum.copy()
+                opt.w_max, opt.pi_max = w, pi.copy()
                 last_improve = k
 
-            v_prev, v = v, opt.__get_degrees(src, dst, length)  # получаем субградиенты
+            if upper is not None and upper - opt.w_max <= gap * abs(upper):  # оценка сошлась с туром
+                break
+
+            v_prev, v = v, degree - 2  # получаем субградиенты: v^k = d^k - 2, d - степени вершин в 1-tree
 
             # -------------------- обновляем pi -----------------------------------------------------
             pi = pi + t * (0.7 * v + 0.3 * v_prev)
-            pi_sum += pi
-            # ic(k, w_max, w, t, period, ll, 2*pi.sum(), last_improve)
-            # ic(k, w_max, w, pi, t, period, ll, v)
 
             # --------------------- магия с шагом оптимизации ---------------------------------------
             period -= 1
@@ -74,38 +81,4 @@ class SubgradientOptimization:
 
             if period == 0 or t < 1e-10 or np.absolute(v).sum() == 0:  # условие выхода
                 break
-        SubgradientOptimization.get_back(pi_sum - pi, adjacency_matrix)
         return opt
-
-    @staticmethod
-    @nb.njit(cache=True)
-    def make_move(pi: np.ndarray, adjacency_matrix: np.ndarray) -> None:
-        """ vertex pi[i] added to all elements of i-row and i-column of adjacency matrix
-        """
-        for i, k in enumerate(pi):
-            for index in range(adjacency_matrix.shape[0]):
-                adjacency_matrix[i][index] += k
-                adjacency_matrix[index][i] += k
-
-    @staticmethod
-    @nb.njit(cache=True)
-    def get_back(pi: np.ndarray, adjacency_matrix: np.ndarray) -> None:
-        """ get matrix before move
-        """
-        for i, k in enumerate(pi):
-            for index in range(adjacency_matrix.shape[0]):
-                adjacency_matrix[i][index] -= k
-                adjacency_matrix[index][i] -= k
-
-    @staticmethod
-    @nb.njit(cache=True)
-    def __get_degrees(first: np.ndarray, second: np.ndarray, length: int) -> np.ndarray:
-        """ v^k = d^k - 2,
-        where d is vector having as its elements the
-        degrees of the nodes in the current minimum 1-tree
-        """
-        v = np.asarray([-2] * length)
-        for idx in range(length):
-            v[first[idx]] += 1
-            v[second[idx]] += 1
-        return v
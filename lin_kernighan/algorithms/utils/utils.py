@@ -51,6 +51,38 @@ def swap(tour: np.ndarray, x: int, y: int) -> np.ndarray:
     return tour
 
 
+@nb.njit(cache=True)
+def swap_index(tour: np.ndarray, index: np.ndarray, x: int, y: int) -> np.ndarray:
+    """ Переворот куска тура: [x, y], включительно! Массив позиций обновляется вместе с туром
+    tour: список городов
+    index: позиции городов в туре
+    x, y: индексы
+    return: измененный список
+    """
+    size, temp = len(tour), 0
+    if x < y:
+        temp = (y - x + 1) // 2
+    elif x > y:
+        temp = ((size - x) + y + 2) // 2
+    for i in range(temp):
+        first, second = (x + i) % size, (y - i) % size
+        tour[first], tour[second] = tour[second], tour[first]
+        index[tour[first]], index[tour[second]] = first, second
+    return tour
+
+
+@nb.njit(cache=True)
+def get_index(tour: np.ndarray) -> np.ndarray:
+    """ Обратный к туру массив: index[город] = позиция города в туре
+    tour: список городов
+    return: массив позиций
+    """
+    index = np.zeros(len(tour), dtype=nb.int64)
+    for idx in range(len(tour)):
+        index[tour[idx]] = idx
+    return index
+
+
 @nb.njit(cache=True)
 def make_pair(i: int, j: int) -> Edge:
     """ Правильная пара для упрощения хранения ребер
@@ -60,19 +92,6 @@ def make_pair(i: int, j: int) -> Edge:
     return (i, j) if i > j else (j, i)
 
 
-@nb.njit(cache=True)
-def check_dlb(dlb: np.ndarray, idx: int) -> bool:
-    """ Проверка don't look bites
-    dlb: массив dlb
-    idx: индекс города в туре
-    return: пропускать или нет
-    """
-    s = len(dlb)
-    if s != 1 and dlb[idx] and dlb[(idx - 1) % s] and dlb[(idx + 1) % s]:
-        return True
-    return False
-
-
 @nb.njit(cache=True)
 def mix(tour: np.ndarray, iterations: int) -> None:
     """ Попытка сломать тур. Ломается текущий сохраненный.
@@ -94,9 +113,10 @@ def get_length(tour: np.ndarray, matrix: np.ndarray) -> float:
     matrix: матрица весов
     return: длина
     """
-    length = matrix[tour[0]][tour[-1]]
+    length = 0.  # копим в float64 и для float32 / int32 весов
+    length += matrix[tour[0], tour[-1]]
     for idx in range(len(tour) - 1):
-        length += matrix[tour[idx]][tour[idx + 1]]
+        length += matrix[tour[idx], tour[idx + 1]]
     return length
 
 
@@ -140,3 +160,31 @@ def rotate_zero(tour: np.ndarray) -> np.ndarray:
     if tour[0] == 0:
         return tour
     return rotate(tour, np.where(tour == 0)[0][0])
+
+
+@nb.njit(cache=True)
+def nearest_neighbours(matrix: np.ndarray, count: int) -> np.ndarray:
+    """ Ближайшие соседи каждой вершины, по возрастанию расстояния: O(n^2 * count)
+    matrix: матрица весов
+    count: сколько соседей отбираем
+    return: матрица соседей [size * count]
+    """
+    size = matrix.shape[0]
+    count = min(count, size - 1)
+    neighbours = np.zeros((size, count), dtype=np.int64)
+    best = np.zeros(count, dtype=np.float64)
+    for i in range(size):
+        found = 0
+        for j in range(size):
+            if i == j:
+                continue
+            dist = matrix[i, j]
+            if found == count and dist >= best[count - 1]:
+                continue
+            idx = found if found < count else count - 1  # вставка в отсортированный список
+            while idx > 0 and best[idx - 1] > dist:
+                best[idx], neighbours[i][idx] = best[idx - 1], neighbours[i][idx - 1]
+                idx -= 1
+            best[idx], neighbours[i][idx] = dist, j
+            found = min(found + 1, count)
+    return neighbours
@@ -1,40 +1,111 @@
 import logging
-from typing import Tuple
+import multiprocessing as mp
+from multiprocessing.connection import Connection, wait
+from typing import Dict, Tuple
 
 import numpy as np
 
 from lin_kernighan.algorithms.lkh_opt import LKHOpt
+from lin_kernighan.algorithms.structures.tabu_list import TabuSet, tabu_store
 from lin_kernighan.algorithms.two_opt import TwoOpt
 from lin_kernighan.algorithms.utils.abc_search import AbcSearch
-from lin_kernighan.algorithms.utils.initial_tour import helsgaun, fast_helsgaun, greedy, two_opt
+from lin_kernighan.algorithms.utils.initial_tour import helsgaun, fast_helsgaun, greedy, two_opt, or_opt
+from lin_kernighan.algorithms.utils.shared import HashRing, SharedMemoryPool
 from lin_kernighan.algorithms.utils.utils import get_length, get_set
 
-_initialization = dict(helsgaun=helsgaun, fast_helsgaun=fast_helsgaun, greedy=greedy, two_opt=two_opt)
+_initialization = dict(helsgaun=helsgaun, fast_helsgaun=fast_helsgaun, greedy=greedy, two_opt=two_opt, or_opt=or_opt)
+
+
+def _restart(opt: LKHOpt, initial: str) -> None:
+    """ Новый начальный тур для следующей попытки
+    opt: LKH, тур меняется на месте
+    initial: генерация нового тура, см. _initialization
+    """
+    if initial == 'helsgaun' or initial == 'fast_helsgaun':
+        opt.length, opt.tour = _initialization[initial](
+            opt.alpha, opt.matrix, opt.best_solution, opt.candidates, opt.excess)
+    else:
+        opt.length, opt.tour = _initialization[initial](opt.matrix)
+    assert round(get_length(opt.tour, opt.matrix), 2) == round(opt.length, 2), \
+        f'{get_length(opt.tour, opt.matrix)} != {opt.length}'
+
+
+def worker(opt: LKHOpt, conn: Connection, initial: str, ring: HashRing, trials: np.ndarray, best_length: np.ndarray,
+           best_tour: np.ndarray, lock) -> None:
+    """ Попытки Multi trial LKH в отдельном процессе, пока общий счетчик попыток не дойдет до нуля
+    Перед попыткой забираем новые хеши других процессов и, если лучший тур обновился, его ребра для helsgaun;
+    после попытки отправляем свои новые хеши и публикуем тур, если он лучше общего
+    opt: LKH, матрица весов, кандидаты и альфа-матрица - в разделяемой памяти
+    conn: для передачи хешей
+    initial: генерация нового тура
+    ring: новые хеши всех процессов
+    trials: [сколько попыток осталось, всего попыток, версия лучшего тура]
+    best_length, best_tour: лучший тур [1], [size], меняются под lock
+    lock: блокировка для trials и лучшего тура
+    """
+    data, cursor, version = TabuSet(tabu_store(**opt.tabu)), 0, 0
+    try:
+
+        while True:
+            with lock:
+                if trials[0] == 0:
+                    break
+                first, trials[0] = trials[0] == trials[1], trials[0] - 1
+                if trials[2] != version:
+                    version, opt.best_solution = trials[2], get_set(best_tour.copy())
+
+            solutions, cursor = ring.read(cursor)
+            data.data.update(solutions)
+            if not first:  # первая попытка начинается с общего начального тура
+                _restart(opt, initial)
+            inserts = data.data.inserts
+            opt.meta_heuristic_optimize(data, None)
+            conn.send(data.data.since(inserts))
+
+            length, tour = data.best_tour()
+            with lock:
+                if length < best_length[0]:
+                    best_length[0], best_tour[:] = length, tour
+                    trials[2] += 1
+
+    except Exception as exc:
+        print(f'Exception: {exc}')
+
+    conn.send(None)
 
 
 class LKHSearch(AbcSearch):
     """ Базовая метаэвристика: Multi trial LKH
-    matrix: матрица весов
+    matrix: матрица весов [np.ndarray, CondensedMatrix, DistanceProvider]
 
-    init: генерация нового тура [helsgaun, fast_helsgaun, greedy, two_opt]
+    init: генерация нового тура [helsgaun, fast_helsgaun, greedy, two_opt, or_opt]
     dlb: don't look bits [boolean]
     bridge: make double bridge [boolean]
     excess: parameter for cut bad candidates [float]
     mul: excess factor [float]
     two_opt: use two_opt by initial tour [boolean]
+    two_opt_neighbours: number of nearest neighbours for two_opt, 0 - check all pairs [int]
     non_seq: use non sequential move [boolean]
     k: number of k for k-opt; how many sequential can make algorithm [int]
+    move_type: basic move: 2 - chain of 2-opt up to k, 3..5 - sequential k-opt with all reconnections [int]
     subgradient: use or not subgradient optimization [boolean]
+    sparse_alpha: keep only this many best alpha values per city instead of the dense alpha matrix, 0 - dense [int]
+    cache: directory of on-disk cache for pi, candidates and one tree, keyed by instance fingerprint [str]
+    proc: number of processes for parallel trials, 1 - sequential [int]
+    start_method: how to start processes [fork, spawn, forkserver]
     """
 
     def __init__(self, matrix: np.ndarray, **kwargs):
         super().__init__(matrix, **kwargs)
 
         if kwargs.get('two_opt', True):
-            self.length, self.tour = TwoOpt.just_improve(self.length, self.tour, self.matrix)
+            neighbours = kwargs.get('two_opt_neighbours', 10)
+            self.length, self.tour = TwoOpt.just_improve(self.length, self.tour, self.matrix, neighbours)
 
         self.opt = LKHOpt(self.length, self.tour, self.matrix, **kwargs)
         self.initial = kwargs.get('init', 'two_opt')
+        self.proc = kwargs.get('proc', 1)
+        self.context = mp.get_context(kwargs.get('start_method'))
 
         logging.info('initialization multi trial lkh done')
 
@@ -43,6 +114,8 @@ class LKHSearch(AbcSearch):
         iterations: количество возможных перезапусков
         return: лучшая длина тура, лучший тур
         """
+        if self.proc > 1:
+            return self.__parallel_optimize(iterations)
         if self.collector is not None:
             self.collector.update({'length': self.length, 'gain': 0})
 
@@ -58,21 +131,50 @@ class LKHSearch(AbcSearch):
 
             logging.info(f'{iterations} : {_length} : {self.length}')
 
-            if self.initial == 'helsgaun' or self.initial == 'fast_helsgaun':
-                self.opt.length, self.opt.tour = _initialization[self.initial](
-                    self.opt.alpha,
-                    self.matrix,
-                    self.opt.best_solution,
-                    self.opt.candidates,
-                    self.opt.excess)
-            else:
-                self.opt.length, self.opt.tour = _initialization[self.initial](self.matrix)
-
-            assert round(get_length(self.opt.tour, self.matrix), 2) == round(self.opt.length, 2), \
-                f'{get_length(self.opt.tour, self.matrix)} != {self.opt.length}'
-
+            _restart(self.opt, self.initial)
             iterations -= 1
 
         self.length, self.tour = self.best_tour()
         logging.info(f'multi trial lkh done, best length: {self.length}')
         return self.length, self.tour
+
+    def __parallel_optimize(self, iterations: int) -> Tuple[float, np.ndarray]:
+        """ Multi trial LKH на нескольких процессах: попытки раздаются по одной, пока не кончатся
+        Матрица весов, кандидаты и альфа-матрица - в разделяемой памяти, новые хеши туров раздаются
+        через общий кольцевой буфер, лучший тур - через общую память
+        iterations: количество попыток
+        return: лучшая длина тура, лучший тур
+        """
+        if self.initial == 'helsgaun' or self.initial == 'fast_helsgaun':
+            _ = self.opt.alpha  # считаем до копирования в разделяемую память
+        with SharedMemoryPool() as pool:
+            opt = self.opt.shared(pool)
+            ring, lock = HashRing(pool), self.context.Lock()
+            trials = pool.share(np.array([iterations, iterations, 0]))
+            best_length, best_tour = pool.share(np.array([self.length])), pool.share(self.tour)
+            processes: Dict[Connection, mp.Process] = {}
+
+            for _ in range(min(self.proc, iterations)):
+                m, w = self.context.Pipe()
+                p = self.context.Process(target=worker, args=(opt, w, self.initial, ring, trials, best_length,
+                                                              best_tour, lock))
+                p.start()
+                processes[m] = p
+
+            while len(processes) > 0:
+                for conn in wait(list(processes)):
+                    solutions = conn.recv()
+                    if solutions is None:
+                        processes.pop(conn).join()
+                        continue
+                    ring.append(self.data.data.update(solutions))
+                    logging.info(f'trials left: {trials[0]}, best length: {best_length[0]}')
+
+            if best_length[0] < self.data.best_length:
+                self.data.best_length, self.data.best_route = best_length[0], np.array(best_tour)
+            del opt, ring, trials, best_length, best_tour  # блоки памяти закрываются только без ссылок на них
+
+        self.length, self.tour = self.best_tour()
+        self.opt.best_solution = get_set(self.tour)
+        logging.info(f'parallel multi trial lkh done, best length: {self.length}')
+        return self.length, self.tour
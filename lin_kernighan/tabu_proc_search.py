@@ -1,26 +1,35 @@
 import logging
 import multiprocessing as mp
-from multiprocessing.connection import Connection
+from multiprocessing.connection import Connection, wait
 from typing import Tuple, Dict
 
 import numpy as np
 
+from lin_kernighan.algorithms.structures.tabu_list import tabu_store
 from lin_kernighan.algorithms.utils.abc_opt import AbcOpt
 from lin_kernighan.algorithms.utils.initial_tour import greedy
+from lin_kernighan.algorithms.utils.shared import HashRing, SharedMemoryPool
 from lin_kernighan.algorithms.utils.utils import get_length, mix
 from lin_kernighan.utils import opts_type
 
 
-def worker(opt: AbcOpt, conn: Connection, iterations: int, swap: int):
+def worker(opt: AbcOpt, conn: Connection, iterations: int, swap: int, prune: float, ring: HashRing,
+           best: np.ndarray):
     """ Локальный поиск под управлением Поиска с запретами
-    Табу обновляется раз в итерацию, в основном процессе хранится весь табу
+    Раз в итерацию отправляем в основной процесс только новые хеши и лучшую длину,
+    а хеши других процессов забираем из общего кольцевого буфера, не дожидаясь ответа
     opt: эвристика
     conn: для передачи данных
     iterations: количество возможных перезапусков
     swap: сколько раз ломать тур за итерацию
+    prune: если локальный минимум хуже лучшей длины всех процессов больше чем в (1 + prune) раз,
+    его не ломаем дальше, а перезапускаемся от лучшего тура процесса
+    ring: новые хеши всех процессов
+    best: лучшая известная длина тура [1], тур в конце отправляет только процесс с лучшей длиной
     """
     best_length, best_tour = opt.length, opt.tour.copy()
     length, tour = opt.length, opt.tour
+    cursor, inserts = 0, opt.solutions.inserts
     try:
 
         while iterations > 0:
@@ -30,27 +39,33 @@ def worker(opt: AbcOpt, conn: Connection, iterations: int, swap: int):
                 assert round(get_length(best_tour, opt.matrix), 2) == round(best_length, 2), \
                     f'{get_length(best_tour, opt.matrix)} != {best_length}'
 
-            conn.send(opt.solutions)
-            solutions = conn.recv()
+            conn.send((opt.solutions.since(inserts), best_length))
+            solutions, cursor = ring.read(cursor)
 
+            if _length > best[0] * (1 + prune):  # далеко позади других процессов
+                tour[:] = best_tour
             mix(tour, swap)
             length = get_length(tour, opt.matrix)
-            opt.length, opt.tour, opt.solutions = length, tour, solutions
+            opt.length, opt.tour = length, tour
+            opt.solutions.update(solutions)
+            inserts = opt.solutions.inserts
             iterations -= 1
 
     except Exception as exc:
         print(f'Exception: {exc}')
 
-    conn.send(set())
+    conn.send(None)
     conn.send(best_length)
-    conn.send(best_tour)
+    conn.send(best_tour if best_length <= best[0] else None)
 
 
 class TabuProcSearch:
     """ Базовая метаэвристика: многопроцессорный Поиск с запретами
-    opt: название эвристики поиска [two_opt, three_opt, lk, lkh]
-    matrix: матрица весов
+    opt: название эвристики поиска [two_opt, three_opt, or_opt, lk_opt, lkh_opt]
+    matrix: матрица весов [np.ndarray, CondensedMatrix, DistanceProvider]
     proc: количество процессов
+    start_method: как запускать процессы [fork, spawn, forkserver], по умолчанию - как в multiprocessing;
+    матрица весов, кандидаты и альфа-матрица передаются в процессы через разделяемую память
     **kwargs: дополнительные параметры для локального поиска
     """
 
@@ -60,43 +75,55 @@ class TabuProcSearch:
         self.opt = opts_type[opt](length, tour, matrix, **kwargs)
         self.length, self.tour = self.opt.length, self.opt.tour
         self.proc = kwargs.get('proc', 4)
+        self.context = mp.get_context(kwargs.get('start_method'))
+        self.tabu = kwargs
 
-    def optimize(self, iterations=10, swap=2) -> Tuple[float, np.ndarray]:
+    def optimize(self, iterations=10, swap=2, prune=0.05) -> Tuple[float, np.ndarray]:
         """ Запуск метаэвристики табу поиска на нескольких процессах
         Алгоритм запоминает все локальные минимумы: all_solutions
         iteration: количество возможных перезапусков
         swap: сколько раз ломать тур за итерацию. Если тур не улучшится, на следующей итерации ломается он же
+        prune: допустимое отставание от лучшей длины всех процессов, см. worker
         return: лучшая длина тура, лучший тур
         """
-        processes: Dict[mp.Process, Connection] = {}
+        with SharedMemoryPool() as pool:
+            opt = self.opt.shared(pool)
+            self.__run(opt, pool, iterations, swap, prune)
+            del opt  # блоки памяти закрываются только без ссылок на них
+
+        logging.info(f'tabu search done, best length: {self.length}')
+        return self.length, self.tour
+
+    def __run(self, opt: AbcOpt, pool: SharedMemoryPool, iterations: int, swap: int, prune: float) -> None:
+        """ Запускаем процессы и ждем их сообщений, пока все не закончат
+        Новые хеши процессов раздаются через общий кольцевой буфер, лучшая длина - через общую память
+        opt: эвристика, которая передается в процессы
+        pool: разделяемая память
+        """
+        processes: Dict[Connection, mp.Process] = {}
         pid_process: Dict[int, int] = {}
         logging.info(f'start: {self.length}')
+        ring, best = HashRing(pool), pool.share(np.array([self.length]))
 
         for idx in range(self.proc):
-            m, w = mp.Pipe()
-            p = mp.Process(target=worker, args=(self.opt, w, iterations, swap))
+            m, w = self.context.Pipe()
+            p = self.context.Process(target=worker, args=(opt, w, iterations, swap, prune, ring, best))
             p.start()
-            processes[p], pid_process[p.pid] = m, idx
-
-        all_solutions = set()
-        while True:
-            for proc, conn in processes.items():
-                if conn.poll():
-                    solutions = conn.recv()
-                    if len(solutions) == 0:
-                        length, tour = conn.recv(), conn.recv()
-                        if length < self.length:
-                            self.length, self.tour = length, tour
-                        proc.join()
-                        del processes[proc]
-                        logging.info(f'Done: {pid_process[proc.pid]} - {length}')
-                        break
-                    all_solutions |= solutions
-                    conn.send(all_solutions)
-                    logging.info(f'Update: {pid_process[proc.pid]}')
-
-            if len(processes) == 0:
-                break
-
-        logging.info(f'tabu search done, best length: {self.length}')
-        return self.length, self.tour
+            processes[m], pid_process[p.pid] = p, idx
+
+        all_solutions = tabu_store(**self.tabu)
+        while len(processes) > 0:
+            for conn in wait(list(processes)):
+                proc, message = processes[conn], conn.recv()
+                if message is None:
+                    length, tour = conn.recv(), conn.recv()
+                    if tour is not None and length < self.length:
+                        self.length, self.tour = length, tour
+                    proc.join()
+                    del processes[conn]
+                    logging.info(f'Done: {pid_process[proc.pid]} - {length}')
+                    continue
+                solutions, length = message
+                ring.append(all_solutions.update(solutions))
+                best[0] = min(best[0], length)
+                logging.info(f'Update: {pid_process[proc.pid]}')
@@ -10,8 +10,8 @@ from lin_kernighan.utils import opts_type
 
 class TabuSearch(AbcSearch):
     """ Базовая метаэвристика: Поиск с запретами
-    opt: название эвристики поиска [two_opt, three_opt, lk_opt, lkh_opt]
-    matrix: матрица весов
+    opt: название эвристики поиска [two_opt, three_opt, or_opt, lk_opt, lkh_opt]
+    matrix: матрица весов [np.ndarray, CondensedMatrix, DistanceProvider]
 
     **kwargs: дополнительные параметры для локального поиска
     """
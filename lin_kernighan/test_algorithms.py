@@ -1,15 +1,35 @@
+import multiprocessing as mp
+import pickle
+
+import numpy as np
 import pytest
 
 from lin_kernighan.algorithms.lk_opt import LKOpt
 from lin_kernighan.algorithms.lkh_opt import LKHOpt
-from lin_kernighan.algorithms.structures.matrix import adjacency_matrix
+from lin_kernighan.algorithms.or_opt import OrOpt
+from lin_kernighan.algorithms.structures.active_queue import ActiveQueue
+from lin_kernighan.algorithms.structures.array_tour import ArrayTour
+from lin_kernighan.algorithms.structures.distance import distance_provider
+from lin_kernighan.algorithms.structures.matrix import adjacency_matrix, alpha_matrix, condensed_matrix, \
+    sparse_alpha_matrix
+from lin_kernighan.algorithms.structures.move_stack import MoveStack
+from lin_kernighan.algorithms.structures.one_tree import one_tree, one_tree_edges
+from lin_kernighan.algorithms.structures.tabu_list import tabu_store
+from lin_kernighan.algorithms.structures.tree_tour import TreeTour
 from lin_kernighan.algorithms.three_opt import ThreeOpt
 from lin_kernighan.algorithms.two_opt import TwoOpt
+from lin_kernighan.algorithms.utils.cache import InstanceCache, fingerprint
+from lin_kernighan.algorithms.utils.candidates import delaunay_candidates, nearest_candidates, quadrant_candidates
+from lin_kernighan.algorithms.utils.double_bridge import double_bridge_move, find_double_bridge
 from lin_kernighan.algorithms.utils.generator import generator
-from lin_kernighan.algorithms.utils.initial_tour import greedy, two_opt
-from lin_kernighan.algorithms.utils.utils import get_length
+from lin_kernighan.algorithms.utils.hash import generate_hash
+from lin_kernighan.algorithms.utils.initial_tour import greedy, two_opt, or_opt
+from lin_kernighan.algorithms.utils.k_opt import feasible_k_opt, feasible_move, k_opt_move, reversal_tables
+from lin_kernighan.algorithms.utils.shared import HashRing, SharedArray, SharedMemoryPool
+from lin_kernighan.algorithms.utils.subgradient_optimization import SubgradientOptimization
+from lin_kernighan.algorithms.utils.utils import get_length, get_set, nearest_neighbours
 from lin_kernighan.lkh_search import LKHSearch
-from lin_kernighan.tabu_proc_search import TabuProcSearch
+from lin_kernighan.tabu_proc_search import TabuProcSearch, worker
 from lin_kernighan.tabu_search import TabuSearch
 
 size = 100
@@ -38,6 +58,13 @@ def test_greedy_with_two_opt():
     assert round(get_length(tour, matrix), 2) == round(length, 2), 'generated wrong tour'
 
 
+def test_greedy_with_or_opt():
+    tsp = generator(size)
+    matrix = adjacency_matrix(tsp)
+    length, tour = or_opt(matrix)
+    assert round(get_length(tour, matrix), 2) == round(length, 2), 'generated wrong tour'
+
+
 def test_two_opt(generate_metric_tsp):
     length, tour, matrix = generate_metric_tsp
     opt = TwoOpt(length, tour, matrix)
@@ -46,6 +73,26 @@ def test_two_opt(generate_metric_tsp):
     assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
 
 
+def test_two_opt_tree(generate_metric_tsp):
+    length, tour, matrix = generate_metric_tsp
+    opt = TwoOpt(length, tour, matrix, backend='tree')
+    opt_length, opt_tour = opt.optimize()
+    assert opt_length < length, 'optimized'
+    assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
+
+
+@pytest.mark.parametrize('first', [True, False])
+def test_two_opt_neighbours(generate_metric_tsp, first):
+    length, tour, matrix = generate_metric_tsp
+    two_opt = TwoOpt(length, tour, matrix, neighbours=10, first=first, backend='tree')
+    opt_length, opt_tour = two_opt.optimize()
+    assert opt_length < length, 'optimized'
+    assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
+    assert two_opt.hash == generate_hash(opt_tour), 'wrong hash'
+    fast_length, fast_tour = TwoOpt.just_improve(length, tour, matrix, neighbours=10, first=first)
+    assert round(get_length(fast_tour, matrix), 2) == round(fast_length, 2), 'generated wrong tour'
+
+
 def test_fast_two_opt(generate_metric_tsp):
     length, tour, matrix = generate_metric_tsp
     opt_length, opt_tour = TwoOpt.just_improve(length, tour, matrix)
@@ -68,6 +115,36 @@ def test_fast_three_opt(generate_metric_tsp):
     assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
 
 
+@pytest.mark.parametrize('backend', ['array', 'tree'])
+@pytest.mark.parametrize('first', [True, False])
+def test_three_opt_neighbours(generate_metric_tsp, first, backend):
+    length, tour, matrix = generate_metric_tsp
+    three_opt = ThreeOpt(length, tour, matrix, neighbours=8, first=first, backend=backend)
+    opt_length, opt_tour = three_opt.optimize()
+    assert opt_length < length, 'optimized'
+    assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
+    assert three_opt.hash == generate_hash(opt_tour), 'wrong hash'
+    fast_length, fast_tour = ThreeOpt.just_improve(length, tour, matrix, neighbours=8, first=first)
+    assert round(get_length(fast_tour, matrix), 2) == round(fast_length, 2), 'generated wrong tour'
+
+
+@pytest.mark.parametrize('backend', ['array', 'tree'])
+def test_or_opt(generate_metric_tsp, backend):
+    length, tour, matrix = generate_metric_tsp
+    opt = OrOpt(length, tour, matrix, backend=backend)
+    opt_length, opt_tour = opt.optimize()
+    assert opt_length < length, 'optimized'
+    assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
+    assert opt.hash == generate_hash(opt_tour), 'wrong hash'
+
+
+def test_tabu_search_or_opt(generate_metric_tsp):
+    length, tour, matrix = generate_metric_tsp
+    tabu_search = TabuSearch('or_opt', matrix)
+    opt_length, opt_tour = tabu_search.optimize()
+    assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
+
+
 def test_lk_opt_simple(generate_metric_tsp):
     length, tour, matrix = generate_metric_tsp
     lk_opt = LKOpt(length, tour, matrix, dlb=False)
@@ -90,6 +167,68 @@ def test_lk_opt_full_bridge(generate_metric_tsp):
     opt_length, opt_tour = lk_opt.optimize()
     assert opt_length < length, 'optimized'
     assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
+    assert lk_opt.hash == generate_hash(opt_tour), 'wrong hash'
+
+
+def test_lk_opt_pass(generate_metric_tsp):
+    length, tour, matrix = generate_metric_tsp
+    lk_opt = LKOpt(length, tour, matrix, bridge=(0, True))
+    gain = lk_opt.improve()  # один проход до пустой очереди
+    assert gain > 0 and len(lk_opt.queue) == 0, 'not a whole pass'
+    assert round(get_length(lk_opt.tour, matrix), 2) == round(length - gain, 2), 'wrong gain'
+    assert lk_opt.hash == generate_hash(lk_opt.tour), 'wrong hash'
+
+
+def test_lk_opt_index(generate_metric_tsp):
+    length, tour, matrix = generate_metric_tsp
+    lk_opt = LKOpt(length, tour, matrix, bridge=(2, True))
+    lk_opt.optimize()
+    assert (lk_opt.tour[lk_opt.index] == np.arange(size)).all(), 'wrong index'
+
+
+def test_lk_opt_tree(generate_metric_tsp):
+    length, tour, matrix = generate_metric_tsp
+    lk_opt = LKOpt(length, tour, matrix, backend='tree')
+    opt_length, opt_tour = lk_opt.optimize()
+    assert opt_length < length, 'optimized'
+    assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
+
+
+def test_tree_tour_reverse():
+    tour = np.random.permutation(size)
+    tree = TreeTour(tour.copy())
+    for _ in range(size):
+        start, end = np.random.randint(0, size, 2)
+        nodes = list(tree.nodes())
+        x, y = nodes.index(start), nodes.index(end)
+        path = [nodes[(x + i) % size] for i in range((y - x) % size + 1)]
+        expected = nodes.copy()
+        for i, node in enumerate(reversed(path)):
+            expected[(x + i) % size] = node
+        tree.reverse(start, end)
+        nodes = tree.nodes()
+        assert {frozenset((nodes[i - 1], nodes[i])) for i in range(size)} == \
+               {frozenset((expected[i - 1], expected[i])) for i in range(size)}, 'wrong reverse'
+        assert all(tree.next(nodes[i - 1]) == nodes[i] and tree.prev(nodes[i]) == nodes[i - 1] for i in range(size))
+
+
+@pytest.mark.parametrize('backend', [ArrayTour, TreeTour])
+def test_move_stack_rollback(backend):
+    tour = np.random.permutation(size)
+    route, stack = backend(tour.copy()), MoveStack(5, generate_hash(tour))
+    edges = {frozenset((tour[i - 1], tour[i])) for i in range(size)}
+    while stack.depth < 5:
+        t1 = np.random.randint(0, size)
+        t2, t3 = route.next(t1), np.random.randint(0, size)
+        t4 = route.prev(t3)
+        if t3 != t1 and t3 != t2 and t4 != t2:
+            stack.apply(route, t1, t2, t3, t4)
+            assert stack.hash == generate_hash(route.nodes()), 'wrong hash'
+    while stack.depth > 0:
+        stack.rollback(route)
+    nodes = route.nodes()
+    assert {frozenset((nodes[i - 1], nodes[i])) for i in range(size)} == edges, 'wrong rollback'
+    assert stack.hash == generate_hash(tour) == generate_hash(tour[::-1].copy()), 'wrong hash'
 
 
 def test_lkh_opt_simple(generate_metric_tsp):
@@ -108,12 +247,253 @@ def test_lkh_opt_dlb(generate_metric_tsp):
     assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
 
 
+@pytest.mark.parametrize('backend', ['array', 'tree'])
+@pytest.mark.parametrize('move_type', [3, 4, 5])
+def test_lkh_opt_move_type(generate_metric_tsp, move_type, backend):
+    length, tour, matrix = generate_metric_tsp
+    lkh_opt = LKHOpt(length, tour, matrix, move_type=move_type, backend=backend)
+    opt_length, opt_tour = lkh_opt.optimize()
+    assert opt_length < length, 'optimized'
+    assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
+
+
 def test_lkh_opt_non_seq(generate_metric_tsp):
     length, tour, matrix = generate_metric_tsp
     lkh_opt = LKHOpt(length, tour, matrix, bridge=True, non_seq=True)
     opt_length, opt_tour = lkh_opt.optimize()
     assert opt_length < length, 'optimized'
     assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
+    assert lkh_opt.hash == generate_hash(opt_tour), 'wrong hash'
+
+
+def test_kd_tree_candidates():
+    tsp = generator(size)
+    matrix = adjacency_matrix(tsp)
+    nearest, quadrant = nearest_candidates(tsp, 8), quadrant_candidates(tsp, 8)
+    for node in range(size):
+        row = matrix[node].copy()
+        row[node] = np.inf
+        assert np.allclose(row[nearest[node]], np.sort(row)[:8]), 'wrong nearest'
+        assert len(set(quadrant[node])) == 8 and node not in quadrant[node], 'wrong quadrant'
+
+
+def test_delaunay_candidates():
+    tsp = generator(size)
+    matrix = adjacency_matrix(tsp)
+    first, second = delaunay_candidates(tsp), delaunay_candidates(tsp, second=True)
+    nearest = nearest_candidates(tsp, 1)
+    for node in range(size):
+        row = first[node][first[node] != -1]
+        assert node not in row and len(set(row)) == len(row), 'wrong delaunay'
+        assert np.all(np.diff(matrix[node][row]) >= 0), 'not sorted'
+        assert np.all(first[node][len(row):] == -1), 'wrong padding'
+        assert nearest[node][0] in row, 'nearest neighbour lost'
+        assert set(row) <= set(second[node]), 'lost first order neighbours'
+
+    angles = np.linspace(0., 2. * np.pi, size, endpoint=False)  # центр круга - сосед всех вершин
+    wheel = np.vstack(([[0., 0.]], np.column_stack((np.cos(angles), np.sin(angles)))))
+    first, second = delaunay_candidates(wheel), delaunay_candidates(wheel, second=True)
+    assert first.shape[1] == size and set(first[0]) == set(range(1, size + 1)), 'wide row is cut'
+    assert all(set(second[node][second[node] != -1]) == set(range(size + 1)) - {node}
+               for node in range(1, size + 1)), 'second order neighbours are cut'
+
+
+@pytest.mark.parametrize('candidates', ['nearest', 'quadrant', 'delaunay'])
+def test_lkh_opt_points(candidates):
+    tsp = generator(size)
+    matrix = adjacency_matrix(tsp)
+    length, tour = greedy(matrix)
+    lkh_opt = LKHOpt(length, tour, matrix, candidates=candidates, points=tsp)
+    opt_length, opt_tour = lkh_opt.optimize()
+    assert opt_length < length, 'optimized'
+    assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
+
+
+@pytest.mark.parametrize('neighbours', [0, 5])
+def test_one_tree(generate_metric_tsp, neighbours):
+    _, _, matrix = generate_metric_tsp
+    length, parent, order, degree, f_node, s_node = one_tree(matrix)
+    candidates = nearest_neighbours(matrix, neighbours) if neighbours else None
+    sparse_length, sparse_parent, sparse_order, sparse_degree, _, _ = one_tree(matrix, candidates)
+    edges = one_tree_edges(parent, f_node, s_node)
+    assert len(edges) == size and degree.sum() == 2 * size, 'not a one tree'
+    assert round(sum(matrix[x][y] for x, y in edges), 2) == round(length, 2), 'wrong length'
+    assert sorted(order) == list(range(1, size)) and sorted(sparse_order) == list(range(1, size)), 'lost nodes'
+    position = np.argsort(sparse_order)
+    assert all(position[sparse_parent[node] - 1] < position[node - 1] for node in sparse_order[1:]), 'not ordered'
+    assert sparse_length >= length - 1.e-10 and sparse_degree.sum() == 2 * size, 'wrong sparse tree'
+
+
+def test_alpha_matrix(generate_metric_tsp):
+    _, _, matrix = generate_metric_tsp
+    _, parent, order, _, f_node, s_node = one_tree(matrix)
+    alpha = alpha_matrix(matrix, parent, order, f_node, s_node, np.zeros(size))
+    edges = one_tree_edges(parent, f_node, s_node)
+    assert np.allclose(alpha, alpha.T), 'not symmetric'
+    assert np.all(alpha[1:, 1:] > -1.e-10), 'negative alpha'
+    for x, y in edges:
+        assert abs(alpha[x][y]) < 1.e-10, 'one tree edge with positive alpha'
+
+
+def test_sparse_alpha_matrix(generate_metric_tsp):
+    _, _, matrix = generate_metric_tsp
+    _, parent, order, _, f_node, s_node = one_tree(matrix)
+    alpha = alpha_matrix(matrix, parent, order, f_node, s_node, np.zeros(size))
+    sparse = sparse_alpha_matrix(matrix, parent, order, f_node, s_node, 8, np.zeros(size))
+    for i in range(size):
+        row = sparse[i]
+        best = sorted((alpha[i][j], matrix[i][j], j) for j in range(size) if j != i)[:8]
+        assert [j for _, _, j in best] == list(sparse.indices[sparse.indptr[i]:sparse.indptr[i + 1]]), 'wrong best'
+        assert all(row[j] == a for a, _, j in best) and np.isinf(row).sum() == size - 8, 'wrong row'
+
+
+def test_subgradient(generate_metric_tsp):
+    length, tour, matrix = generate_metric_tsp
+    copy = matrix.copy()
+    gradient = SubgradientOptimization.run(matrix)
+    assert np.array_equal(matrix, copy), 'matrix changed'
+    assert gradient.w_max < length, 'lower bound above tour length'
+    warm = SubgradientOptimization.run(matrix, pi=gradient.pi_max)
+    assert warm.w_max >= gradient.w_max - 1.e-6, 'warm start lost bound'
+    sparse = SubgradientOptimization.run(matrix, candidates=nearest_neighbours(matrix, 8), upper=length, gap=1.)
+    assert sparse.w_max < length and np.all(sparse.pi_max == 0), 'no early stop'
+
+
+@pytest.mark.parametrize('tree_neighbours', [0, 8])
+def test_lkh_opt_subgradient(generate_metric_tsp, tree_neighbours):
+    length, tour, matrix = generate_metric_tsp
+    lkh_opt = LKHOpt(length, tour, matrix, subgradient=True, tree_neighbours=tree_neighbours)
+    opt_length, opt_tour = lkh_opt.optimize()
+    assert opt_length < length, 'optimized'
+    assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
+
+
+def test_lkh_opt_cache(generate_metric_tsp, tmp_path):
+    length, tour, matrix = generate_metric_tsp
+    first = LKHOpt(length, tour, matrix, subgradient=True, cache=str(tmp_path))
+    second = LKHOpt(length, tour, matrix, subgradient=True, cache=str(tmp_path))
+    assert len(list(tmp_path.glob('*.npz'))) == 1, 'not cached'
+    assert np.array_equal(first.candidates, second.candidates) and np.array_equal(first.pi, second.pi), 'wrong load'
+    assert first.best_solution == second.best_solution and first.excess == second.excess, 'wrong load'
+    LKHOpt(length, tour, matrix, cache=str(tmp_path))
+    assert len(list(tmp_path.glob('*.npz'))) == 2, 'same key for other parameters'
+    opt_length, opt_tour = second.optimize()
+    assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
+
+
+def test_lkh_opt_cache_points(tmp_path):
+    points = generator(size)
+    for dtype in (np.float64, np.int32):
+        matrix = adjacency_matrix(points, dtype)
+        length, tour = greedy(matrix)
+        LKHOpt(length, tour, matrix, candidates='nearest', points=points, cache=str(tmp_path))
+    assert len(list(tmp_path.glob('*.npz'))) == 2, 'same key for other weights'
+
+
+def test_instance_cache_eviction(tmp_path):
+    cache = InstanceCache(str(tmp_path), capacity=3000)
+    for idx in range(5):
+        cache.save(fingerprint(np.arange(idx + 1)), data=np.zeros(100))
+    assert cache.load(fingerprint(np.arange(5))) is not None, 'lost newest'
+    assert cache.load(fingerprint(np.arange(1))) is None, 'not evicted'
+    assert sum(file.stat().st_size for file in tmp_path.glob('*.npz')) <= 3000, 'cache overflow'
+
+
+def test_distance_provider():
+    tsp = generator(size)
+    matrix, provider = adjacency_matrix(tsp), distance_provider(tsp)
+    assert provider.shape == matrix.shape and len(provider) == size, 'wrong shape'
+    assert all(abs(provider[i, j] - matrix[i][j]) < 1.e-10 for i in range(size) for j in range(size)), 'wrong distance'
+    points = np.array([[0., 0.], [3., 4.2], [0., 0.4]])
+    assert distance_provider(points, 'euc_2d')[0, 1] == 5. and distance_provider(points, 'ceil_2d')[0, 1] == 6.
+    assert distance_provider(points, 'att')[0, 1] == 2. and distance_provider(points, 'manhattan')[0, 1] == 7.2
+    cities = np.array([[0., 0.], [0., 1.]])  # один градус по экватору
+    assert abs(distance_provider(cities, 'haversine')[0, 1] - 111.19) < 0.01, 'wrong haversine'
+    assert distance_provider(cities, 'geo')[0, 1] == 112., 'wrong geo'
+    provider.cache(nearest_neighbours(matrix, 5))
+    assert provider.neighbours.shape[1] == 0, 'cheap distance is cached'
+    provider, neighbours = distance_provider(tsp / 100., 'haversine'), nearest_neighbours(matrix, 5)
+    provider.cache(neighbours)
+    provider.distances[:] += 1.  # метка: значение взято из таблицы
+    assert all(provider[i, j] == provider[j, i] == provider.distance(i, j) + 1.
+               for i in range(size) for j in neighbours[i]), 'cached distance is not used'
+
+
+@pytest.mark.parametrize('opt', [TwoOpt, OrOpt, LKOpt])
+def test_opt_distance_provider(opt):
+    tsp = generator(size)
+    provider = distance_provider(tsp)
+    length, tour = greedy(provider)
+    opt_length, opt_tour = opt(length, tour, provider).optimize()
+    assert opt_length < length, 'optimized'
+    assert round(get_length(opt_tour, adjacency_matrix(tsp)), 2) == round(opt_length, 2), 'generated wrong tour'
+
+
+def test_lkh_opt_distance_provider(tmp_path):
+    tsp = generator(size)
+    provider = distance_provider(tsp)
+    length, tour = greedy(provider)
+    lkh_opt = LKHOpt(length, tour, provider, sparse_alpha=8, tree_neighbours=8, subgradient=True, cache=str(tmp_path))
+    opt_length, opt_tour = lkh_opt.optimize()
+    assert opt_length < length, 'optimized'
+    assert round(get_length(opt_tour, adjacency_matrix(tsp)), 2) == round(opt_length, 2), 'generated wrong tour'
+
+
+def test_compact_matrix():
+    tsp = generator(size)
+    matrix, rounded = adjacency_matrix(tsp), adjacency_matrix(tsp, np.int32)
+    assert adjacency_matrix(tsp, np.float32).dtype == np.float32 and rounded.dtype == np.int32, 'wrong dtype'
+    assert np.all(rounded == np.floor(matrix + 0.5)), 'wrong rounding'
+    condensed = condensed_matrix(tsp)
+    assert condensed.shape == matrix.shape and len(condensed.data) == size * (size - 1) // 2, 'wrong shape'
+    assert all(condensed[i, j] == matrix[i][j] for i in range(size) for j in range(size)), 'wrong condensed'
+    assert condensed.data.dtype == np.float64, 'wrong condensed dtype'
+    assert condensed_matrix(tsp, dtype=np.float32).data.dtype == np.float32, 'wrong condensed dtype'
+    condensed = condensed_matrix(tsp, rounded=True)
+    assert condensed.data.dtype == np.int32, 'rounded condensed is not int32'
+    assert all(condensed[i, j] == rounded[i][j] for i in range(size) for j in range(size)), 'wrong condensed'
+
+
+@pytest.mark.parametrize('opt', [TwoOpt, OrOpt, LKOpt, LKHOpt])
+@pytest.mark.parametrize('storage', ['float32', 'int32', 'condensed', 'condensed_int32'])
+def test_opt_compact_matrix(opt, storage):
+    tsp = generator(size)
+    if storage.startswith('condensed'):
+        matrix = condensed_matrix(tsp, rounded=storage == 'condensed_int32')
+    else:
+        matrix = adjacency_matrix(tsp, storage)
+    length, tour = greedy(matrix)
+    opt_length, opt_tour = opt(length, tour, matrix, compact=True).optimize()
+    assert opt_length < length, 'optimized'
+    assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
+
+
+def test_lkh_opt_tree(generate_metric_tsp):
+    length, tour, matrix = generate_metric_tsp
+    lkh_opt = LKHOpt(length, tour, matrix, backend='tree')
+    opt_length, opt_tour = lkh_opt.optimize()
+    assert opt_length < length, 'optimized'
+    assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
+
+
+@pytest.mark.parametrize('policy', ['fifo', 'lru', 'bloom'])
+def test_tabu_store(policy):
+    store = tabu_store(tabu_capacity=size, tabu_policy=policy, tabu_fp=1.e-3)
+    items = np.random.randint(-2 ** 62, 2 ** 62, 10 * size)
+    for item in items:
+        store.add(item)
+        assert store.contains(item), 'lost new item'
+    assert store.count <= size, 'store overflow'
+    assert store.inserts - store.evicts == store.count, 'wrong counters'
+    assert policy == 'bloom' or set(store.items()) <= set(items), 'wrong items'
+
+
+def test_tabu_search_bounded(generate_metric_tsp):
+    length, tour, matrix = generate_metric_tsp
+    tabu = TabuSearch('lk_opt', matrix, tabu_capacity=10, tabu_policy='lru')
+    opt_length, opt_tour = tabu.optimize()
+    assert opt_length < length, 'optimized'
+    assert tabu.data.data.count <= 10, 'store overflow'
 
 
 def test_tabu_search_two_opt(generate_metric_tsp):
@@ -164,6 +544,14 @@ def test_lkh_search_fast_helsgaun(generate_metric_tsp):
     assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
 
 
+def test_lkh_search_sparse_alpha(generate_metric_tsp):
+    length, tour, matrix = generate_metric_tsp
+    lkh_search = LKHSearch(matrix, init='fast_helsgaun', sparse_alpha=10)
+    opt_length, opt_tour = lkh_search.optimize()
+    assert opt_length < length, 'optimized'
+    assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
+
+
 def test_lkh_search_two_opt(generate_metric_tsp):
     length, tour, matrix = generate_metric_tsp
     lkh_search = LKHSearch(matrix, init='two_opt')
@@ -202,3 +590,164 @@ def test_tabu_proc_search(generate_metric_tsp):
     opt_length, opt_tour = lkh_search.optimize()
     assert opt_length < length, 'optimized'
     assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
+
+
+@pytest.mark.parametrize('start_method', ['fork', 'spawn'])
+def test_tabu_proc_search_shared(generate_metric_tsp, start_method):
+    length, tour, matrix = generate_metric_tsp
+    search = TabuProcSearch('lk_opt', matrix, proc=2, start_method=start_method)
+    opt_length, opt_tour = search.optimize(iterations=3)
+    assert opt_length < length, 'optimized'
+    assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
+    assert not isinstance(search.opt.matrix, SharedArray), 'shared memory leaked into search'
+
+
+def test_tabu_proc_search_prune(generate_metric_tsp):
+    length, tour, matrix = generate_metric_tsp
+    opt, (m, w) = LKOpt(length, tour, matrix), mp.Pipe()
+    with SharedMemoryPool() as pool:  # лучшая длина 0: каждый перезапуск идет от лучшего тура процесса
+        worker(opt, w, 3, 2, 0., HashRing(pool), np.array([0.]))
+    messages = []
+    while (message := m.recv()) is not None:
+        messages.append(message)
+    assert m.recv() == messages[-1][1] < length, 'optimized'
+    assert m.recv() is None, 'tour is sent only by the best process'
+
+
+def test_shared_array_pickle():
+    array = np.arange(12.).reshape(3, 4)
+    with SharedMemoryPool() as pool:
+        shared = pool.share(array)
+        data = pickle.dumps(shared)
+        assert len(data) < array.nbytes, 'data copied'
+        restored = pickle.loads(data)
+        assert np.all(restored == array), 'wrong data'
+        shared[0, 0] = -1.
+        assert restored[0, 0] == -1., 'not shared'
+        assert len(pickle.dumps(shared[1:])) > len(data), 'slice pickled by name'
+        del shared, restored
+
+
+def test_hash_ring():
+    with SharedMemoryPool() as pool:
+        ring = HashRing(pool, capacity=4)
+        ring.append(np.array([1, 2, 3]))
+        hashes, cursor = ring.read(0)
+        assert list(hashes) == [1, 2, 3] and cursor == 3, 'wrong read'
+        ring.append(np.array([4, 5, 6]))
+        assert list(ring.read(cursor)[0]) == [4, 5, 6], 'wrong delta'
+        assert list(ring.read(0)[0]) == [3, 4, 5, 6], 'lagging reader must get the last capacity hashes'
+        del ring
+
+
+@pytest.mark.parametrize('policy', ['fifo', 'lru', 'bloom'])
+def test_tabu_store_delta(policy):
+    store = tabu_store(tabu_capacity=8, tabu_policy=policy)
+    store.update(np.array([1, 2, 3]))
+    inserts = store.inserts
+    assert list(store.update(np.array([3, 4, 5]))) == [4, 5], 'wrong fresh hashes'
+    assert list(store.since(inserts)) == [4, 5], 'wrong delta'
+    store.update(np.arange(10, 16))
+    assert all(store.contains(h) or policy == 'bloom' for h in (4, 10)), 'lost hashes'  # второй шанс для lru
+    inserts = store.inserts
+    store.update(np.arange(20, 23))  # вытеснение переставляет очередь lru
+    assert list(store.since(inserts)) == [20, 21, 22], 'wrong delta after eviction'
+
+
+@pytest.mark.parametrize('init', ['two_opt', 'helsgaun'])
+def test_lkh_search_parallel(generate_metric_tsp, init):
+    length, tour, matrix = generate_metric_tsp
+    lkh_search = LKHSearch(matrix, init=init, proc=2)
+    opt_length, opt_tour = lkh_search.optimize(iterations=4)
+    assert opt_length < length, 'optimized'
+    assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
+
+
+def test_lkh_opt_pickle(generate_metric_tsp):
+    length, tour, matrix = generate_metric_tsp
+    lkh_opt = LKHOpt(length, tour, matrix)
+    restored = pickle.loads(pickle.dumps(lkh_opt))
+    assert restored.best_solution == lkh_opt.best_solution, 'lost best edges'
+    opt_length, opt_tour = restored.optimize()
+    assert opt_length < length, 'optimized'
+    assert round(get_length(opt_tour, matrix), 2) == round(opt_length, 2), 'generated wrong tour'
+
+
+def test_active_queue():
+    queue = ActiveQueue(5)
+    queue.fill(np.array([3, 1, 3, 4]))
+    assert len(queue) == 3, 'duplicates in queue'
+    assert queue.pop() == 3, 'not fifo'
+    queue.push(0)
+    queue.push(3)
+    assert [queue.pop() for _ in range(len(queue))] == [1, 4, 0, 3], 'not fifo'
+    queue.fill(np.arange(5))
+    queue.clear()
+    assert len(queue) == 0, 'not cleared'
+
+
+@pytest.mark.parametrize('backend', [ArrayTour, TreeTour])
+def test_double_bridge_move(backend):
+    matrix = adjacency_matrix(generator(30))
+    tour = np.random.permutation(30)
+    length, index, full = get_length(tour, matrix), np.argsort(tour), np.zeros((2, 2), dtype=np.int64)
+
+    best = 0.
+    for x in range(30):  # полный перебор O(n^4)
+        for y in range(x + 1, 30):
+            for z in range(y + 1, 30):
+                for w in range(z + 1, 30):
+                    t = [tour[i % 30] for i in (x, x + 1, y, y + 1, z, z + 1, w, w + 1)]
+                    old = matrix[t[0], t[1]] + matrix[t[2], t[3]] + matrix[t[4], t[5]] + matrix[t[6], t[7]]
+                    new = matrix[t[0], t[5]] + matrix[t[1], t[4]] + matrix[t[2], t[7]] + matrix[t[3], t[6]]
+                    best = max(best, old - new)
+
+    gain, exchange = find_double_bridge(tour, index, matrix, full, False)
+    assert gain > 0 and round(gain, 6) == round(best, 6), 'not the best double bridge'
+    x, y, z, w = exchange
+    new_tour = np.concatenate((tour[:x + 1], tour[z + 1:w + 1], tour[y + 1:z + 1], tour[x + 1:y + 1], tour[w + 1:]))
+    route = backend(tour.copy())
+    nodes = double_bridge_move(route, tour, exchange)
+    assert get_set(route.nodes()) == get_set(new_tour), 'wrong move'
+    assert round(get_length(route.nodes(), matrix), 2) == round(length - gain, 2), 'wrong gain'
+    assert len(set(nodes)) <= 8, 'wrong endpoints'
+
+
+def test_feasible_k_opt():
+    tour = np.array([0, 1, 2, 3, 4, 5, 6, 7])
+    index = np.argsort(tour)
+    removed = np.array([[1, 2], [3, 4], [5, 6], [7, 0]])
+
+    added = np.array([[1, 6], [7, 4], [5, 2], [3, 0]])  # двойной мост
+    is_tour, cuts, order = feasible_k_opt(index, removed, added)
+    assert is_tour, 'double bridge is a tour'
+    assert list(cuts) == [1, 3, 5, 7] and list(order) == [0, 6, 4, 2], 'wrong segment order'
+
+    added = np.array([[1, 4], [3, 2], [5, 0], [7, 6]])  # два цикла
+    assert not feasible_k_opt(index, removed, added)[0], 'two cycles'
+    assert not feasible_k_opt(index, np.array([[1, 2], [2, 1]]), np.array([[1, 2], [2, 1]]))[0], 'same edge twice'
+    assert not feasible_k_opt(index, np.array([[1, 3], [5, 6]]), np.array([[1, 5], [3, 6]]))[0], 'not a tour edge'
+
+
+@pytest.mark.parametrize('backend', [ArrayTour, TreeTour])
+def test_k_opt_move(backend):
+    tour, reversals = np.random.permutation(size), reversal_tables(5)
+    for _ in range(100):
+        k = np.random.randint(2, 6)
+        cut = np.random.choice(size, k, replace=False)
+        removed = np.array([[tour[i], tour[(i + 1) % size]] for i in cut])
+        added = np.random.permutation(removed.ravel()).reshape(k, 2)
+
+        route, stack = backend(tour.copy()), MoveStack(5, generate_hash(tour))
+        is_tour, ends, order = feasible_move(route, removed, added)
+        assert is_tour == feasible_k_opt(np.argsort(tour), removed, added)[0], 'different checks'
+        if not is_tour:
+            continue
+        k_opt_move(route, ends, order, stack, reversals)
+        nodes = route.nodes()
+        edges = {frozenset((nodes[i - 1], nodes[i])) for i in range(size)}
+        assert all(frozenset(edge) in edges for edge in added), 'added edges are missing'
+        kept = {frozenset(edge) for edge in removed} & {frozenset(edge) for edge in added}
+        assert all(frozenset(edge) not in edges - kept for edge in removed), 'removed edges are kept'
+        assert stack.hash == generate_hash(nodes), 'wrong hash'
+        tour = nodes.copy()
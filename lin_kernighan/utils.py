@@ -9,6 +9,7 @@ from wget import download
 
 from lin_kernighan.algorithms.lk_opt import LKOpt
 from lin_kernighan.algorithms.lkh_opt import LKHOpt
+from lin_kernighan.algorithms.or_opt import OrOpt
 from lin_kernighan.algorithms.three_opt import ThreeOpt
 from lin_kernighan.algorithms.two_opt import TwoOpt
 from lin_kernighan.algorithms.utils.abc_opt import AbcOpt
@@ -16,7 +17,9 @@ from lin_kernighan.algorithms.utils.abc_opt import AbcOpt
 Edge = Tuple[int, int]
 Point = Tuple[float, float]
 
-opts_type: Dict[str, Type[AbcOpt]] = dict(two_opt=TwoOpt, three_opt=ThreeOpt, lk_opt=LKOpt, lkh_opt=LKHOpt)
+opts_type: Dict[str, Type[AbcOpt]] = dict(
+    two_opt=TwoOpt, three_opt=ThreeOpt, or_opt=OrOpt, lk_opt=LKOpt, lkh_opt=LKHOpt
+)
 
 
 def print_matrix(matrix: np.ndarray):
@@ -2,12 +2,14 @@ import faulthandler
 import logging
 from time import time
 
+from lin_kernighan.algorithms.structures.distance import distance_provider
 from lin_kernighan.algorithms.structures.matrix import adjacency_matrix
 from lin_kernighan.algorithms.utils.generator import generator
 from lin_kernighan.lkh_search import LKHSearch
 
 if __name__ == '__main__':
     size = 500
+    provider = None  # метрика для расстояний на лету по координатам вместо матрицы, например 'euclidean'
     logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO)
 
     faulthandler.enable()
@@ -16,7 +18,7 @@ if __name__ == '__main__':
     t_start = time()
     for _ in range(num):
         tsp = generator(size)
-        matrix = adjacency_matrix(tsp)
+        matrix = distance_provider(tsp, provider) if provider else adjacency_matrix(tsp)
 
         t_start = time()
         opt = LKHSearch(matrix)